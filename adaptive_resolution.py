@@ -0,0 +1,76 @@
+# ------------------------------------
+# ไฟล์: adaptive_resolution.py
+# ------------------------------------
+"""
+ปรับ imgsz ของโมเดลตามเวลาที่วัดได้จริง ให้อยู่ใน latency budget ของแต่ละเฟรม
+
+- imgsz เลือกจากบันได (ladder) ที่กำหนด เช่น 320 / 416 / 512 / 640
+- ใช้ค่าเฉลี่ยเคลื่อนที่ (EMA) ของเวลา inference ไม่ตัดสินจากเฟรมเดียว
+- hysteresis: ลดขนาดเมื่อ EMA เกิน target, เพิ่มขนาดเมื่อคาดว่าขั้นถัดไปยังต่ำกว่า target * up_margin
+  และหลังเปลี่ยนขนาดต้องเก็บตัวอย่างใหม่อย่างน้อย min_samples เฟรมก่อนเปลี่ยนอีก (ไม่สลับไปมา)
+
+เครื่องช้าจะลดขนาดลงจนได้ real-time ส่วนเครื่องแรงจะคงความละเอียดเต็ม
+"""
+
+
+class AdaptiveResolution:
+    """
+    ladder: ขนาดภาพที่เลือกได้ (เรียงจากเล็กไปใหญ่)
+    target_ms: เวลา inference ที่ยอมรับได้ต่อเฟรม
+    """
+
+    def __init__(self, ladder=(320, 416, 512, 640), target_ms=100.0, ema_alpha=0.2,
+                 up_margin=0.8, min_samples=15, start=None):
+        self.ladder = tuple(sorted(int(v) for v in ladder))
+        if not self.ladder:
+            raise ValueError("ladder ต้องมีอย่างน้อยหนึ่งขนาด")
+        self.target_ms = float(target_ms)
+        self.ema_alpha = float(ema_alpha)
+        self.up_margin = float(up_margin)
+        self.min_samples = max(1, int(min_samples))
+        start = self.ladder[-1] if start is None else int(start)
+        self._index = self.ladder.index(start) if start in self.ladder else len(self.ladder) - 1
+        self.ema_ms = None
+        self._samples = 0
+        self.switches = 0
+
+    @property
+    def imgsz(self):
+        return self.ladder[self._index]
+
+    def observe(self, seconds):
+        """
+        บันทึกเวลา inference ของเฟรมล่าสุด (วินาที) ที่ขนาด self.imgsz
+        คืนค่า imgsz ใหม่ถ้ามีการเปลี่ยนขนาด ไม่งั้นคืน None
+        """
+        ms = seconds * 1000.0
+        self.ema_ms = ms if self.ema_ms is None else self.ema_ms + self.ema_alpha * (ms - self.ema_ms)
+        self._samples += 1
+        if self._samples < self.min_samples:
+            return None
+
+        if self.ema_ms > self.target_ms and self._index > 0:
+            return self._step(-1)
+        if self._index < len(self.ladder) - 1:
+            # เวลา inference โดยประมาณแปรผันตามจำนวน pixel (imgsz^2)
+            scale = (self.ladder[self._index + 1] / self.imgsz) ** 2
+            if self.ema_ms * scale < self.target_ms * self.up_margin:
+                return self._step(+1)
+        return None
+
+    def _step(self, direction):
+        previous = self.imgsz
+        self._index += direction
+        # คาดเวลาที่ขนาดใหม่ไว้ก่อน แล้วเก็บตัวอย่างใหม่ก่อนตัดสินใจรอบถัดไป
+        self.ema_ms *= (self.imgsz / previous) ** 2
+        self._samples = 0
+        self.switches += 1
+        return self.imgsz
+
+    def stats(self):
+        return {
+            "imgsz": self.imgsz,
+            "ema_ms": self.ema_ms if self.ema_ms is not None else 0.0,
+            "target_ms": self.target_ms,
+            "switches": self.switches,
+        }
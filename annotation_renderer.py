@@ -0,0 +1,240 @@
+# ------------------------------------
+# ไฟล์: annotation_renderer.py
+# ------------------------------------
+"""
+วาดกรอบและ label ลงบนภาพโดยตรง (in place) แทน results[0].plot()
+
+- วาดบนภาพตามลำดับ channel เดิมของภาพ (RGB จาก Gradio หรือ BGR จาก OpenCV) ไม่ต้องแปลงสีไปกลับ
+- สีของแต่ละคลาสคำนวณไว้ล่วงหน้าจาก palette เดียวกับ ultralytics
+- ภาพของ label (พื้นหลัง + ตัวอักษร) ถูก render ครั้งเดียวแล้ว cache ไว้ แต่ละเฟรมแค่ copy patch เล็กๆ
+- ขนาดเส้น/ตัวอักษร/ตำแหน่ง label เหมือน ultralytics Annotator ภาพที่ได้จึงหน้าตาเหมือนเดิม
+
+Benchmark เทียบกับ pipeline เดิม (flip + cvtColor + plot() + cvtColor):
+    python annotation_renderer.py --bench
+"""
+import argparse
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+# palette ของ ultralytics (ultralytics.utils.plotting.Colors) ในรูป hex RGB
+PALETTE_HEX = (
+    "042AFF", "0BDBEB", "F3F3F3", "00DFB7", "111F68", "FF6FDD", "FF444F", "CCED00", "00F344", "BD00FF",
+    "00B4FF", "DD00BA", "00FFFF", "26C000", "01FFB3", "7D24FF", "7B0068", "FF1B6C", "FC6D2F", "A2FF0B",
+)
+
+# สีพื้นหลัง (BGR) ที่ ultralytics ใช้ตัวอักษรสีเข้ม/สีขาว (Annotator.dark_colors / light_colors)
+_DARK_BG_BGR = {
+    (235, 219, 11), (243, 243, 243), (183, 223, 0), (221, 111, 255), (0, 237, 204),
+    (68, 243, 0), (255, 255, 0), (179, 255, 1), (11, 255, 162),
+}
+_DARK_TEXT_BGR = (104, 31, 17)
+_DEFAULT_TEXT_BGR = (255, 255, 255)
+
+
+def _hex_to_bgr(code):
+    return int(code[4:6], 16), int(code[2:4], 16), int(code[0:2], 16)
+
+
+class AnnotationRenderer:
+    """
+    วาดผลตรวจจับลงบนภาพแบบไม่สร้างภาพใหม่
+
+    names: dict {class_id: class_name} (เช่น model.names)
+    rgb: True ถ้าภาพที่จะวาดเป็น RGB (Gradio), False ถ้าเป็น BGR (OpenCV)
+    """
+
+    def __init__(self, names, rgb=True, max_glyphs=1024):
+        self.names = dict(names)
+        self.rgb = rgb
+        self.max_glyphs = max_glyphs
+        palette_bgr = [_hex_to_bgr(code) for code in PALETTE_HEX]
+        self._class_colors = {}
+        for class_id in self.names:
+            bgr = palette_bgr[int(class_id) % len(palette_bgr)]
+            text_bgr = _DARK_TEXT_BGR if bgr in _DARK_BG_BGR else _DEFAULT_TEXT_BGR
+            if rgb:
+                self._class_colors[class_id] = (bgr[::-1], text_bgr[::-1])
+            else:
+                self._class_colors[class_id] = (bgr, text_bgr)
+        self._glyphs = OrderedDict()
+        self._style_cache = {}
+        self.glyph_hits = 0
+        self.glyph_misses = 0
+
+    def _style(self, shape):
+        """ขนาดเส้น/ตัวอักษรตามขนาดภาพ (สูตรเดียวกับ ultralytics Annotator)"""
+        style = self._style_cache.get(shape)
+        if style is None:
+            lw = max(round(sum(shape) / 2 * 0.003), 2)
+            style = (lw, lw / 3, max(lw - 1, 1))
+            self._style_cache[shape] = style
+        return style
+
+    def _glyph(self, label, class_id, style, outside):
+        """
+        คืน (patch, mask, w, h) ของ label ที่ render ไว้แล้ว
+        patch ครอบทั้งพื้นหลังของ label และส่วนของตัวอักษรที่ล้นออกนอกพื้นหลัง (เช่นหางตัวอักษร)
+        """
+        key = (label, class_id, style, outside)
+        glyph = self._glyphs.get(key)
+        if glyph is not None:
+            self._glyphs.move_to_end(key)
+            self.glyph_hits += 1
+            return glyph
+
+        self.glyph_misses += 1
+        _, sf, tf = style
+        color, text_color = self._class_colors.get(class_id, ((128, 128, 128), _DEFAULT_TEXT_BGR))
+        (w, h), baseline = cv2.getTextSize(label, 0, fontScale=sf, thickness=tf)
+        h += 3  # เว้นขอบเหมือน ultralytics
+        pad = baseline + tf
+        patch = np.zeros((h + 1 + pad, w + 1 + pad, 3), dtype=np.uint8)
+        mask = np.zeros(patch.shape[:2], dtype=np.uint8)
+        # พื้นหลัง label อยู่มุมซ้ายบนของ patch, ตัวอักษรวาดตำแหน่งเดียวกับ ultralytics
+        cv2.rectangle(patch, (0, 0), (w, h), color, -1, cv2.LINE_AA)
+        cv2.rectangle(mask, (0, 0), (w, h), 255, -1)
+        origin = (0, h - 2 if outside else h - 1)
+        cv2.putText(patch, label, origin, 0, sf, text_color, thickness=tf, lineType=cv2.LINE_AA)
+        cv2.putText(mask, label, origin, 0, sf, 255, thickness=tf, lineType=cv2.LINE_AA)
+        glyph = (patch, mask.astype(bool), w, h)
+
+        self._glyphs[key] = glyph
+        if len(self._glyphs) > self.max_glyphs:
+            self._glyphs.popitem(last=False)
+        return glyph
+
+    def _blit(self, image, glyph, x, y):
+        patch, mask, _, _ = glyph
+        img_h, img_w = image.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + patch.shape[1], img_w), min(y + patch.shape[0], img_h)
+        if x1 <= x0 or y1 <= y0:
+            return
+        px0, py0 = x0 - x, y0 - y
+        px1, py1 = px0 + (x1 - x0), py0 + (y1 - y0)
+        np.copyto(image[y0:y1, x0:x1], patch[py0:py1, px0:px1], where=mask[py0:py1, px0:px1, None])
+
+    def draw(self, image, xyxy, conf, cls, track_ids=None):
+        """
+        วาดกรอบ + label ลงบน image โดยตรง คืน image เดิม
+        ลำดับการวาดเหมือน ultralytics (กล่อง conf สูงสุดอยู่บนสุด)
+        """
+        style = self._style(image.shape)
+        lw = style[0]
+        img_w = image.shape[1]
+        for i in reversed(range(len(xyxy))):
+            class_id = int(cls[i])
+            color = self._class_colors.get(class_id, ((128, 128, 128), None))[0]
+            x1, y1, x2, y2 = (int(v) for v in xyxy[i][:4])
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness=lw, lineType=cv2.LINE_AA)
+
+            name = self.names.get(class_id, str(class_id))
+            if track_ids is not None:
+                name = f"id:{int(track_ids[i])} {name}"
+            label = f"{name} {float(conf[i]):.2f}"
+            glyph = self._glyph(label, class_id, style, True)
+            glyph_w, glyph_h = glyph[2:]
+            outside = y1 >= glyph_h
+            if not outside:
+                glyph = self._glyph(label, class_id, style, False)
+            px = img_w - glyph_w if x1 > img_w - glyph_w else x1
+            py = y1 - glyph_h if outside else y1
+            self._blit(image, glyph, px, py)
+        return image
+
+    def draw_result(self, image, result):
+        """วาด ultralytics Results ลงบน image (รองรับ track ID จาก tracker.py)"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return image
+        data = boxes.data
+        data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+        track_ids = data[:, 4] if boxes.is_track else None
+        return self.draw(image, data[:, :4], data[:, -2], data[:, -1], track_ids)
+
+
+def _synthetic_frame(height, width, n_boxes, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    x1 = rng.uniform(0, width * 0.7, n_boxes)
+    y1 = rng.uniform(0, height * 0.7, n_boxes)
+    bw = rng.uniform(40, width * 0.3, n_boxes)
+    bh = rng.uniform(40, height * 0.3, n_boxes)
+    data = np.stack(
+        [x1, y1, x1 + bw, y1 + bh, rng.uniform(0.25, 1.0, n_boxes), rng.integers(0, 22, n_boxes)],
+        axis=1,
+    ).astype(np.float32)
+    return frame, data[np.argsort(-data[:, 4])]
+
+
+def benchmark(height=720, width=1280, n_boxes=5, iterations=200):
+    """
+    เทียบเวลาและหน่วยความจำที่จองต่อเฟรม ระหว่าง pipeline เดิมกับ renderer นี้ (ไม่รวมเวลาโมเดล)
+    frame_buffers_peak = peak ของหน่วยความจำที่ numpy/cv2 จองระหว่างหนึ่งเฟรม (วัดด้วย tracemalloc)
+    หารด้วยขนาดภาพหนึ่งเฟรม
+    """
+    from ultralytics.engine.results import Results
+
+    from voice_guidance import CLASS_NAME_MAP
+
+    frame, data = _synthetic_frame(height, width, n_boxes)
+    renderer = AnnotationRenderer(CLASS_NAME_MAP, rgb=True)
+
+    def legacy():
+        flipped = cv2.flip(frame, 1)                                   # copy 1
+        frame_bgr = cv2.cvtColor(flipped, cv2.COLOR_RGB2BGR)           # copy 2
+        result = Results(frame_bgr, path="", names=CLASS_NAME_MAP, boxes=data)
+        annotated_bgr = result.plot()                                  # copy 3 (deepcopy ภายใน plot)
+        return cv2.cvtColor(annotated_bgr, cv2.COLOR_BGR2RGB)          # copy 4
+
+    def fast():
+        display = cv2.flip(frame, 1)                                   # copy 1 (ภาพแสดงผล RGB)
+        frame_bgr = np.ascontiguousarray(frame[:, ::-1, ::-1])         # copy 2 (พลิก+BGR สำหรับโมเดล)
+        del frame_bgr
+        return renderer.draw(display, data[:, :4], data[:, 4], data[:, 5])
+
+    report = {}
+    for name, fn in (("legacy", legacy), ("renderer", fast)):
+        for _ in range(10):
+            fn()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = (time.perf_counter() - start) * 1000.0 / iterations
+
+        # วัดแยกจากรอบจับเวลา (tracemalloc ทำให้ช้าลง)
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+        buffers = peak / frame.nbytes
+        report[name] = {"frame_buffers_peak": round(buffers, 2), "peak_mb": peak / (1024 * 1024), "ms_per_frame": elapsed}
+        print(f"{name:9s}: peak {buffers:.2f} frame buffers ({peak / (1024 * 1024):.1f} MB), {elapsed:.2f} ms/frame")
+    speedup = report["legacy"]["ms_per_frame"] / max(report["renderer"]["ms_per_frame"], 1e-9)
+    print(f"speedup  : x{speedup:.2f} (glyph cache hits={renderer.glyph_hits}, misses={renderer.glyph_misses})")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Copy-free annotation renderer")
+    parser.add_argument("--bench", action="store_true", help="Benchmark against results[0].plot()")
+    parser.add_argument("--height", type=int, default=720, help="Benchmark frame height")
+    parser.add_argument("--width", type=int, default=1280, help="Benchmark frame width")
+    parser.add_argument("--boxes", type=int, default=5, help="Number of boxes per frame")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed iterations per path")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    cli_args = parse_args()
+    if cli_args.bench:
+        benchmark(cli_args.height, cli_args.width, cli_args.boxes, cli_args.iterations)
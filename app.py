@@ -1,12 +1,16 @@
 # ------------------------------------
 # ไฟล์: app.py
 # ------------------------------------
-import gradio as gr
-import cv2
-from ultralytics import YOLO
-from voice_guidance import speak_guidance, CLASS_NAME_MAP  # Import ฟังก์ชันพูดและ class names
-import threading
+# การ import app ใช้แค่ standard library: cv2 / numpy / โมดูลของแอป import ใน init_runtime()
+# ultralytics/torch ตอน ensure_model() และ gradio ตอน build_interface()
+# object ของแอป (image saver, motion gate, tracker, pipeline, reloader) ถูกสร้างใน init_runtime()
+# และ worker ถูกเริ่มตอนเรียก start_services() ไม่ใช่ตอน import
 import time
+_IMPORT_STARTED = time.perf_counter()
+
+import threading
+from contextlib import contextmanager
+
 import os
 from datetime import datetime
 from pathlib import Path
@@ -15,185 +19,563 @@ from pathlib import Path
 # (สำคัญ!) แก้ไข Path นี้ให้ตรงกับไฟล์ best.pt ที่คุณเทรนได้
 # -------------------------------------------------------------------
 MODEL_PATH = 'artifacts/models/waste-sorter-best.pt' # ใช้โมเดลที่ promote แล้วจาก DVC pipeline
+# runtime (pytorch / onnx / openvino / torchscript) เลือกได้จาก inference.backend ใน params.yaml
 # -------------------------------------------------------------------
 
-# 1. โหลดโมเดล AI ที่เทรนเสร็จแล้ว
-try:
-    print(f"กำลังโหลดโมเดลจาก: {MODEL_PATH}")
-    model = YOLO(MODEL_PATH)
-    print("โหลดโมเดลสำเร็จ")
-except Exception as e:
-    print(f"เกิดข้อผิดพลาดในการโหลดโมเดล: {e}")
-    print("กรุณาตรวจสอบว่า Path ของโมเดลถูกต้องหรือไม่")
-    exit()
+# 1. โมเดล AI ที่เทรนเสร็จแล้ว (โหลดครั้งแรกที่เรียก ensure_model())
+model = None
+_model_lock = threading.Lock()
+
+# พารามิเตอร์ที่ใช้เรียกโมเดลทุกเฟรม (ใช้ร่วมกับ inference_server.py)
+INFERENCE_KWARGS = dict(conf=0.25, imgsz=640, verbose=False, max_det=300)
 
 # การตั้งค่าเพิ่มเติมสำหรับระบบเสียง
 SPEECH_CONF_THRESHOLD = 0.4          # conf ขั้นต่ำที่จะพิจารณาพูด (ลดเพื่อให้พูดง่ายขึ้น)
 SUSTAINED_FRAME_THRESHOLD = 2        # จำนวนเฟรมต่อเนื่องก่อนพูด (ลดความเข้มงวด)
-ANNOUNCE_COOLDOWN_SECONDS = 6        # เวลาระหว่างการพูดซ้ำคลาสเดิม
+ANNOUNCE_COOLDOWN_SECONDS = 6        # เวลาระหว่างการพูดซ้ำคลาสเดิม (นโยบาย debounce เดียวของระบบเสียง)
 
 # การตั้งค่าสำหรับบันทึกภาพ
 SAVE_IMAGES = True                   # เปิด/ปิดการบันทึกภาพ
 SAVE_CONF_THRESHOLD = 0.5            # conf ขั้นต่ำที่จะบันทึกภาพ
 SAVE_COOLDOWN_SECONDS = 3            # เวลาระหว่างการบันทึกภาพซ้ำ (วินาที)
 SAVE_DIR = "detected_waste"          # โฟลเดอร์สำหรับเก็บภาพ
+SAVE_QUEUE_SIZE = 16                 # จำนวนภาพที่รอเขียนได้สูงสุด (บันทึกใน background thread)
+SAVE_DROP_POLICY = "drop_oldest"     # เมื่อ queue เต็ม: drop_new / drop_oldest / block
+SAVE_JPEG_QUALITY = 85               # คุณภาพ JPEG (0-100)
+SAVE_MAX_SIDE = 0                    # ย่อด้านยาวสุดของภาพก่อนบันทึก (0 = ขนาดเดิม)
+
+# การตั้งค่าโหมด pipeline (แยก inference ออกจาก callback ของ Gradio)
+PIPELINE_MODE = False                # True = ใช้ worker แยก + ทิ้งเฟรมเก่า (latest-frame-wins)
+PIPELINE_STATS_EVERY = 100           # พิมพ์สถิติ pipeline ทุกๆ N เฟรมที่รับเข้า
+
+# การตั้งค่า motion gating (ข้ามโมเดลเมื่อฉากไม่เปลี่ยน แล้วใช้ผลตรวจจับเดิม)
+MOTION_GATING = False                # เปิด/ปิดการข้าม inference บนเฟรมนิ่ง
+MOTION_PIXEL_THRESHOLD = 18          # ค่าต่างของ pixel (0-255) ที่นับว่าเปลี่ยน
+MOTION_CHANGED_RATIO = 0.01          # สัดส่วน pixel ที่เปลี่ยนขั้นต่ำก่อนรันโมเดลใหม่
+MOTION_MAX_SKIP_FRAMES = 30          # บังคับรันโมเดลอย่างน้อยทุกๆ N เฟรม
+MOTION_STATS_EVERY = 300             # พิมพ์ skip ratio ทุกๆ N เฟรม
+
+# การตั้งค่าโหมด tracking (รันโมเดลทุก N เฟรม แล้วใช้ tracker ลากกล่องระหว่างนั้น)
+TRACKING_MODE = False                # True = พูด/บันทึกภาพตามอายุของ track แทน streak ของเฟรม
+DETECT_EVERY_N_FRAMES = 5            # รันโมเดลทุกๆ N เฟรม
+DETECT_WHEN_EMPTY = True             # รันโมเดลทุกเฟรมเมื่อยังไม่มี track (ของใหม่ถูกเจอเร็วขึ้น)
+TRACK_IOU_THRESHOLD = 0.3            # IoU ขั้นต่ำในการจับคู่ detection กับ track
+TRACK_MIN_HITS = 2                   # จำนวนครั้งที่จับคู่ได้ก่อนถือว่า track ยืนยันแล้ว
+TRACK_MAX_MISSES = 2                 # จำนวนรอบ detection ที่หาไม่เจอก่อนลบ track
+TRACK_ANNOUNCE_AFTER_SECONDS = 0.3   # อายุ track ขั้นต่ำก่อนประกาศเสียง (แทน SUSTAINED_FRAME_THRESHOLD)
+
+# การตั้งค่าโหมดปรับความละเอียดอัตโนมัติ (ลด/เพิ่ม imgsz ให้เวลา inference อยู่ใน budget)
+ADAPTIVE_RESOLUTION = False          # True = เลือก imgsz จาก IMGSZ_LADDER ตามเวลาที่วัดได้จริง
+TARGET_INFER_MS = 100                # เวลา inference ที่ต้องการต่อเฟรม (มิลลิวินาที)
+IMGSZ_LADDER = (320, 416, 512, 640)  # ขนาดที่เลือกได้ (เริ่มจากขนาดใหญ่สุด)
+ADAPTIVE_MIN_SAMPLES = 15            # จำนวนเฟรมที่ต้องวัดหลังเปลี่ยนขนาดก่อนเปลี่ยนอีกครั้ง
+
+# การตั้งค่าตอนเริ่มโปรแกรม
+WARMUP_RUNS = 2                      # จำนวนรอบ inference บนภาพเปล่าก่อนเปิดหน้าเว็บ (0 = ไม่ warm-up)
+WARMUP_SHAPE = (480, 640)            # ขนาดภาพ warm-up (สูง, กว้าง) ควรเท่ากับขนาดเฟรมจากกล้อง
+
+# การตั้งค่า hot reload (สลับเป็นโมเดลที่ promote ใหม่โดยไม่ต้องปิดแอป)
+HOT_RELOAD = False                   # เฝ้า MODEL_PATH แล้วโหลด + ทดสอบโมเดลใหม่ใน background
+RELOAD_POLL_SECONDS = 5.0            # ความถี่ในการเช็คไฟล์โมเดล (วินาที)
+
+# การตั้งค่า metrics (เวลาแต่ละขั้นตอน p50/p95/p99 + FPS)
+METRICS_ENABLED = True               # เปิด/ปิดการจับเวลา (ปิดแล้วตัวจับเวลาแทบไม่มี overhead)
+METRICS_PORT = 9108                  # พอร์ตของ Prometheus endpoint (/metrics), None = ไม่เปิด
+METRICS_PANEL = True                 # แสดงตาราง metrics บนหน้าเว็บ
+METRICS_PANEL_REFRESH_SECONDS = 2.0  # ความถี่ในการอัปเดตตารางบนหน้าเว็บ
+
+# ตัววาดกรอบลงบนภาพ RGB โดยตรง (แทน results[0].plot() + การแปลงสีไปกลับ) สร้างหลังโหลดโมเดล
+renderer = None
+
+# ผลลัพธ์ล่าสุดที่ใช้ซ้ำเมื่อฉากไม่เปลี่ยน: (result, annotated_frame)
+last_inference = None
+frame_index = 0
+detection_requested = False
+model_calls = 0
 
-# ตัวแปรสถานะสำหรับระบบเสียง
-last_detected_class_for_speech = -1
-current_streak_class = -1
-current_streak_length = 0
-last_announced_class = -1
-last_announced_time = 0.0
+# object ของแอป สร้างใน init_runtime() (ค่า None จนกว่าจะเรียก)
+image_saver = None           # writer สำหรับบันทึกภาพแบบไม่ block การตรวจจับ
+default_stream_state = None  # สถานะ streak/cooldown ของกล้องบนหน้าเว็บ (กล้องอื่นๆ ใน inference_server.py มีของตัวเอง)
+motion_gate = None           # ตัดสินว่าเฟรมนิ่งพอจะใช้ผลเดิมหรือไม่
+tracker = None               # tracker ของกล้องบนหน้าเว็บ (ใช้เมื่อ TRACKING_MODE = True)
+resolution = None            # ตัวเลือก imgsz ตาม latency budget (ใช้เมื่อ ADAPTIVE_RESOLUTION = True)
+frame_pipeline = None        # inference ใน worker thread (ใช้เมื่อ PIPELINE_MODE = True)
+model_reloader = None        # เฝ้าไฟล์โมเดลแล้วเตรียมโมเดลใหม่ใน background (เริ่มเมื่อ HOT_RELOAD = True)
+_runtime_ready = False
+_runtime_lock = threading.Lock()
 
-# ตัวแปรสถานะสำหรับบันทึกภาพ
-last_saved_class = -1
-last_saved_time = 0.0
+# เวลาที่ใช้ในแต่ละขั้นตอนตอนเริ่มโปรแกรม (วินาที) ตามลำดับที่ทำ
+startup_timings = {"import_app": time.perf_counter() - _IMPORT_STARTED}
 
-def save_detected_image(frame, class_id, confidence):
+@contextmanager
+def startup_step(name):
+    """จับเวลาขั้นตอนตอนเริ่มโปรแกรม (ผลรวมไว้ใน startup_timings)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = startup_timings.get(name, 0.0) + time.perf_counter() - start
+
+def print_startup_timings():
+    total = sum(startup_timings.values())
+    print(f"[STARTUP] พร้อมใช้งานใน {total:.2f} วินาที:")
+    for name, seconds in startup_timings.items():
+        print(f"[STARTUP]   {name:<16} {seconds:7.2f} s")
+
+def init_runtime():
+    """
+    import cv2 / numpy / โมดูลของแอป และสร้าง object ที่ใช้ประมวลผลเฟรมครั้งเดียว
+    (เรียกจาก ensure_model() และ start_services() หรือเรียกเองก่อนใช้ process_frame เช่นใน benchmark.py)
+    """
+    global _runtime_ready, cv2, np, metrics, start_metrics_server
+    global speak_guidance, speech_queue, start_speech_worker, CLASS_NAME_MAP
+    global load_model, static_imgsz, boxes_to_numpy, AnnotationRenderer, weights_fingerprint
+    global image_saver, default_stream_state, motion_gate, tracker, resolution, frame_pipeline, model_reloader
+    if _runtime_ready:
+        return
+    with _runtime_lock:
+        if _runtime_ready:
+            return
+        with startup_step("import_runtime"):
+            import cv2
+            import numpy as np
+            from voice_guidance import speak_guidance, speech_queue, start_speech_worker, CLASS_NAME_MAP  # Import ฟังก์ชันพูดและ class names
+            from frame_pipeline import FramePipeline
+            from inference_backends import load_model, static_imgsz
+            from stream_state import StreamState
+            from motion_gate import MotionGate
+            from tracker import IoUTracker, boxes_to_numpy
+            from image_saver import AsyncImageSaver
+            from annotation_renderer import AnnotationRenderer
+            from perf_metrics import metrics, start_metrics_server
+            from adaptive_resolution import AdaptiveResolution
+            from model_reloader import ModelReloader
+            from result_cache import weights_fingerprint
+
+        image_saver = AsyncImageSaver(
+            max_queue=SAVE_QUEUE_SIZE,
+            drop_policy=SAVE_DROP_POLICY,
+            jpeg_quality=SAVE_JPEG_QUALITY,
+            max_side=SAVE_MAX_SIDE,
+        )
+        default_stream_state = StreamState("webcam")
+        motion_gate = MotionGate(
+            pixel_threshold=MOTION_PIXEL_THRESHOLD,
+            changed_ratio=MOTION_CHANGED_RATIO,
+            max_skip_frames=MOTION_MAX_SKIP_FRAMES,
+        )
+        tracker = IoUTracker(
+            iou_threshold=TRACK_IOU_THRESHOLD,
+            min_hits=TRACK_MIN_HITS,
+            max_misses=TRACK_MAX_MISSES,
+        )
+        resolution = AdaptiveResolution(
+            ladder=IMGSZ_LADDER,
+            target_ms=TARGET_INFER_MS,
+            min_samples=ADAPTIVE_MIN_SAMPLES,
+        )
+        # Pipeline: inference รันใน worker thread, callback ของ Gradio แค่ส่งเฟรมและคืนผลล่าสุด
+        frame_pipeline = FramePipeline(process_frame)
+        model_reloader = ModelReloader(
+            MODEL_PATH,
+            load_fn=_load_reload_candidate,
+            smoke_fn=_smoke_test,
+            prepare_fn=lambda candidate: AnnotationRenderer(candidate.names, rgb=True),
+            poll_seconds=RELOAD_POLL_SECONDS,
+        )
+
+        # ค่าสถานะของส่วนอื่นๆ ที่ export ไปพร้อม metrics (อ่านเฉพาะตอนมีคนดู metrics)
+        metrics.enabled = METRICS_ENABLED
+        metrics.register_collector(lambda: {f"pipeline_{k}": v for k, v in frame_pipeline.stats().items()})
+        metrics.register_collector(lambda: {f"motion_{k}": v for k, v in motion_gate.stats().items()})
+        metrics.register_collector(lambda: {f"saver_{k}": v for k, v in image_saver.stats().items()})
+        metrics.register_collector(lambda: {f"speech_{k}": v for k, v in speech_queue.stats().items()})
+        metrics.register_collector(lambda: {"model_calls": model_calls})
+        metrics.register_collector(
+            lambda: {"imgsz_active": resolution.imgsz if ADAPTIVE_RESOLUTION else INFERENCE_KWARGS["imgsz"],
+                     "adaptive_infer_ema_ms": round(resolution.ema_ms or 0.0, 2),
+                     "adaptive_switches": resolution.switches}
+        )
+        metrics.register_collector(lambda: {f"model_{k}": v for k, v in model_reloader.stats().items()})
+        metrics.register_collector(lambda: {f"startup_{k}_seconds": round(v, 3) for k, v in startup_timings.items()})
+        _runtime_ready = True
+
+def ensure_model():
+    """
+    โหลดโมเดล (ครั้งแรกเท่านั้น) และสร้าง renderer คืนค่าโมเดลที่ใช้อยู่
+    (การสลับโมเดลจาก hot reload ทำใน process_frame เท่านั้น ไม่ทำที่นี่)
+    """
+    global model, renderer, Results
+    if model is not None:
+        return model
+    init_runtime()
+    with _model_lock:
+        if model is None:
+            try:
+                print(f"กำลังโหลดโมเดลจาก: {MODEL_PATH}")
+                with startup_step("load_model"):
+                    loaded = load_model(MODEL_PATH)
+                    # hash ของไฟล์ที่โหลดจริง (.pt / export / INT8) ใช้เป็นส่วนหนึ่งของ key ใน result cache ของ API
+                    loaded.weights_hash = weights_fingerprint(loaded.artifact_path)
+                print("โหลดโมเดลสำเร็จ")
+            except Exception as e:
+                print(f"เกิดข้อผิดพลาดในการโหลดโมเดล: {e}")
+                print("กรุณาตรวจสอบว่า Path ของโมเดลถูกต้องหรือไม่")
+                raise SystemExit(1)
+            check_adaptive_support(loaded)
+            # ultralytics ถูก import แล้วตอนโหลดโมเดล (ใช้สร้าง Results ของโหมด tracking)
+            from ultralytics.engine.results import Results
+            renderer = AnnotationRenderer(loaded.names, rgb=True)
+            model = loaded
+    return model
+
+def check_adaptive_support(loaded):
+    """
+    โหมด adaptive ส่ง imgsz หลายขนาดจาก IMGSZ_LADDER เข้าโมเดล ซึ่ง export แบบ static shape
+    (inference.dynamic: false) และโมเดล INT8 รับไม่ได้ ถ้าโหลดโมเดลแบบนั้นมาให้ปิดโหมด adaptive แทนการ crash
+    """
+    global ADAPTIVE_RESOLUTION
+    if not ADAPTIVE_RESOLUTION:
+        return
+    fixed = static_imgsz(loaded.artifact_path)
+    if fixed is None:
+        return
+    ADAPTIVE_RESOLUTION = False
+    INFERENCE_KWARGS["imgsz"] = fixed
+    print(
+        f"[ADAPTIVE] WARNING: {loaded.artifact_path} เป็น export แบบ static shape รับได้แค่ imgsz={fixed} "
+        "ปิดโหมด adaptive (ตั้ง inference.dynamic: true แล้ว export ใหม่เพื่อใช้ IMGSZ_LADDER)"
+    )
+
+def warmup_model(runs=WARMUP_RUNS, shape=WARMUP_SHAPE):
+    """
+    รันโมเดลบนภาพเปล่าก่อนรับเฟรมจริง ให้การเตรียม kernel (CUDA/CPU) และ memory
+    เกิดขึ้นตอนเริ่มโปรแกรม ไม่ใช่ตอนเฟรมแรกที่มีคนถือขยะมา
+    """
+    if runs <= 0:
+        return
+    ensure_model()
+    blank = np.zeros((*shape, 3), dtype=np.uint8)
+    # โหมด adaptive: warm-up ทุกขนาดใน ladder ไม่ให้การเตรียม kernel ของขนาดใหม่ไปทำให้ค่าเฉลี่ยเพี้ยน
+    sizes = resolution.ladder if ADAPTIVE_RESOLUTION else (INFERENCE_KWARGS["imgsz"],)
+    with startup_step("warmup"):
+        for imgsz in sizes:
+            for _ in range(runs):
+                model(blank, **{**INFERENCE_KWARGS, "imgsz": imgsz})
+    print(f"[STARTUP] warm-up {runs} รอบ ใช้เวลา {startup_timings['warmup']:.2f} วินาที")
+
+def _load_reload_candidate(weights):
+    """hot reload: โหลดโมเดลใหม่แล้ว warm-up ทุกขนาดที่ใช้ (ทำใน thread ของ reloader ไม่กระทบเฟรม)"""
+    candidate = load_model(weights)
+    candidate.weights_hash = weights_fingerprint(candidate.artifact_path)
+    if ADAPTIVE_RESOLUTION and static_imgsz(candidate.artifact_path) is not None:
+        # โหมด adaptive เปิดอยู่กับโมเดลเดิม: โมเดลใหม่ที่รับได้ขนาดเดียวใช้แทนไม่ได้ (reloader คงโมเดลเดิมไว้)
+        raise RuntimeError(f"{candidate.artifact_path} เป็น export แบบ static shape ใช้กับโหมด adaptive ไม่ได้")
+    blank = np.zeros((*WARMUP_SHAPE, 3), dtype=np.uint8)
+    sizes = resolution.ladder if ADAPTIVE_RESOLUTION else (INFERENCE_KWARGS["imgsz"],)
+    for imgsz in sizes:
+        for _ in range(max(1, WARMUP_RUNS)):
+            candidate(blank, **{**INFERENCE_KWARGS, "imgsz": imgsz})
+    return candidate
+
+def _smoke_test(candidate):
+    """hot reload: โมเดลต้องตอบผลได้ปกติบนภาพเปล่า และรู้จักคลาสชุดเดิม (เสียง/โฟลเดอร์บันทึกภาพผูกกับชื่อคลาส)"""
+    results = candidate(np.zeros((*WARMUP_SHAPE, 3), dtype=np.uint8), **INFERENCE_KWARGS)
+    if len(results) != 1 or results[0].boxes is None:
+        raise RuntimeError("smoke inference ไม่คืนผลลัพธ์")
+    if model is not None and dict(candidate.names) != dict(model.names):
+        raise RuntimeError(f"ชื่อคลาสไม่ตรงกับโมเดลเดิม: {candidate.names}")
+
+def apply_pending_model():
+    """
+    สลับเป็นโมเดลที่ reloader เตรียมไว้ (ถ้ามี) เรียกจาก process_frame ก่อนเริ่มเฟรมเท่านั้น
+    (thread เดียวกับที่อ่าน model / renderer / last_inference) โมเดลกับ renderer จึงเปลี่ยนพร้อมกัน
+    และล้างผลเดิม (motion gate / tracker) ให้เฟรมถัดไปรันโมเดลใหม่ทันที
+    """
+    global model, renderer, last_inference
+    pending = model_reloader.take_pending()
+    if pending is None:
+        return
+    with _model_lock:
+        model, renderer, version = pending
+        last_inference = None
+        tracker.reset()
+        motion_gate.reset()
+    print(f"[RELOAD] สลับเป็นโมเดล {version} แล้ว")
+
+def save_detected_image(frame, class_id, confidence, state=None, rgb=True):
     """
     บันทึกภาพที่ตรวจจับได้ไปยังโฟลเดอร์ตามประเภทขยะ
+    (ส่งเข้า image_saver แล้วคืนทันที การแปลงสี/encode/เขียนไฟล์ทำใน background thread)
     """
-    global last_saved_class, last_saved_time
-    
     if not SAVE_IMAGES:
         return
+    state = state or default_stream_state
     
-    # ตรวจสอบ cooldown
+    # ตรวจสอบ cooldown และ confidence threshold
     now = time.time()
-    if class_id == last_saved_class and (now - last_saved_time) < SAVE_COOLDOWN_SECONDS:
-        return
-    
-    # ตรวจสอบ confidence threshold
-    if confidence < SAVE_CONF_THRESHOLD:
+    if not state.should_save(class_id, confidence, now, SAVE_CONF_THRESHOLD, SAVE_COOLDOWN_SECONDS):
         return
     
     try:
         # ดึงชื่อคลาส
         class_name = CLASS_NAME_MAP.get(class_id, f"unknown_{class_id}")
         
-        # สร้างโฟลเดอร์ตามประเภทขยะ
+        # โฟลเดอร์ตามประเภทขยะ (image_saver สร้างให้ครั้งเดียวต่อโฟลเดอร์)
         class_dir = Path(SAVE_DIR) / class_name
-        class_dir.mkdir(parents=True, exist_ok=True)
         
         # สร้างชื่อไฟล์: timestamp_class_conf.jpg
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # milliseconds
         filename = f"{timestamp}_{class_name}_{confidence:.2f}.jpg"
         filepath = class_dir / filename
         
-        # บันทึกภาพ
-        cv2.imwrite(str(filepath), frame)
+        # ส่งภาพเข้า queue เพื่อบันทึก
+        if not image_saver.submit(frame, filepath, rgb=rgb):
+            print(f"[SAVE] Dropped (queue เต็ม): {filepath}")
+            return
         
         # อัปเดตสถานะ
-        last_saved_class = class_id
-        last_saved_time = now
+        state.mark_saved(class_id, now)
         
-        print(f"[SAVE] Saved: {filepath}")
+        print(f"[SAVE] Queued: {filepath}")
         
     except Exception as e:
         print(f"[SAVE] Error saving image: {e}")
 
-def run_speech_in_background():
+def handle_detections(result, annotated_frame, state=None, rgb=True):
     """
-    ฟังก์ชันนี้จะรันใน Thread แยก
-    เพื่อเรียกใช้ speak_guidance โดยไม่ทำให้วิดีโอค้าง
+    อัปเดต streak/cooldown ของ stream จากผลตรวจจับ แล้วสั่งพูดและบันทึกภาพเมื่อถึงเกณฑ์
+    rgb: ลำดับสีของ annotated_frame (True = RGB จาก Gradio, False = BGR จาก OpenCV)
     """
-    global last_detected_class_for_speech
-    while True:
-        if last_detected_class_for_speech != -1:
-            # เก็บค่าไว้ก่อน แล้วรีเซ็ตทันที
-            class_to_speak = last_detected_class_for_speech
-            last_detected_class_for_speech = -1
-            
-            # เรียกใช้ฟังก์ชันพูด (ซึ่งมี Debounce ของตัวเอง)
-            speak_guidance(class_to_speak)
-        # ป้องกัน busy loop
-        time.sleep(0.05)
+    state = state or default_stream_state
 
-def process_frame(frame):
-    """
-    ฟังก์ชันหลักที่ Gradio จะเรียกใช้สำหรับทุกเฟรมจาก Webcam
-    """
-    global last_detected_class_for_speech, current_streak_class, current_streak_length
-    global last_announced_class, last_announced_time
-    
-    # 1. พลิกเฟรม (กล้อง Webcam มักจะกลับด้าน)
-    frame = cv2.flip(frame, 1)
-    # แปลงเป็น BGR สำหรับโมเดล (Gradio ป้อน RGB)
-    frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-    
-    # 2. สั่งให้โมเดลตรวจจับวัตถุในเฟรม
-    results = model(frame_bgr, conf=0.25, imgsz=640, verbose=False, max_det=300)
-    
-    # 3. วาดกรอบและชื่อคลาสลงบนภาพ (ฟังก์ชัน .plot() ของ ultralytics)
-    annotated_bgr = results[0].plot()
-    annotated_frame = cv2.cvtColor(annotated_bgr, cv2.COLOR_BGR2RGB)
-    try:
-        print("boxes:", len(results[0].boxes))
-    except Exception:
-        pass
-    
-    # 4. ตรวจสอบว่าเจออะไรหรือไม่
-    boxes = results[0].boxes
+    # ตรวจสอบว่าเจออะไรหรือไม่
+    boxes = result.boxes
     if boxes is not None and len(boxes) > 0:
         detected_class_tensor = boxes.cls[0]
         detected_class = int(detected_class_tensor.item())
         detected_conf = float(boxes.conf[0].item()) if boxes.conf is not None else 0.0
 
         if detected_conf >= SPEECH_CONF_THRESHOLD:
-            if detected_class == current_streak_class:
-                current_streak_length += 1
-            else:
-                current_streak_class = detected_class
-                current_streak_length = 1
-
-            now = time.time()
-            should_trigger_speech = (
-                current_streak_length >= SUSTAINED_FRAME_THRESHOLD and
-                (
-                    detected_class != last_announced_class or
-                    now - last_announced_time >= ANNOUNCE_COOLDOWN_SECONDS
-                )
+            should_trigger_speech = state.observe(
+                detected_class, time.time(), SUSTAINED_FRAME_THRESHOLD, ANNOUNCE_COOLDOWN_SECONDS
             )
 
             if should_trigger_speech:
-                # ส่งคำสั่งให้พูด (เสียงจะพูดจนเสร็จแม้ไม่มี detection ต่อ)
-                last_detected_class_for_speech = detected_class
-                last_announced_class = detected_class
-                last_announced_time = now
+                # ส่งคำสั่งให้พูด (ไม่ block - เสียงจะพูดจนเสร็จแม้ไม่มี detection ต่อ)
+                with metrics.time("speech_enqueue"):
+                    speak_guidance(detected_class)
                 
-                # บันทึกภาพที่ตรวจจับได้ (ใช้ annotated_bgr ที่มีกรอบแล้ว)
-                save_detected_image(annotated_bgr, detected_class, detected_conf)
+                # บันทึกภาพที่ตรวจจับได้ (ใช้ภาพที่มีกรอบแล้ว)
+                with metrics.time("save"):
+                    save_detected_image(annotated_frame, detected_class, detected_conf, state, rgb)
                 
                 try:
-                    print(f"[SPEECH] trigger class={detected_class} conf={detected_conf:.2f}")
+                    print(f"[SPEECH] trigger stream={state.stream_id} class={detected_class} conf={detected_conf:.2f}")
                 except Exception:
                     pass
         else:
             # conf ต่ำเกินไป - reset streak แต่ไม่หยุดเสียงที่กำลังพูดอยู่
-            current_streak_class = -1
-            current_streak_length = 0
+            state.reset_streak()
     else:
         # ไม่เจอวัตถุ - reset streak แต่ไม่หยุดเสียงที่กำลังพูดอยู่
         # หมายเหตุ: เสียงที่ส่งเข้า queue แล้วจะพูดจนเสร็จ ไม่ว่าจะมี detection ต่อหรือไม่
-        current_streak_class = -1
-        current_streak_length = 0
+        state.reset_streak()
+
+def handle_tracks(tracks, annotated_frame, state=None):
+    """
+    โหมด tracking: ประกาศเสียง/บันทึกภาพหนึ่งครั้งต่อ track เมื่อ track มีอายุถึงเกณฑ์
+    """
+    state = state or default_stream_state
+    now = time.time()
+
+    # เรียงตาม conf เหมือนเดิมที่ใช้ boxes[0] และประกาศได้ครั้งละหนึ่ง track ต่อเฟรม
+    for track in sorted(tracks, key=lambda t: t.conf, reverse=True):
+        if track.conf < SPEECH_CONF_THRESHOLD:
+            continue
+        if state.observe_track(track, now, TRACK_ANNOUNCE_AFTER_SECONDS, ANNOUNCE_COOLDOWN_SECONDS):
+            with metrics.time("speech_enqueue"):
+                speak_guidance(track.cls)
+            if not track.saved:
+                track.saved = True
+                with metrics.time("save"):
+                    save_detected_image(annotated_frame, track.cls, track.conf, state)
+            print(f"[SPEECH] trigger stream={state.stream_id} track={track.track_id} class={track.cls} conf={track.conf:.2f}")
+            break
+
+def request_detection():
+    """ขอให้รันโมเดลในเฟรมถัดไป (โหมด tracking) เช่นเมื่อผู้ใช้กดปุ่มหรือมีเซ็นเซอร์แจ้ง"""
+    global detection_requested
+    detection_requested = True
+
+def _track_frame(frame_bgr):
+    """
+    โหมด tracking: รันโมเดลทุก DETECT_EVERY_N_FRAMES เฟรม (หรือเมื่อถูกขอ/ยังไม่มี track)
+    เฟรมระหว่างนั้นใช้ tracker เลื่อนกล่องเดิม คืน Results ที่มี track ID
+    """
+    global frame_index, detection_requested, model_calls
+
+    run_detector = (
+        frame_index % DETECT_EVERY_N_FRAMES == 0 or
+        detection_requested or
+        (DETECT_WHEN_EMPTY and not tracker.tracks)
+    )
+    frame_index += 1
+    if run_detector:
+        detection_requested = False
+        model_calls += 1
+        results = _run_model(frame_bgr)
+        tracker.update(*boxes_to_numpy(results[0].boxes))
+    else:
+        tracker.predict()
+    return Results(frame_bgr, path="", names=model.names, boxes=tracker.as_boxes())
+
+def _run_model(frame_bgr):
+    """
+    เรียกโมเดลหนึ่งครั้ง แล้วบันทึกเวลา preprocess / inference / NMS ที่ ultralytics วัดไว้ใน result.speed
+    โหมด ADAPTIVE_RESOLUTION: ใช้ imgsz จาก resolution และส่งเวลาที่วัดได้กลับไปให้ตัดสินขนาดถัดไป
+    """
+    kwargs = INFERENCE_KWARGS
+    if ADAPTIVE_RESOLUTION:
+        kwargs = {**INFERENCE_KWARGS, "imgsz": resolution.imgsz}
+    start = time.perf_counter()
+    results = model(frame_bgr, **kwargs)
+    elapsed = time.perf_counter() - start
+    metrics.observe("model_call", elapsed)
+    if ADAPTIVE_RESOLUTION:
+        new_imgsz = resolution.observe(elapsed)
+        if new_imgsz is not None:
+            print(f"[ADAPTIVE] imgsz -> {new_imgsz} (infer EMA {resolution.ema_ms:.0f}ms, target {resolution.target_ms:.0f}ms)")
+    speed = getattr(results[0], "speed", None) or {}
+    for key, stage in (("preprocess", "preprocess"), ("inference", "inference"), ("postprocess", "nms")):
+        if speed.get(key) is not None:
+            metrics.observe(stage, speed[key] / 1000.0)
+    return results
+
+def _update_triggers(result, annotated_frame):
+    if TRACKING_MODE:
+        handle_tracks(tracker.confirmed(), annotated_frame)
+    else:
+        handle_detections(result, annotated_frame)
+
+def process_frame(frame):
+    """
+    ฟังก์ชันหลักที่ Gradio จะเรียกใช้สำหรับทุกเฟรมจาก Webcam (โหมด synchronous)
+    """
+    global last_inference
+
+    # โมเดลใหม่จาก hot reload ถูกสลับตรงนี้เท่านั้น (ระหว่างเฟรม)
+    apply_pending_model()
+
+    # 1. พลิกเฟรม (กล้อง Webcam มักจะกลับด้าน) -> ภาพ RGB สำหรับแสดงผลและวาดกรอบ
+    with metrics.time("flip"):
+        display = cv2.flip(frame, 1)
+
+    # ฉากไม่เปลี่ยน - ใช้ผลตรวจจับและภาพเดิม แต่ยังอัปเดต streak/cooldown ตามปกติ
+    # (ของที่ถือนิ่งๆ จึงยังนับเป็นการเห็นต่อเนื่องและถูกประกาศตามเกณฑ์เดิม)
+    if MOTION_GATING:
+        # ยังไม่มีผลเดิมให้ใช้ซ้ำ (เริ่มโปรแกรม / เพิ่งสลับโมเดล): เริ่ม gate ใหม่ เฟรมนี้จะไม่ถูกนับว่าข้าม
+        if last_inference is None:
+            motion_gate.reset()
+        run_model = motion_gate.should_infer(display)
+        if motion_gate.total % MOTION_STATS_EVERY == 0:
+            stats = motion_gate.stats()
+            print(f"[MOTION] frames={stats['frames']} skipped={stats['skipped']} skip_ratio={stats['skip_ratio']:.1%}")
+        if not run_model:
+            result, annotated_frame = last_inference
+            _update_triggers(result, annotated_frame)
+            model_reloader.count_frame(getattr(result, "model_version", None))
+            metrics.frame_done()
+            return annotated_frame
+
+    # ภาพ BGR สำหรับโมเดล (Gradio ป้อน RGB): พลิก + สลับ channel ใน copy เดียว
+    with metrics.time("color_convert"):
+        frame_bgr = np.ascontiguousarray(frame[:, ::-1, ::-1])
+    
+    # 2. สั่งให้โมเดลตรวจจับวัตถุในเฟรม (โหมด tracking: รันโมเดลเฉพาะบางเฟรม)
+    if TRACKING_MODE:
+        results = [_track_frame(frame_bgr)]
+    else:
+        results = _run_model(frame_bgr)
+    
+    # 3. วาดกรอบและชื่อคลาสลงบนภาพ RGB โดยตรง (ไม่สร้างภาพใหม่)
+    with metrics.time("render"):
+        annotated_frame = renderer.draw_result(display, results[0])
+    
+    # version ของโมเดลที่ให้ผลเฟรมนี้ (ใช้ต่อเมื่อ motion gate นำผลเดิมกลับมาใช้)
+    results[0].model_version = model_reloader.version
+    model_reloader.count_frame()
+    last_inference = (results[0], annotated_frame)
+
+    # 4. อัปเดตสถานะเสียง/บันทึกภาพของกล้องนี้
+    _update_triggers(results[0], annotated_frame)
 
     # คืนค่าภาพที่มีกรอบวาดแล้ว กลับไปแสดงที่หน้าเว็บ
+    metrics.frame_done()
+    return annotated_frame
+
+def process_frame_pipelined(frame):
+    """
+    ส่งเฟรมเข้า pipeline แล้วคืนภาพผลลัพธ์ล่าสุดที่เสร็จแล้วทันที
+    ถ้าโมเดลช้ากว่ากล้อง เฟรมเก่าที่ยังไม่ถูกประมวลผลจะถูกทิ้ง latency จึงไม่สะสม
+    """
+    frame_pipeline.submit(frame)
+    stats = frame_pipeline.stats()
+    if stats["submitted"] % PIPELINE_STATS_EVERY == 0:
+        print(
+            f"[PIPELINE] submitted={stats['submitted']} processed={stats['processed']} "
+            f"dropped={stats['dropped']} infer={stats['last_infer_ms']:.1f}ms"
+        )
+
+    annotated_frame, _ = frame_pipeline.latest()
+    if annotated_frame is None:
+        # ยังไม่มีผลลัพธ์แรก - แสดงภาพจากกล้องไปก่อน
+        return cv2.flip(frame, 1)
     return annotated_frame
 
+def start_services(metrics_server=True):
+    """
+    เริ่ม worker เสียง / โหลดโมเดล + warm-up / image saver / metrics server / pipeline worker
+    แล้วคืนฟังก์ชันที่ใช้กับ stream ของ Gradio
+    (ใช้ร่วมกับ inference_api.py --with-ui ที่ mount หน้าเว็บนี้ไว้บน FastAPI)
+    """
+    init_runtime()
+
+    # worker เสียงเตรียมไฟล์เสียงใน thread ของตัวเอง ทำไปพร้อมกับการโหลดโมเดล
+    with startup_step("speech_worker"):
+        start_speech_worker()
+
+    ensure_model()
+    warmup_model()
+
+    with startup_step("services"):
+        if HOT_RELOAD:
+            model_reloader.start()
+            print(f"[RELOAD] เฝ้าไฟล์โมเดล {MODEL_PATH} (ทุก {RELOAD_POLL_SECONDS:g} วินาที) version {model_reloader.version}")
+
+        # สร้างโฟลเดอร์สำหรับเก็บภาพ
+        if SAVE_IMAGES:
+            save_path = Path(SAVE_DIR)
+            save_path.mkdir(exist_ok=True)
+            image_saver.prepare_dirs(save_path / name for name in CLASS_NAME_MAP.values())
+            image_saver.start()
+            print(f"บันทึกภาพไปที่: {save_path.absolute()}")
+        
+        if metrics_server and METRICS_ENABLED and METRICS_PORT:
+            start_metrics_server(metrics, METRICS_PORT)
+
+        stream_fn = process_frame
+        if PIPELINE_MODE:
+            frame_pipeline.start()
+            stream_fn = process_frame_pipelined
+            print("ใช้โหมด pipeline (latest-frame-wins)")
+    return stream_fn
+
 # --- สร้าง Gradio Interface ---
-def main():
-    print("กำลังสร้าง Gradio Interface...")
-    
-    # สร้างโฟลเดอร์สำหรับเก็บภาพ
-    if SAVE_IMAGES:
-        save_path = Path(SAVE_DIR)
-        save_path.mkdir(exist_ok=True)
-        print(f"บันทึกภาพไปที่: {save_path.absolute()}")
-    
-    # เริ่ม Thread สำหรับการพูดแยกต่างหาก
-    speech_thread = threading.Thread(target=run_speech_in_background, daemon=True)
-    speech_thread.start()
+def build_interface(stream_fn):
+    """สร้างหน้าเว็บ (gr.Blocks) ที่ส่งเฟรมจาก webcam เข้า stream_fn"""
+    with startup_step("import_gradio"):
+        import gradio as gr
 
     # สร้างหน้าเว็บด้วย Blocks เพื่อควบคุม UI ได้มากขึ้น
     with gr.Blocks(title="ระบบคัดแยกขยะอัจฉริยะ", theme=gr.themes.Soft()) as demo:
@@ -220,12 +602,26 @@ def main():
         
         # ใช้ streaming event สำหรับ real-time processing (ไม่มีปุ่ม Clear/Flag)
         input_image.stream(
-            fn=process_frame,
+            fn=stream_fn,
             inputs=input_image,
             outputs=output_image,
         )
+
+        # ตาราง metrics (เวลาแต่ละขั้นตอน + FPS) อัปเดตตาม timer ไม่ผูกกับเฟรม
+        if METRICS_ENABLED and METRICS_PANEL:
+            with gr.Accordion("Performance metrics", open=False):
+                metrics_box = gr.Textbox(show_label=False, lines=16, max_lines=24, interactive=False)
+            gr.Timer(METRICS_PANEL_REFRESH_SECONDS).tick(metrics.render_text_panel, outputs=metrics_box)
+    return demo
+
+def main():
+    print("กำลังสร้าง Gradio Interface...")
+    stream_fn = start_services()
+    with startup_step("build_ui"):
+        demo = build_interface(stream_fn)
     
     # รันแอป
+    print_startup_timings()
     print("Interface พร้อมใช้งาน. เปิดในเบราว์เซอร์ของคุณ...")
     demo.launch(share=False)  # share=True ถ้าต้องการส่งลิงก์ให้คนอื่นดู
 
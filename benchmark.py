@@ -0,0 +1,254 @@
+# ------------------------------------
+# ไฟล์: benchmark.py
+# ------------------------------------
+"""
+DVC stage: วัดความเร็วของโมเดลและของเส้นทาง process_frame จริงในแอป บนชุดเฟรมที่คงที่
+
+- เฟรมมาจาก val split (เรียงตามชื่อ ย่อ/ขยายเป็นขนาดเฟรมกล้อง) หรือภาพสังเคราะห์แบบ fix seed
+- วัดทุกชุดของ imgsz x batch x จำนวน thread ที่กำหนดใน params.yaml (benchmark.*)
+  backend ที่ export แบบ static (inference.dynamic: false) หรือโมเดล INT8 รับได้แค่ batch 1 ที่ imgsz ตอน export
+  ชุดอื่นจะถูกข้ามและบันทึกไว้ใน system.json (ตั้ง inference.dynamic: true เพื่อวัดครบทุกชุด)
+- ตัดรอบ warm-up ออกก่อนคำนวณ p50/p95 และ FPS
+- เขียนผลเป็น DVC metrics ใน artifacts/bench/ เพื่อให้ `dvc metrics diff` แสดงความเร็วคู่กับความแม่นยำ
+
+    artifacts/bench/model.json  - inference ของโมเดลอย่างเดียว (ต่อ imgsz/batch/threads)
+    artifacts/bench/app.json    - app.process_frame ทั้งเส้นทาง (flip, แปลงสี, โมเดล, วาดกรอบ) + เวลาแต่ละ stage
+    artifacts/bench/system.json - เวลาโหลดโมเดล, peak RSS, ข้อมูลเครื่อง
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from perf_metrics import peak_rss_mb
+
+
+DEFAULT_BENCHMARK_CONFIG = {
+    "weights": "artifacts/models/waste-sorter-best.pt",
+    "backend": None,
+    "source": "val",              # val = ภาพจาก evaluate.data, synthetic = ภาพสุ่ม
+    "frames": 60,
+    "warmup": 10,
+    "frame_shape": [480, 640],    # ขนาดเฟรมกล้อง (สูง, กว้าง)
+    "imgsz": [640],
+    "batch_sizes": [1],
+    "threads": [0],               # 0 = ค่าเริ่มต้นของ torch
+    "device": "cpu",
+    "out_dir": "artifacts/bench",
+}
+
+
+def load_benchmark_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_BENCHMARK_CONFIG.copy()
+    params = {}
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("benchmark", {}))
+    if not config.get("backend"):
+        config["backend"] = params.get("inference", {}).get("backend", "pytorch")
+    config["data"] = params.get("evaluate", {}).get("data", "waste-detection/data.yaml")
+    return config
+
+
+def load_frames(config):
+    """เฟรม RGB ขนาด frame_shape จำนวน frames ภาพ (ชุดเดิมทุกครั้งที่รัน)"""
+    height, width = config["frame_shape"]
+    count = int(config["frames"]) + int(config["warmup"])
+    frames = []
+    if config["source"] == "val":
+        try:
+            from ultralytics.data.utils import check_det_dataset
+
+            val = check_det_dataset(config["data"])["val"]
+            val_dirs = val if isinstance(val, list) else [val]
+            files = sorted(
+                p for d in val_dirs for p in Path(d).rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"}
+            )
+            for path in files[:count]:
+                image = cv2.imread(str(path))
+                if image is not None:
+                    frames.append(cv2.cvtColor(cv2.resize(image, (width, height)), cv2.COLOR_BGR2RGB))
+        except Exception as ex:
+            print(f"[BENCH] อ่านภาพ val ไม่ได้ ({ex}) ใช้ภาพสังเคราะห์แทน")
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+    # วนภาพซ้ำถ้า val มีภาพน้อยกว่าที่ต้องการ
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def summarize_timings(timings, images_per_call=1):
+    timings = sorted(timings)
+    p95_index = min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))
+    total = sum(timings)
+    return {
+        "p50_ms": statistics.median(timings) * 1000.0,
+        "p95_ms": timings[p95_index] * 1000.0,
+        "fps": len(timings) * images_per_call / total if total > 0 else 0.0,
+    }
+
+
+def set_threads(threads):
+    if not threads:
+        return
+    try:
+        import torch
+
+        torch.set_num_threads(int(threads))
+    except ImportError:
+        pass
+
+
+def supported(imgsz, batch, fixed_imgsz):
+    """ชุด imgsz/batch ที่โมเดลรับได้ (fixed_imgsz = imgsz ของ export แบบ static หรือ None)"""
+    return fixed_imgsz is None or (imgsz == fixed_imgsz and batch == 1)
+
+
+def bench_model(model, frames, config, fixed_imgsz=None, skipped=None):
+    """inference ของโมเดลอย่างเดียว (รับภาพ BGR) สำหรับทุก imgsz x batch x threads ที่โมเดลรับได้"""
+    warmup = int(config["warmup"])
+    frames_bgr = [np.ascontiguousarray(frame[:, :, ::-1]) for frame in frames]
+    report = {}
+    for threads in config["threads"]:
+        set_threads(threads)
+        for imgsz in config["imgsz"]:
+            for batch in config["batch_sizes"]:
+                if not supported(imgsz, batch, fixed_imgsz):
+                    if skipped is not None:
+                        skipped.append(f"model imgsz{imgsz}_b{batch}_t{threads or 'auto'}")
+                    continue
+                batches = [frames_bgr[i:i + batch] for i in range(0, len(frames_bgr) - batch + 1, batch)]
+                warm, timed = batches[: max(1, warmup // batch)], batches[max(1, warmup // batch):]
+                kwargs = dict(imgsz=imgsz, device=config["device"], verbose=False)
+                for chunk in warm:
+                    model(chunk, **kwargs)
+                timings = []
+                for chunk in timed:
+                    start = time.perf_counter()
+                    model(chunk, **kwargs)
+                    timings.append(time.perf_counter() - start)
+                name = f"imgsz{imgsz}_b{batch}_t{threads or 'auto'}"
+                report[name] = {**summarize_timings(timings, batch), "calls": len(timings)}
+                print(f"[BENCH] model {name}: p50={report[name]['p50_ms']:.1f}ms fps={report[name]['fps']:.1f}")
+    return report
+
+
+def bench_app(frames, config, fixed_imgsz=None, skipped=None):
+    """
+    app.process_frame ทั้งเส้นทาง (ปิด motion gating / adaptive imgsz / การบันทึกภาพ / เสียง เพื่อให้วัดงานเดิมทุกเฟรม)
+    รายงานเวลาต่อเฟรม และ p50 ของแต่ละ stage จาก perf_metrics
+    """
+    import app
+
+    # ค่าของ app ที่ถูกปรับระหว่างวัด คืนค่าเดิมเมื่อจบ (INFERENCE_KWARGS ใช้ร่วมกับ inference_server.py)
+    saved_flags = {name: getattr(app, name) for name in ("MOTION_GATING", "ADAPTIVE_RESOLUTION", "SAVE_IMAGES", "SPEECH_CONF_THRESHOLD")}
+    saved_kwargs = dict(app.INFERENCE_KWARGS)
+    app.MOTION_GATING = False
+    app.ADAPTIVE_RESOLUTION = False
+    app.SAVE_IMAGES = False
+    app.SPEECH_CONF_THRESHOLD = float("inf")
+    app.INFERENCE_KWARGS["device"] = config["device"]
+    try:
+        warmup = int(config["warmup"])
+        report = {}
+        for threads in config["threads"]:
+            set_threads(threads)
+            for imgsz in config["imgsz"]:
+                if not supported(imgsz, 1, fixed_imgsz):
+                    if skipped is not None:
+                        skipped.append(f"app imgsz{imgsz}_t{threads or 'auto'}")
+                    continue
+                app.INFERENCE_KWARGS["imgsz"] = imgsz
+                for frame in frames[:warmup]:
+                    app.process_frame(frame)
+                app.metrics.reset()
+                timings = []
+                for frame in frames[warmup:]:
+                    start = time.perf_counter()
+                    app.process_frame(frame)
+                    timings.append(time.perf_counter() - start)
+                name = f"imgsz{imgsz}_t{threads or 'auto'}"
+                stages = app.metrics.snapshot()["stages"]
+                report[name] = {
+                    **summarize_timings(timings),
+                    "stages_p50_ms": {stage: stats["p50"] * 1000.0 for stage, stats in stages.items() if stats["p50"] is not None},
+                }
+                print(f"[BENCH] app {name}: p50={report[name]['p50_ms']:.1f}ms fps={report[name]['fps']:.1f}")
+    finally:
+        for name, value in saved_flags.items():
+            setattr(app, name, value)
+        app.INFERENCE_KWARGS.clear()
+        app.INFERENCE_KWARGS.update(saved_kwargs)
+    return report
+
+
+def write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[BENCH] บันทึก {path}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inference speed benchmark (writes DVC metrics)")
+    parser.add_argument("--skip-app", action="store_true", help="Only benchmark raw model inference")
+    parser.add_argument("--out-dir", default=None, help="Output directory (default: benchmark.out_dir)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = load_benchmark_config()
+    out_dir = Path(args.out_dir or config["out_dir"])
+    frames = load_frames(config)
+    print(
+        f"[BENCH] {len(frames)} เฟรม ({config['warmup']} warm-up) backend={config['backend']} "
+        f"imgsz={config['imgsz']} batch={config['batch_sizes']} threads={config['threads']}"
+    )
+
+    import app
+    from inference_backends import load_model, static_imgsz
+
+    start = time.perf_counter()
+    model = load_model(config["weights"], config["backend"])
+    load_seconds = time.perf_counter() - start
+    fixed_imgsz = static_imgsz(model.artifact_path)
+    skipped = []
+    if fixed_imgsz is not None:
+        print(f"[BENCH] {model.artifact_path} เป็น export แบบ static shape วัดเฉพาะ imgsz={fixed_imgsz} batch=1")
+    # ให้ process_frame ใช้โมเดลตัวเดียวกัน (ไม่โหลดซ้ำจาก app.MODEL_PATH)
+    app.init_runtime()
+    app.model = model
+    app.renderer = app.AnnotationRenderer(model.names, rgb=True)
+
+    write_json(out_dir / "model.json", bench_model(model, frames, config, fixed_imgsz, skipped))
+    if not args.skip_app:
+        write_json(out_dir / "app.json", bench_app(frames, config, fixed_imgsz, skipped))
+    if skipped:
+        print(f"[BENCH] ข้าม {len(skipped)} ชุดที่ export แบบ static รับไม่ได้: {', '.join(skipped)}")
+    write_json(
+        out_dir / "system.json",
+        {
+            "model_load_seconds": load_seconds,
+            "peak_rss_mb": peak_rss_mb(),
+            "backend": config["backend"],
+            "model": str(model.artifact_path),
+            "skipped": skipped,
+            "device": config["device"],
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
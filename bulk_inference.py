@@ -0,0 +1,378 @@
+# ------------------------------------
+# ไฟล์: bulk_inference.py
+# ------------------------------------
+"""
+รันโมเดลกับคลังภาพขนาดใหญ่ (หลักแสนภาพ) ด้วยหลาย process
+
+- แบ่งรายการไฟล์เป็น shard ละ --shard-size ภาพ แล้วกระจายให้ worker pool (หนึ่งโมเดลต่อ worker)
+- ในแต่ละ worker มี thread อ่าน/decode JPEG ล่วงหน้า ขณะที่ thread หลักรันโมเดล
+- ผลของแต่ละ shard เขียนเป็นไฟล์ JSONL ของตัวเอง และบันทึกความคืบหน้าไว้ใน manifest.json
+  ถ้ารันค้างกลางทาง สั่งคำสั่งเดิมอีกครั้งจะข้าม shard ที่เสร็จแล้ว
+- จบแล้วรวมทุก shard เป็น detections.jsonl + summary.json
+
+ตัวอย่าง:
+    python bulk_inference.py --source D:/captures --out artifacts/bulk/captures --workers 4
+    python bulk_inference.py --out artifacts/bulk/captures --merge-only
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import cv2
+
+from inference_backends import (
+    SUPPORTED_BACKENDS,
+    load_inference_config,
+    load_model,
+    resolve_model_path,
+    supports_dynamic_shapes,
+)
+from result_cache import result_to_array, weights_fingerprint
+
+
+IMAGE_SUFFIXES = {".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+MANIFEST_NAME = "manifest.json"
+
+# โมเดลของ worker process นี้ (โหลดครั้งเดียวใน _init_worker)
+_worker_model = None
+_worker_options = None
+
+
+def list_images(source):
+    """รายการไฟล์ภาพทั้งหมดใต้ source (เรียงตาม path เพื่อให้แบ่ง shard ได้เหมือนเดิมทุกครั้ง)"""
+    source = Path(source)
+    if source.is_file():
+        return [str(source)]
+    files = []
+    for root, _, names in os.walk(source):
+        files.extend(os.path.join(root, name) for name in names if Path(name).suffix.lower() in IMAGE_SUFFIXES)
+    return sorted(files)
+
+
+def _write_json_atomic(path, data):
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _run_signature(files, args, model_path):
+    """
+    ค่าที่ต้องตรงกันจึงจะ resume ต่อจากรอบก่อนได้
+    model_path = ไฟล์ที่โหลดจริงจาก resolve_model_path (export หรือโมเดล INT8 เมื่อเปิด prefer_quantized)
+    เทียบด้วย hash ของเนื้อไฟล์ (dvc pull / checkout เปลี่ยน mtime แต่ไม่เปลี่ยนโมเดล)
+    shard ของรอบเดียวกันจึงมาจากโมเดลเดียวกันเสมอ (ไม่ปน FP32 กับ INT8)
+    """
+    listing = hashlib.sha1("\n".join(files).encode("utf-8")).hexdigest()
+    return {
+        "source": str(args.source),
+        "files": len(files),
+        "files_sha1": listing,
+        "shard_size": args.shard_size,
+        "weights": str(args.weights),
+        "model": str(model_path),
+        "model_sha1": weights_fingerprint(model_path),
+        "backend": args.backend,
+        "imgsz": args.imgsz,
+        "conf": args.conf,
+        "iou": args.iou,
+    }
+
+
+def prepare_run(args, model_path):
+    """
+    สร้าง (หรือเปิดต่อ) โฟลเดอร์ของรอบนี้: รายการไฟล์ของแต่ละ shard + manifest
+    คืนค่า manifest
+    """
+    out_dir = Path(args.out)
+    shard_dir = out_dir / "shards"
+    manifest_path = out_dir / MANIFEST_NAME
+
+    files = list_images(args.source)
+    if not files:
+        print(f"ไม่พบไฟล์ภาพใน: {args.source}", file=sys.stderr)
+        sys.exit(1)
+    signature = _run_signature(files, args, model_path)
+
+    if manifest_path.exists() and not args.restart:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest["signature"] != signature:
+            print(
+                "manifest เดิมไม่ตรงกับค่าปัจจุบัน (ไฟล์ภาพ/weights/พารามิเตอร์เปลี่ยน) "
+                "ใช้ --restart เพื่อเริ่มใหม่ หรือเปลี่ยน --out",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        done = sum(1 for shard in manifest["shards"] if shard["status"] == "done")
+        print(f"[BULK] resume: เสร็จแล้ว {done}/{len(manifest['shards'])} shards")
+        return manifest
+
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    shards = []
+    for index, start in enumerate(range(0, len(files), args.shard_size)):
+        shard_id = f"shard-{index:05d}"
+        chunk = files[start:start + args.shard_size]
+        (shard_dir / f"{shard_id}.txt").write_text("\n".join(chunk), encoding="utf-8")
+        shards.append({"id": shard_id, "images": len(chunk), "status": "pending"})
+    manifest = {"signature": signature, "shards": shards, "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+    _write_json_atomic(manifest_path, manifest)
+    print(f"[BULK] {len(files)} ภาพ -> {len(shards)} shards ({args.shard_size} ภาพ/shard)")
+    return manifest
+
+
+def _init_worker(weights, backend, options, threads):
+    """เรียกครั้งเดียวต่อ worker process: จำกัดจำนวน thread แล้วโหลดโมเดล"""
+    global _worker_model, _worker_options
+    cv2.setNumThreads(1)
+    if threads:
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _worker_model = load_model(weights, backend)
+    _worker_options = options
+
+
+def _prefetch(paths, out_queue, stop):
+    """thread อ่าน + decode ภาพล่วงหน้า (cv2.imread ปล่อย GIL จึงทำงานซ้อนกับโมเดลได้จริง)"""
+    for path in paths:
+        if stop.is_set():
+            break
+        out_queue.put((path, cv2.imread(path, cv2.IMREAD_COLOR)))
+    out_queue.put(None)
+
+
+def _detections(data, names):
+    return [
+        {
+            "class_id": int(row[-1]),
+            "class_name": names.get(int(row[-1]), str(int(row[-1]))),
+            "confidence": round(float(row[-2]), 4),
+            "box": [round(float(v), 1) for v in row[:4]],
+        }
+        for row in data
+    ]
+
+
+def process_shard(task):
+    """
+    รันโมเดลกับทุกภาพใน shard หนึ่ง เขียนผลลง <shard>.jsonl (ผ่านไฟล์ชั่วคราว)
+    คืนสรุปของ shard
+    """
+    shard_id, list_path, out_path = task
+    options = _worker_options
+    paths = Path(list_path).read_text(encoding="utf-8").splitlines()
+    prefetched = queue.Queue(maxsize=options["prefetch"])
+    stop = threading.Event()
+    reader = threading.Thread(target=_prefetch, args=(paths, prefetched, stop), daemon=True)
+    reader.start()
+
+    start = time.perf_counter()
+    images = boxes = failed = 0
+    class_counts = {}
+    tmp_path = Path(f"{out_path}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as fp:
+            finished = False
+            while not finished:
+                batch = []
+                while len(batch) < options["batch"]:
+                    item = prefetched.get()
+                    if item is None:
+                        finished = True
+                        break
+                    path, image = item
+                    if image is None:
+                        failed += 1
+                        fp.write(json.dumps({"image": path, "error": "decode failed"}, ensure_ascii=False) + "\n")
+                        continue
+                    batch.append(item)
+                if not batch:
+                    continue
+                results = _worker_model(
+                    [image for _, image in batch],
+                    imgsz=options["imgsz"],
+                    conf=options["conf"],
+                    iou=options["iou"],
+                    device=options["device"],
+                    verbose=False,
+                )
+                for (path, _), result in zip(batch, results):
+                    data, shape = result_to_array(result)
+                    images += 1
+                    boxes += len(data)
+                    for cid in data[:, -1].astype(int).tolist():
+                        class_counts[cid] = class_counts.get(cid, 0) + 1
+                    record = {"image": path, "height": shape[0], "width": shape[1], "detections": _detections(data, result.names)}
+                    fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, out_path)
+    finally:
+        stop.set()
+        # ให้ reader thread ที่รอ put อยู่ได้จบ
+        while reader.is_alive():
+            try:
+                prefetched.get_nowait()
+            except queue.Empty:
+                reader.join(0.05)
+        tmp_path.unlink(missing_ok=True)
+    return {
+        "id": shard_id,
+        "processed": images,
+        "failed": failed,
+        "boxes": boxes,
+        "class_counts": {str(k): v for k, v in class_counts.items()},
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run_shards(manifest, args, model_path):
+    out_dir = Path(args.out)
+    shard_dir = out_dir / "shards"
+    manifest_path = out_dir / MANIFEST_NAME
+    pending = [
+        (shard["id"], str(shard_dir / f"{shard['id']}.txt"), str(shard_dir / f"{shard['id']}.jsonl"))
+        for shard in manifest["shards"]
+        if shard["status"] != "done" or not (shard_dir / f"{shard['id']}.jsonl").exists()
+    ]
+    if not pending:
+        print("[BULK] ทุก shard เสร็จแล้ว")
+        return
+
+    workers = max(1, min(args.workers, len(pending)))
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    options = dict(
+        imgsz=args.imgsz,
+        conf=args.conf,
+        iou=args.iou,
+        device=args.device,
+        batch=args.batch,
+        prefetch=args.prefetch,
+    )
+    by_id = {shard["id"]: shard for shard in manifest["shards"]}
+    total_images = sum(by_id[shard_id]["images"] for shard_id, _, _ in pending)
+    print(f"[BULK] รัน {len(pending)} shards ({total_images} ภาพ) ด้วย {workers} workers x {threads} threads")
+
+    start = time.perf_counter()
+    done_images = 0
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(str(model_path), args.backend, options, threads),
+    ) as pool:
+        for summary in pool.imap_unordered(process_shard, pending):
+            shard = by_id[summary["id"]]
+            shard.update(summary, status="done")
+            _write_json_atomic(manifest_path, manifest)
+            done_images += shard["images"]
+            elapsed = time.perf_counter() - start
+            print(
+                f"[BULK] {summary['id']} เสร็จ ({summary['processed']} ภาพ, {summary['seconds']:.1f}s) "
+                f"รวม {done_images}/{total_images} ภาพ, {done_images / elapsed:.1f} ภาพ/วินาที"
+            )
+
+
+def merge_shards(manifest, args):
+    """รวม JSONL ของทุก shard (เรียงตาม shard) และเขียน summary.json"""
+    out_dir = Path(args.out)
+    shard_dir = out_dir / "shards"
+    unfinished = [shard["id"] for shard in manifest["shards"] if shard["status"] != "done"]
+    if unfinished:
+        print(f"[BULK] ยังมี shard ที่ไม่เสร็จ {len(unfinished)} shards - ข้ามการรวมผล", file=sys.stderr)
+        return False
+
+    merged_path = out_dir / "detections.jsonl"
+    tmp_path = merged_path.with_name(f"{merged_path.name}.tmp")
+    with tmp_path.open("wb") as out:
+        for shard in manifest["shards"]:
+            with (shard_dir / f"{shard['id']}.jsonl").open("rb") as fp:
+                while True:
+                    chunk = fp.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+    os.replace(tmp_path, merged_path)
+
+    class_counts = {}
+    for shard in manifest["shards"]:
+        for cid, count in shard.get("class_counts", {}).items():
+            class_counts[cid] = class_counts.get(cid, 0) + count
+    busy_seconds = sum(shard.get("seconds", 0.0) for shard in manifest["shards"])
+    processed = sum(shard.get("processed", 0) for shard in manifest["shards"])
+    summary = {
+        "images": processed,
+        "failed": sum(shard.get("failed", 0) for shard in manifest["shards"]),
+        "boxes": sum(shard.get("boxes", 0) for shard in manifest["shards"]),
+        "class_counts": dict(sorted(class_counts.items(), key=lambda item: int(item[0]))),
+        "worker_images_per_second": processed / busy_seconds if busy_seconds else 0.0,
+        "signature": manifest["signature"],
+    }
+    _write_json_atomic(out_dir / "summary.json", summary)
+    print(f"[BULK] รวมผลแล้ว: {merged_path} ({summary['images']} ภาพ, {summary['boxes']} กล่อง)")
+    return True
+
+
+def parse_args():
+    config = load_inference_config()
+    parser = argparse.ArgumentParser(description="Sharded multi-process bulk inference with resume")
+    parser.add_argument("--source", help="Image file or directory (searched recursively)")
+    parser.add_argument("--out", required=True, help="Run directory (manifest, shard outputs, merged results)")
+    parser.add_argument("--weights", default=config["weights"], help="Path to trained weights (.pt)")
+    parser.add_argument("--backend", default=config["backend"], choices=SUPPORTED_BACKENDS, help="Inference runtime")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per worker (0 = cores / workers)")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Images per shard (unit of resume)")
+    parser.add_argument("--batch", type=int, default=4, help="Images per model call inside a worker (static-shape exports run 1)")
+    parser.add_argument("--prefetch", type=int, default=16, help="Decoded images buffered per worker")
+    parser.add_argument("--imgsz", type=int, default=config["imgsz"], help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.45, help="Confidence threshold")
+    parser.add_argument("--iou", type=float, default=0.6, help="IoU threshold for NMS")
+    parser.add_argument("--device", default=config["device"], help="Device (e.g. 'cpu', 'cuda:0')")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing manifest and start over")
+    parser.add_argument("--merge-only", action="store_true", help="Only merge finished shard outputs")
+    args = parser.parse_args()
+    if not args.merge_only and not args.source:
+        parser.error("--source is required unless --merge-only is given")
+    return args
+
+
+def main():
+    args = parse_args()
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if args.merge_only:
+        manifest = json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+        merge_shards(manifest, args)
+        return
+
+    if not Path(args.weights).exists():
+        print(f"ไม่พบไฟล์ weights: {args.weights}", file=sys.stderr)
+        sys.exit(1)
+    # export (ถ้าใช้ onnx/openvino/torchscript) ครั้งเดียวใน process หลัก ไม่ให้ worker แย่งกัน export
+    model_path = resolve_model_path(args.weights, args.backend)
+    if args.batch > 1 and not supports_dynamic_shapes(model_path):
+        print(
+            f"[BULK] {model_path} เป็น export แบบ static shape รับได้ทีละ 1 ภาพ ใช้ --batch 1 "
+            "(ตั้ง inference.dynamic: true แล้ว export ใหม่เพื่อรัน batch ใหญ่ขึ้น)"
+        )
+        args.batch = 1
+    manifest = prepare_run(args, model_path)
+    try:
+        run_shards(manifest, args, model_path)
+    except KeyboardInterrupt:
+        print("[BULK] หยุดกลางทาง - รันคำสั่งเดิมอีกครั้งเพื่อทำ shard ที่เหลือต่อ")
+        sys.exit(130)
+    merge_shards(manifest, args)
+
+
+if __name__ == "__main__":
+    main()
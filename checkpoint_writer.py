@@ -0,0 +1,167 @@
+# ------------------------------------
+# ไฟล์: checkpoint_writer.py
+# ------------------------------------
+"""
+เขียน checkpoint ระหว่างเทรนแบบ background สำหรับ train.py
+
+save_period: 1 ทำให้ทุก epoch ต้องรอ torch.save + เขียนไฟล์ yolo12m ขนาดใหญ่หลายไฟล์ (last / best / epochN)
+- thread ที่เทรนแค่ทำ snapshot (deepcopy ของ state) แล้วส่งเข้า queue ส่วน serialize + เขียนดิสก์ทำใน worker thread
+- serialize ครั้งเดียวแล้วเขียน bytes เดียวกันลงทุกไฟล์ เขียนผ่านไฟล์ชั่วคราวแล้ว rename (ไฟล์ไม่ขาดครึ่งถ้าโปรแกรมหยุดกลางทาง)
+- queue จำกัด 1 snapshot (ถือ state ในหน่วยความจำไม่เกินสองชุด) ถ้าเขียนไม่ทันจะรอเฉพาะตอนนั้นและบันทึกเวลาที่รอ
+- retention: เก็บ epochN.pt ล่าสุด keep_last ไฟล์ ส่วน last.pt / best.pt เก็บเสมอ
+- บันทึกเวลา serialize / เขียน / เวลาที่ loop เทรนต้องรอ ของทุก epoch เป็น JSON
+"""
+import atexit
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+
+
+_EPOCH_FILE = re.compile(r"^epoch(\d+)\.pt$")
+
+
+class AsyncCheckpointWriter:
+    """
+    wdir: โฟลเดอร์ weights ของ run (runs/detect/<name>/weights)
+    keep_last: จำนวน epochN.pt ที่เก็บไว้ (0 = เก็บทั้งหมด)
+    report_path: ไฟล์ JSON สำหรับเวลาเขียน checkpoint ต่อ epoch (None = ไม่เขียน)
+    """
+
+    def __init__(self, wdir, keep_last=3, report_path=None):
+        self.wdir = Path(wdir)
+        self.keep_last = max(0, int(keep_last))
+        self.report_path = Path(report_path) if report_path else None
+        self._queue = queue.Queue(maxsize=1)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.records = []
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._worker, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, epoch, checkpoint, targets, snapshot_seconds=0.0):
+        """
+        checkpoint: dict ที่ snapshot แล้ว (ห้ามอ้างถึง object ที่ loop เทรนยังแก้ต่อ)
+        targets: path ที่จะเขียน bytes ชุดเดียวกันลงไป
+        snapshot_seconds: เวลาที่ thread เทรนใช้ทำ snapshot (บันทึกรวมกับเวลาที่รอ queue)
+        คืนเวลาที่ต้องรอ queue (วินาที) ปกติเป็น 0
+        """
+        if self._thread is None:
+            self.start()
+        record = {"epoch": epoch, "snapshot_seconds": snapshot_seconds, "wait_seconds": 0.0}
+        with self._lock:
+            self.records.append(record)
+        start = time.perf_counter()
+        self._queue.put((epoch, checkpoint, [Path(p) for p in targets]))
+        wait = time.perf_counter() - start
+        with self._lock:
+            record["wait_seconds"] = wait
+        return wait
+
+    def flush(self):
+        """รอจน checkpoint ที่ค้างอยู่ถูกเขียนครบ (เรียกก่อนอ่าน last.pt / best.pt)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._write_report()
+
+    def stats(self):
+        with self._lock:
+            return self._stats_unlocked()
+
+    def _record(self, epoch, **values):
+        with self._lock:
+            for record in reversed(self.records):
+                if record["epoch"] == epoch:
+                    record.update(values)
+                    return
+            self.records.append({"epoch": epoch, **values})
+
+    def _write_atomic(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with tmp_path.open("wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+
+    def _apply_retention(self):
+        if not self.keep_last:
+            return
+        epochs = []
+        for path in self.wdir.glob("epoch*.pt"):
+            match = _EPOCH_FILE.match(path.name)
+            if match:
+                epochs.append((int(match.group(1)), path))
+        for _, path in sorted(epochs)[:-self.keep_last]:
+            try:
+                path.unlink()
+            except OSError as ex:
+                print(f"[CKPT] ลบ {path.name} ไม่ได้: {ex}")
+
+    def _write_report(self):
+        if self.report_path is None:
+            return
+        with self._lock:
+            report = {**self._stats_unlocked(), "keep_last": self.keep_last, "epochs": list(self.records)}
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        self.report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    def _stats_unlocked(self):
+        written = [r for r in self.records if "write_seconds" in r]
+        blocked = sum(r.get("snapshot_seconds", 0.0) + r.get("wait_seconds", 0.0) for r in self.records)
+        return {
+            "checkpoints": len(written),
+            "errors": self.errors,
+            "mean_write_seconds": sum(r["serialize_seconds"] + r["write_seconds"] for r in written) / len(written)
+            if written
+            else 0.0,
+            "total_blocked_seconds": blocked,
+        }
+
+    def _worker(self):
+        import torch
+
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                epoch, checkpoint, targets = item
+                start = time.perf_counter()
+                buffer = io.BytesIO()
+                torch.save(checkpoint, buffer)
+                data = buffer.getvalue()
+                serialized = time.perf_counter()
+                for path in targets:
+                    self._write_atomic(path, data)
+                self._apply_retention()
+                self._record(
+                    epoch,
+                    serialize_seconds=serialized - start,
+                    write_seconds=time.perf_counter() - serialized,
+                    mb=len(data) / (1024 * 1024),
+                    files=[p.name for p in targets],
+                )
+                self._write_report()
+            except Exception as ex:
+                with self._lock:
+                    self.errors += 1
+                print(f"[CKPT] เขียน checkpoint ไม่สำเร็จ: {ex}")
+            finally:
+                self._queue.task_done()
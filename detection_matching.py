@@ -0,0 +1,244 @@
+# ------------------------------------
+# ไฟล์: detection_matching.py
+# ------------------------------------
+"""
+จับคู่ผลตรวจจับกับ ground truth และคำนวณ precision / recall / AP ด้วย NumPy ล้วน
+(ไม่ต้องโหลดโมเดลหรือ torch) ใช้กับผลที่บันทึกไว้แล้ว เช่นใน threshold_sweep.py
+
+กติกาเหมือน ultralytics val:
+- ทำนายถูก (TP) เมื่อคลาสตรงและ IoU >= เกณฑ์ วัดทุกเกณฑ์ 0.50:0.95 (10 ระดับ) พร้อมกัน
+- จับคู่แบบ greedy ตาม IoU สูงสุด หนึ่ง ground truth ต่อหนึ่งผลทำนาย
+- AP แบบ COCO (interpolate 101 จุด) ค่า precision / recall ของแต่ละคลาสเลือกที่ conf ที่ให้ F1 เฉลี่ยสูงสุด
+
+box ทุกตัวเป็นพิกเซลแบบ (x1, y1, x2, y2)
+"""
+import numpy as np
+
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU ของทุกคู่ (N, 4) x (M, 4) -> (N, M)"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def nms(boxes, scores, classes, iou_threshold):
+    """
+    NMS แยกตามคลาส (เหมือน agnostic=False ของ ultralytics) คืน index ที่เก็บไว้ เรียงตาม score มากไปน้อย
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # เลื่อน box ของแต่ละคลาสออกจากกันจนไม่ทับกัน แล้วทำ NMS รอบเดียว
+    offsets = np.asarray(classes, dtype=np.float32)[:, None] * (float(np.max(boxes)) + 1.0)
+    shifted = np.asarray(boxes, dtype=np.float32) + offsets
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        ious = box_iou(shifted[best:best + 1], shifted[order[1:]])[0]
+        order = order[1:][ious <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def match_predictions(pred_boxes, pred_cls, gt_boxes, gt_cls, iou_thresholds=IOU_THRESHOLDS):
+    """
+    ผลทำนายของภาพหนึ่งภาพเทียบกับ ground truth ของภาพเดียวกัน
+    คืน bool (N, len(iou_thresholds)) ว่าผลทำนายแต่ละตัวเป็น TP ที่เกณฑ์ IoU นั้นหรือไม่
+    """
+    correct = np.zeros((len(pred_boxes), len(iou_thresholds)), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return correct
+    iou = box_iou(gt_boxes, pred_boxes)
+    iou *= np.asarray(gt_cls)[:, None] == np.asarray(pred_cls)[None, :]
+    for i, threshold in enumerate(iou_thresholds):
+        gt_index, pred_index = np.nonzero(iou >= threshold)
+        if gt_index.size == 0:
+            continue
+        # คู่ที่ IoU สูงสุดได้ก่อน แล้วตัดผลทำนาย / ground truth ที่ถูกใช้ไปแล้ว
+        order = np.argsort(-iou[gt_index, pred_index], kind="stable")
+        gt_index, pred_index = gt_index[order], pred_index[order]
+        _, first = np.unique(pred_index, return_index=True)
+        first.sort()
+        gt_index, pred_index = gt_index[first], pred_index[first]
+        _, first = np.unique(gt_index, return_index=True)
+        correct[pred_index[first], i] = True
+    return correct
+
+
+def compute_ap(recall, precision):
+    """AP จาก recall / precision ที่เรียงตาม conf มากไปน้อย (interpolate 101 จุดแบบ COCO)"""
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    x = np.linspace(0, 1, 101)
+    return float(_trapezoid(np.interp(x, mrec, mpre), x))
+
+
+def ap_per_class(tp, conf, pred_cls, gt_counts):
+    """
+    tp: bool (N, T) จาก match_predictions ของทุกภาพรวมกัน, conf / pred_cls: (N,)
+    gt_counts: จำนวน ground truth ของแต่ละคลาส (nc,)
+
+    คืน dict: ap (nc, T), precision / recall / f1 (nc,) ที่ conf ซึ่งให้ F1 เฉลี่ยสูงสุด,
+    conf (ค่านั้น), present (คลาสที่มี ground truth ใช้เฉลี่ยเป็นค่ารวม)
+    """
+    tp = np.asarray(tp, dtype=bool).reshape(len(conf), -1)
+    conf = np.asarray(conf, dtype=np.float32)
+    pred_cls = np.asarray(pred_cls, dtype=np.int64)
+    gt_counts = np.asarray(gt_counts, dtype=np.int64)
+    order = np.argsort(-conf, kind="stable")
+    tp, conf, pred_cls = tp[order], conf[order], pred_cls[order]
+
+    nc, levels = len(gt_counts), tp.shape[1]
+    x = np.linspace(0, 1, 1000)
+    ap = np.zeros((nc, levels))
+    p_curve = np.zeros((nc, x.size))
+    r_curve = np.zeros((nc, x.size))
+    for c in range(nc):
+        mask = pred_cls == c
+        if gt_counts[c] == 0 or not mask.any():
+            continue
+        tpc = tp[mask].cumsum(axis=0)
+        fpc = (~tp[mask]).cumsum(axis=0)
+        recall = tpc / (gt_counts[c] + 1e-16)
+        precision = tpc / (tpc + fpc)
+        # curve ตาม conf (conf ลดลง -> ใช้ค่าลบให้ np.interp ได้ลำดับเพิ่มขึ้น)
+        r_curve[c] = np.interp(-x, -conf[mask], recall[:, 0], left=0)
+        p_curve[c] = np.interp(-x, -conf[mask], precision[:, 0], left=1)
+        for j in range(levels):
+            ap[c, j] = compute_ap(recall[:, j], precision[:, j])
+
+    present = gt_counts > 0
+    f1_curve = 2 * p_curve * r_curve / (p_curve + r_curve + 1e-16)
+    best = int(f1_curve[present].mean(axis=0).argmax()) if present.any() else 0
+    return {
+        "ap": ap,
+        "precision": p_curve[:, best],
+        "recall": r_curve[:, best],
+        "f1": f1_curve[:, best],
+        "conf": float(x[best]),
+        "present": present,
+    }
+
+
+def summarize_ap(stats):
+    """ค่ารวม (เฉลี่ยคลาสที่มี ground truth) จากผลของ ap_per_class"""
+    present = stats["present"]
+    if not present.any():
+        return {"precision": 0.0, "recall": 0.0, "map50": 0.0, "map50_95": 0.0}
+    return {
+        "precision": float(stats["precision"][present].mean()),
+        "recall": float(stats["recall"][present].mean()),
+        "map50": float(stats["ap"][present, 0].mean()),
+        "map50_95": float(stats["ap"][present].mean()),
+    }
+
+
+class DetectionAccumulator:
+    """
+    สะสมผลจับคู่ทีละภาพโดยไม่เก็บผลทำนายรายตัว (หน่วยความจำคงที่ไม่ว่า split จะใหญ่แค่ไหน)
+
+    - TP / จำนวนผลทำนาย ต่อคลาส แยกตามช่วง conf (bins ช่อง) ทุกเกณฑ์ IoU
+    - จำนวน ground truth ต่อคลาส
+    - confusion matrix แบบ ultralytics (แถว = คลาสที่ทำนาย, คอลัมน์ = คลาสจริง, index nc = background)
+
+    AP คำนวณจาก curve ที่ความละเอียด 1/bins ของ conf ต่างจากแบบเก็บทุกผลทำนายน้อยมาก
+    """
+
+    def __init__(self, nc, bins=1000, iou_thresholds=IOU_THRESHOLDS, matrix_conf=0.25, matrix_iou=0.45):
+        self.nc = int(nc)
+        self.bins = int(bins)
+        self.iou_thresholds = np.asarray(iou_thresholds)
+        self.matrix_conf = matrix_conf
+        self.matrix_iou = matrix_iou
+        self.tp = np.zeros((self.nc, self.bins, len(self.iou_thresholds)), dtype=np.int64)
+        self.count = np.zeros((self.nc, self.bins), dtype=np.int64)
+        self.gt_counts = np.zeros(self.nc, dtype=np.int64)
+        self.matrix = np.zeros((self.nc + 1, self.nc + 1), dtype=np.int64)
+        self.images = 0
+
+    def update(self, pred_boxes, pred_conf, pred_cls, gt_boxes, gt_cls):
+        """ผลทำนายและ ground truth ของภาพหนึ่งภาพ (คลาสที่อยู่นอก 0..nc-1 จะถูกข้าม)"""
+        pred_boxes = np.asarray(pred_boxes, dtype=np.float32).reshape(-1, 4)
+        pred_conf = np.asarray(pred_conf, dtype=np.float32).reshape(-1)
+        pred_cls = np.asarray(pred_cls, dtype=np.int64).reshape(-1)
+        gt_boxes = np.asarray(gt_boxes, dtype=np.float32).reshape(-1, 4)
+        gt_cls = np.asarray(gt_cls, dtype=np.int64).reshape(-1)
+        valid = (pred_cls >= 0) & (pred_cls < self.nc)
+        pred_boxes, pred_conf, pred_cls = pred_boxes[valid], pred_conf[valid], pred_cls[valid]
+        valid = (gt_cls >= 0) & (gt_cls < self.nc)
+        gt_boxes, gt_cls = gt_boxes[valid], gt_cls[valid]
+
+        correct = match_predictions(pred_boxes, pred_cls, gt_boxes, gt_cls, self.iou_thresholds)
+        bin_index = np.clip((pred_conf * self.bins).astype(np.int64), 0, self.bins - 1)
+        np.add.at(self.count, (pred_cls, bin_index), 1)
+        np.add.at(self.tp, (pred_cls, bin_index), correct)
+        self.gt_counts += np.bincount(gt_cls, minlength=self.nc)
+        self._update_matrix(pred_boxes, pred_conf, pred_cls, gt_boxes, gt_cls)
+        self.images += 1
+
+    def _update_matrix(self, pred_boxes, pred_conf, pred_cls, gt_boxes, gt_cls):
+        keep = pred_conf >= self.matrix_conf
+        pred_boxes, pred_cls = pred_boxes[keep], pred_cls[keep]
+        background = self.nc
+        matched_pred = np.zeros(len(pred_cls), dtype=bool)
+        matched_gt = np.zeros(len(gt_cls), dtype=bool)
+        if len(pred_cls) and len(gt_cls):
+            iou = box_iou(gt_boxes, pred_boxes)
+            gt_index, pred_index = np.nonzero(iou > self.matrix_iou)
+            order = np.argsort(-iou[gt_index, pred_index], kind="stable")
+            for g, p in zip(gt_index[order], pred_index[order]):
+                if matched_gt[g] or matched_pred[p]:
+                    continue
+                matched_gt[g] = matched_pred[p] = True
+                self.matrix[pred_cls[p], gt_cls[g]] += 1
+        np.add.at(self.matrix, (np.full((~matched_gt).sum(), background), gt_cls[~matched_gt]), 1)
+        np.add.at(self.matrix, (pred_cls[~matched_pred], np.full((~matched_pred).sum(), background)), 1)
+
+    def curves(self):
+        """
+        precision / recall (nc, bins, T) เมื่อตัดที่ conf = ขอบล่างของแต่ละช่อง และจำนวนผลที่เหลือ (nc, bins)
+        """
+        tp_cum = np.flip(np.cumsum(np.flip(self.tp, axis=1), axis=1), axis=1)
+        kept = np.flip(np.cumsum(np.flip(self.count, axis=1), axis=1), axis=1)
+        precision = np.where(kept[..., None] > 0, tp_cum / np.maximum(kept, 1)[..., None], 1.0)
+        recall = tp_cum / np.maximum(self.gt_counts, 1)[:, None, None]
+        return precision, recall, kept
+
+    def results(self):
+        """ผลรูปแบบเดียวกับ ap_per_class()"""
+        precision, recall, kept = self.curves()
+        levels = len(self.iou_thresholds)
+        ap = np.zeros((self.nc, levels))
+        present = self.gt_counts > 0
+        for c in np.flatnonzero(present):
+            # เรียงจาก conf สูงไปต่ำ ใช้เฉพาะช่องที่มีผลทำนายแล้ว
+            points = np.flatnonzero(kept[c] > 0)[::-1]
+            if points.size == 0:
+                continue
+            for j in range(levels):
+                ap[c, j] = compute_ap(recall[c, points, j], precision[c, points, j])
+        f1 = 2 * precision[..., 0] * recall[..., 0] / (precision[..., 0] + recall[..., 0] + 1e-16)
+        f1[~present] = 0.0
+        best = int(f1[present].mean(axis=0).argmax()) if present.any() else 0
+        return {
+            "ap": ap,
+            "precision": precision[:, best, 0],
+            "recall": recall[:, best, 0],
+            "f1": f1[:, best],
+            "conf": best / self.bins,
+            "present": present,
+        }
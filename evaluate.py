@@ -4,8 +4,11 @@ import os
 import sys
 from pathlib import Path
 
+import numpy as np
 import yaml
-from ultralytics import YOLO
+
+from inference_backends import SUPPORTED_BACKENDS, artifact_backend, load_inference_config, load_model
+from result_cache import weights_fingerprint
 
 try:
     from train import summarize_evaluation
@@ -30,8 +33,18 @@ DEFAULT_EVAL_CONFIG = {
     "device": None,
     "weights": "artifacts/models/waste-sorter-best.pt",
     "metrics_out": "artifacts/eval/metrics.json",
+    "backend": None,
+    "streaming": False,   # True = ประเมินทีละ batch หน่วยความจำคงที่ (stream_eval.py) แทน model.val
+    "plots": True,
+    # ผลทำนายดิบ (ก่อนตัดด้วย conf) สำหรับ threshold_sweep.py เก็บครั้งเดียวต่อ weights
+    "raw_predictions": True,
+    "raw_dir": "artifacts/eval/raw",
+    "raw_conf": 0.001,
+    "raw_iou": 0.9,
 }
 
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
 
 def load_eval_config():
     params_path = Path("params.yaml")
@@ -40,6 +53,8 @@ def load_eval_config():
         with params_path.open("r", encoding="utf-8") as fp:
             params = yaml.safe_load(fp) or {}
         config.update(params.get("evaluate", {}))
+    if not config.get("backend"):
+        config["backend"] = load_inference_config()["backend"]
     return config
 
 
@@ -93,11 +108,52 @@ def parse_args():
         default=defaults["iou"],
         help="IoU threshold for NMS",
     )
+    parser.add_argument(
+        "--backend",
+        default=defaults["backend"],
+        choices=SUPPORTED_BACKENDS,
+        help="Inference runtime (default: inference.backend in params.yaml)",
+    )
     parser.add_argument(
         "--metrics-out",
         default=defaults["metrics_out"],
         help="Path to save evaluation metrics summary (JSON)",
     )
+    parser.add_argument(
+        "--streaming",
+        action=argparse.BooleanOptionalAction,
+        default=defaults["streaming"],
+        help="Evaluate in batches with bounded memory instead of model.val",
+    )
+    parser.add_argument(
+        "--plots",
+        action=argparse.BooleanOptionalAction,
+        default=defaults["plots"],
+        help="Write PR curve / confusion matrix images",
+    )
+    parser.add_argument(
+        "--raw-predictions",
+        action=argparse.BooleanOptionalAction,
+        default=defaults["raw_predictions"],
+        help="Store low-confidence predictions for threshold_sweep.py (once per weights)",
+    )
+    parser.add_argument(
+        "--raw-dir",
+        default=defaults["raw_dir"],
+        help="Directory for stored raw predictions",
+    )
+    parser.add_argument(
+        "--raw-conf",
+        type=float,
+        default=defaults["raw_conf"],
+        help="Confidence floor for stored raw predictions",
+    )
+    parser.add_argument(
+        "--raw-iou",
+        type=float,
+        default=defaults["raw_iou"],
+        help="NMS IoU for stored raw predictions (largest IoU the sweep can use)",
+    )
     return parser.parse_args()
 
 
@@ -116,27 +172,213 @@ def evaluate_model(args):
     print(f"ImageSz : {args.imgsz}")
     print(f"Batch   : {args.batch}")
     print(f"Device  : {args.device or 'auto'}")
+    print(f"Backend : {args.backend}")
+    print(f"Mode    : {'streaming' if args.streaming else 'model.val'}")
     print("-------------------------------------")
 
-    model = YOLO(args.weights)
+    model = load_model(args.weights, args.backend)
 
-    metrics = model.val(
-        data=args.data,
-        split=args.split,
-        imgsz=args.imgsz,
-        batch=args.batch,
-        device=args.device,
-        conf=args.conf,
-        iou=args.iou,
-    )
+    if args.streaming:
+        from perf_metrics import peak_rss_mb
+        from stream_eval import evaluate_streaming
+
+        images = split_images(args.data, args.split)
+        metrics = evaluate_streaming(
+            model,
+            images,
+            read_labels,
+            args,
+            plots=args.plots,
+            save_dir=Path(args.metrics_out or DEFAULT_EVAL_CONFIG["metrics_out"]).parent / "stream",
+        )
+        print(f"[EVAL] {len(images)} ภาพ, {metrics.speed['ms_per_image']:.1f} ms/ภาพ, peak RSS {peak_rss_mb():.0f} MB")
+    else:
+        metrics = model.val(
+            data=args.data,
+            split=args.split,
+            imgsz=args.imgsz,
+            batch=args.batch,
+            device=args.device,
+            conf=args.conf,
+            iou=args.iou,
+            plots=args.plots,
+        )
 
     summarize_evaluation(metrics)
     write_metrics_summary(metrics, args.metrics_out)
+    raw_path = save_raw_predictions(model, args) if args.raw_predictions else None
 
     print("-------------------------------------")
     print(f"Reports saved to: {metrics.save_dir}")
     if args.metrics_out:
         print(f"Saved metrics summary to: {args.metrics_out}")
+    if raw_path:
+        print(f"Raw predictions: {raw_path} (python threshold_sweep.py)")
+
+
+def raw_predictions_path(model_path, split, imgsz, raw_conf, raw_iou, raw_dir=DEFAULT_EVAL_CONFIG["raw_dir"]):
+    """
+    ไฟล์ผลทำนายดิบของโมเดลชุดนี้
+    key = hash ของไฟล์โมเดลที่โหลดจริง (.pt / export / INT8 จาก resolve_model_path) + split + imgsz + raw_conf + raw_iou
+    ground truth ตรวจจาก labels_sha1 ใน meta ตอนใช้ไฟล์เดิม (ดู save_raw_predictions)
+    """
+    fingerprint = weights_fingerprint(model_path)[:16]
+    backend = artifact_backend(model_path)
+    return Path(raw_dir) / f"{fingerprint}_{split}_{imgsz}_{backend}_c{raw_conf:g}_i{raw_iou:g}.npz"
+
+
+def labels_fingerprint(images):
+    """hash ของไฟล์ label ทุกไฟล์ของรายการภาพ (ไฟล์ label เล็ก อ่านทั้งหมดได้เร็ว)"""
+    import hashlib
+
+    from ultralytics.data.utils import img2label_paths
+
+    digest = hashlib.sha1()
+    for image_path, label_path in zip(images, img2label_paths([str(p) for p in images])):
+        digest.update(f"{image_path}\n".encode("utf-8"))
+        try:
+            digest.update(Path(label_path).read_bytes())
+        except OSError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def _cached_raw_meta(path):
+    try:
+        with np.load(path) as npz:
+            return json.loads(str(npz["meta"]))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def split_images(data, split):
+    """รายชื่อภาพของ split ตาม dataset YAML (โฟลเดอร์, รายการโฟลเดอร์ หรือไฟล์ .txt)"""
+    from ultralytics.data.utils import check_det_dataset
+
+    source = check_det_dataset(data)[split]
+    files = []
+    for entry in source if isinstance(source, list) else [source]:
+        entry = Path(entry)
+        if entry.is_dir():
+            files.extend(p for p in entry.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        elif entry.suffix == ".txt":
+            for line in entry.read_text(encoding="utf-8").splitlines():
+                line = line.strip()
+                if line:
+                    path = Path(line)
+                    files.append(path if path.is_absolute() else entry.parent / path)
+    return sorted(files)
+
+
+def read_labels(image_path, shape):
+    """ground truth ของภาพหนึ่งภาพเป็นพิกเซล (cls (M,), xyxy (M, 4)) รองรับ label แบบ polygon"""
+    from ultralytics.data.utils import img2label_paths
+
+    label_path = Path(img2label_paths([str(image_path)])[0])
+    classes, boxes = [], []
+    if label_path.is_file():
+        height, width = shape
+        for line in label_path.read_text(encoding="utf-8").splitlines():
+            values = line.split()
+            if len(values) < 5:
+                continue
+            coords = np.asarray(values[1:], dtype=np.float32)
+            if coords.size == 4:
+                cx, cy, w, h = coords
+                box = [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]
+            else:
+                xs, ys = coords[0::2], coords[1::2]
+                box = [xs.min(), ys.min(), xs.max(), ys.max()]
+            classes.append(int(float(values[0])))
+            boxes.append(np.asarray(box, dtype=np.float32) * [width, height, width, height])
+    return (
+        np.asarray(classes, dtype=np.int16),
+        np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+    )
+
+
+def save_raw_predictions(model, args):
+    """
+    รันโมเดลบน split อีกรอบด้วย conf ต่ำ (raw_conf) แล้วเก็บผลทำนาย + ground truth เป็น .npz ไฟล์เดียว
+    ข้ามถ้ามีไฟล์ของโมเดล/ค่าชุดนี้แล้วและ label ยังเหมือนเดิม
+    threshold_sweep.py ใช้ไฟล์นี้ลองทุก conf / IoU โดยไม่ต้องรันโมเดลซ้ำ
+    """
+    out_path = raw_predictions_path(
+        model.artifact_path, args.split, args.imgsz, args.raw_conf, args.raw_iou, args.raw_dir
+    )
+    images = split_images(args.data, args.split)
+    labels_sha1 = labels_fingerprint(images)
+    if out_path.exists():
+        cached = _cached_raw_meta(out_path) or {}
+        if cached.get("labels_sha1") == labels_sha1 and cached.get("images") == [str(p) for p in images]:
+            print(f"[EVAL] มีผลทำนายดิบของโมเดลนี้แล้ว: {out_path}")
+            return out_path
+        print(f"[EVAL] label / รายการภาพของ {args.split} เปลี่ยน เก็บผลทำนายดิบใหม่: {out_path}")
+
+    print(f"[EVAL] เก็บผลทำนายดิบ {len(images)} ภาพ (conf >= {args.raw_conf}, NMS IoU {args.raw_iou})...")
+    preds = {"image": [], "boxes": [], "conf": [], "cls": []}
+    gts = {"image": [], "boxes": [], "cls": []}
+    shapes = []
+    results = model.predict(
+        source=[str(p) for p in images],
+        stream=True,
+        imgsz=args.imgsz,
+        batch=args.batch,
+        device=args.device,
+        conf=args.raw_conf,
+        iou=args.raw_iou,
+        max_det=300,
+        verbose=False,
+    )
+    for index, (image_path, result) in enumerate(zip(images, results)):
+        shape = tuple(int(v) for v in result.orig_shape)
+        shapes.append(shape)
+        data = result.boxes.data
+        data = (data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)).astype(np.float32)
+        preds["image"].append(np.full(len(data), index, dtype=np.int32))
+        preds["boxes"].append(data[:, :4])
+        preds["conf"].append(data[:, 4])
+        preds["cls"].append(data[:, 5].astype(np.int16))
+        gt_cls, gt_boxes = read_labels(image_path, shape)
+        gts["image"].append(np.full(len(gt_cls), index, dtype=np.int32))
+        gts["boxes"].append(gt_boxes)
+        gts["cls"].append(gt_cls)
+
+    def _concat(parts, dtype, width=None):
+        if parts:
+            return np.concatenate(parts).astype(dtype)
+        return np.zeros((0, width) if width else 0, dtype=dtype)
+
+    meta = {
+        "weights": str(args.weights),
+        "model": str(model.artifact_path),
+        "model_sha1": weights_fingerprint(model.artifact_path),
+        "labels_sha1": labels_sha1,
+        "split": args.split,
+        "imgsz": args.imgsz,
+        "backend": args.backend,
+        "raw_conf": args.raw_conf,
+        "raw_iou": args.raw_iou,
+        "names": {int(k): v for k, v in model.names.items()},
+        "images": [str(p) for p in images],
+    }
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(out_path.stem + ".tmp.npz")
+    np.savez_compressed(
+        tmp_path,
+        image_shapes=np.asarray(shapes, dtype=np.int32).reshape(-1, 2),
+        pred_image=_concat(preds["image"], np.int32),
+        pred_boxes=_concat(preds["boxes"], np.float32, 4),
+        pred_conf=_concat(preds["conf"], np.float32),
+        pred_cls=_concat(preds["cls"], np.int16),
+        gt_image=_concat(gts["image"], np.int32),
+        gt_boxes=_concat(gts["boxes"], np.float32, 4),
+        gt_cls=_concat(gts["cls"], np.int16),
+        meta=np.asarray(json.dumps(meta, ensure_ascii=False)),
+    )
+    os.replace(tmp_path, out_path)
+    print(f"[EVAL] บันทึกผลทำนายดิบ {sum(len(c) for c in preds['conf'])} กล่อง -> {out_path}")
+    return out_path
 
 
 def write_metrics_summary(metrics, output_path):
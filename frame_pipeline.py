@@ -0,0 +1,131 @@
+# ------------------------------------
+# ไฟล์: frame_pipeline.py
+# ------------------------------------
+"""
+Pipeline แบบแยก capture / inference / render สำหรับ stream จาก webcam
+
+- ช่องรับเฟรม (ingest slot) เก็บได้แค่ 1 เฟรม: เฟรมใหม่ทับเฟรมเก่าที่ยังไม่ถูกประมวลผล
+  (latest-frame-wins) และนับเป็นเฟรมที่ถูก drop
+- inference worker รันใน thread แยก ดึงเฟรมล่าสุดไปประมวลผลทีละเฟรม
+- ฝั่ง render (callback ของ Gradio) คืนภาพผลลัพธ์ล่าสุดที่เสร็จแล้วทันทีโดยไม่รอโมเดล
+"""
+import threading
+import time
+
+
+class LatestFrameSlot:
+    """
+    ช่องเก็บเฟรมขนาด 1 ช่อง เฟรมใหม่จะทับเฟรมเดิมที่ยังไม่ถูกหยิบไป
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, frame):
+        """ใส่เฟรมใหม่ คืนค่า True ถ้ามีเฟรมเก่าถูกทับ (drop)"""
+        with self._cond:
+            dropped = self._frame is not None
+            if dropped:
+                self.dropped += 1
+            self._frame = frame
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """รอจนมีเฟรม แล้วหยิบออกจากช่อง (คืน None ถ้า timeout หรือถูกปิด)"""
+        with self._cond:
+            if self._frame is None and not self._closed:
+                self._cond.wait(timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        """เปิดช่องใหม่หลัง close() ทิ้งเฟรมค้าง (ไม่อย่างนั้น get() จะคืนทันทีและ worker วนไม่หยุด)"""
+        with self._cond:
+            self._closed = False
+            self._frame = None
+
+
+class FramePipeline:
+    """
+    รวม ingest slot + inference worker + ผลลัพธ์ล่าสุดสำหรับ render
+
+    infer_fn(frame) -> annotated_frame จะถูกเรียกจาก worker thread เท่านั้น
+    """
+
+    def __init__(self, infer_fn, name="inference-worker"):
+        self._infer_fn = infer_fn
+        self._name = name
+        self._slot = LatestFrameSlot()
+        self._lock = threading.Lock()
+        self._latest = None
+        self._latest_seq = 0
+        self._running = False
+        self._thread = None
+        self.submitted = 0
+        self.processed = 0
+        self.errors = 0
+        self.last_infer_seconds = 0.0
+
+    def start(self):
+        if self._running:
+            return
+        self._slot.reopen()
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name=self._name, daemon=True)
+        self._thread.start()
+        print(f"[PIPELINE] {self._name} เริ่มทำงาน")
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        self._slot.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, frame):
+        """ส่งเฟรมเข้า pipeline (ไม่ block) คืนค่า True ถ้าเฟรมก่อนหน้าถูก drop"""
+        if not self._running:
+            self.start()
+        self.submitted += 1
+        return self._slot.put(frame)
+
+    def latest(self):
+        """คืน (annotated_frame, seq) ล่าสุดที่ประมวลผลเสร็จแล้ว (None ถ้ายังไม่มี)"""
+        with self._lock:
+            return self._latest, self._latest_seq
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self._slot.dropped,
+            "errors": self.errors,
+            "last_infer_ms": self.last_infer_seconds * 1000.0,
+        }
+
+    def _worker(self):
+        while self._running:
+            frame = self._slot.get(timeout=0.5)
+            if frame is None:
+                continue
+            start = time.perf_counter()
+            try:
+                annotated = self._infer_fn(frame)
+            except Exception as ex:
+                self.errors += 1
+                print(f"[PIPELINE] error ระหว่าง inference: {ex}")
+                continue
+            self.last_infer_seconds = time.perf_counter() - start
+            with self._lock:
+                self._latest = annotated
+                self._latest_seq += 1
+            self.processed += 1
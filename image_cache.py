@@ -0,0 +1,233 @@
+# ------------------------------------
+# ไฟล์: image_cache.py
+# ------------------------------------
+"""
+DVC stage: decode และย่อภาพของ dataset ครั้งเดียว แล้วเก็บเป็นไฟล์ uint8 ที่เปิดแบบ memory-map
+
+model.train อ่าน JPEG แล้ว decode + resize ใหม่ทุกภาพทุก epoch (100 epochs = 100 รอบ) บนเครื่องที่เทรนด้วย CPU
+ส่วนนี้กินเวลาเป็นสัดส่วนใหญ่ของแต่ละ epoch ไฟล์ cache นี้ทำให้ train.py อ่านภาพที่ย่อแล้วได้ทันทีโดยไม่ copy
+
+- ย่อแบบเดียวกับ ultralytics (ด้านยาว = imgsz คงสัดส่วน, INTER_LINEAR) ส่วน padding / letterbox
+  และ augmentation ยังทำตอนเทรนตามเดิม จึงได้ภาพเหมือนกันทุก pixel
+- ภาพทุกภาพต่อกันใน <split>_<imgsz>_<hash>.bin + index (.index.npz) เก็บ offset, ขนาดเดิม, ขนาดหลังย่อ
+- key = imgsz + hash ของรายชื่อไฟล์ภาพ (ขนาด + mtime) ถ้า dataset เปลี่ยน cache เก่าจะไม่ถูกใช้และถูกลบตอน build ใหม่
+- label ไม่ต้องเก็บ ultralytics cache label ที่ parse แล้วไว้ในไฟล์ labels/*.cache อยู่แล้ว
+
+    dvc repro image_cache      # หรือ python image_cache.py
+    # แล้วตั้ง train.image_cache: true ใน params.yaml
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+
+DEFAULT_IMAGE_CACHE_CONFIG = {
+    "dir": "artifacts/image_cache",
+    "splits": ["train", "val"],
+    "workers": 8,
+}
+
+
+def load_image_cache_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_IMAGE_CACHE_CONFIG.copy()
+    params = {}
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("image_cache", {}))
+    train = params.get("train", {})
+    config.setdefault("data", train.get("data", "waste-detection/data.yaml"))
+    config.setdefault("imgsz", train.get("imgsz", 640))
+    return config
+
+
+def _normpath(path):
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+def dataset_hash(files, imgsz):
+    """hash ของรายชื่อไฟล์ + ขนาด + mtime (ไม่อ่านเนื้อไฟล์ จึงเร็ว)"""
+    digest = hashlib.sha1(f"imgsz={imgsz}".encode("ascii"))
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f"{_normpath(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_resized(path, imgsz):
+    """อ่านและย่อภาพแบบเดียวกับ BaseDataset.load_image(rect_mode=True) ของ ultralytics"""
+    im = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if im is None:
+        return None
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(im), (h0, w0)
+
+
+def build_split_cache(files, imgsz, prefix, workers=8):
+    """
+    decode ภาพทั้งหมดแบบขนาน (cv2 ปล่อย GIL) แล้วเขียนต่อกันลง prefix.bin ตามลำดับ
+    คืนสถิติ (จำนวนภาพ, ภาพเสีย, ขนาด MB)
+    """
+    prefix.parent.mkdir(parents=True, exist_ok=True)
+    bin_path = prefix.with_suffix(".bin")
+    tmp_path = prefix.with_suffix(".bin.tmp")
+    kept_files, offsets, hw0, hw = [], [], [], []
+    broken = 0
+    offset = 0
+    with tmp_path.open("wb") as fp, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for path, loaded in zip(files, pool.map(lambda p: load_resized(p, imgsz), files)):
+            if loaded is None:
+                broken += 1
+                print(f"[IMGCACHE] อ่านภาพไม่ได้ ข้าม: {path}")
+                continue
+            im, shape0 = loaded
+            fp.write(im.data)
+            kept_files.append(_normpath(path))
+            offsets.append(offset)
+            hw0.append(shape0)
+            hw.append(im.shape[:2])
+            offset += im.nbytes
+    np.savez(
+        prefix.with_suffix(".index.npz"),
+        files=np.asarray(kept_files),
+        offsets=np.asarray(offsets, dtype=np.int64),
+        hw0=np.asarray(hw0, dtype=np.int32).reshape(-1, 2),
+        hw=np.asarray(hw, dtype=np.int32).reshape(-1, 2),
+    )
+    os.replace(tmp_path, bin_path)
+    return {"images": len(kept_files), "broken": broken, "size_mb": offset / (1024 * 1024)}
+
+
+class ImageCache:
+    """
+    อ่านภาพที่ย่อแล้วจากไฟล์ .bin ของหลาย split รวมกัน
+
+    get() คืน view ของ memmap (ไม่ copy) เปิดแบบ copy-on-write ("c") ถ้า augmentation เขียนทับภาพ
+    จะไม่กระทบไฟล์ memmap เปิดเมื่อใช้ครั้งแรกในแต่ละ process (DataLoader worker) และไม่ถูก pickle ไปด้วย
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = [Path(p) for p in prefixes]
+        self._index = {}
+        for part, prefix in enumerate(self.prefixes):
+            with np.load(prefix.with_suffix(".index.npz")) as index:
+                for file, offset, shape0, shape in zip(index["files"], index["offsets"], index["hw0"], index["hw"]):
+                    self._index[str(file)] = (part, int(offset), tuple(int(v) for v in shape0), tuple(int(v) for v in shape))
+        self._data = {}
+
+    @classmethod
+    def open(cls, cache_dir, imgsz):
+        """เปิด cache ทุก split ที่ตรง imgsz และ dataset ยังไม่เปลี่ยน คืน None ถ้าไม่มี"""
+        manifest_path = Path(cache_dir) / "manifest.json"
+        if not manifest_path.is_file():
+            return None
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        prefixes = []
+        for split, entry in manifest.get("splits", {}).items():
+            if int(entry["imgsz"]) != int(imgsz):
+                continue
+            prefix = Path(entry["prefix"])
+            with np.load(prefix.with_suffix(".index.npz")) as index:
+                files = [str(f) for f in index["files"]]
+            try:
+                fresh = dataset_hash(files, imgsz) == entry["kept_hash"]
+            except OSError:
+                fresh = False
+            if fresh and prefix.with_suffix(".bin").is_file():
+                prefixes.append(prefix)
+            else:
+                print(f"[IMGCACHE] cache ของ {split} ไม่ตรงกับ dataset ปัจจุบัน (รัน image_cache.py ใหม่) - ไม่ใช้")
+        return cls(prefixes) if prefixes else None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, file):
+        return _normpath(file) in self._index
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = {}
+        return state
+
+    def get(self, file):
+        """(ภาพ BGR ที่ย่อแล้ว, (h0, w0), (h, w)) หรือ None ถ้าไม่มีใน cache"""
+        entry = self._index.get(_normpath(file))
+        if entry is None:
+            return None
+        part, offset, shape0, shape = entry
+        data = self._data.get(part)
+        if data is None:
+            data = self._data[part] = np.memmap(self.prefixes[part].with_suffix(".bin"), dtype=np.uint8, mode="c")
+        h, w = shape
+        return data[offset:offset + h * w * 3].reshape(h, w, 3), shape0, shape
+
+
+def parse_args():
+    defaults = load_image_cache_config()
+    parser = argparse.ArgumentParser(description="Build a memory-mapped cache of resized training images")
+    parser.add_argument("--data", default=defaults["data"], help="Dataset YAML (default: train.data)")
+    parser.add_argument("--imgsz", type=int, default=defaults["imgsz"], help="Training image size (default: train.imgsz)")
+    parser.add_argument("--splits", nargs="+", default=defaults["splits"], help="Dataset splits to cache")
+    parser.add_argument("--dir", default=defaults["dir"], help="Cache directory")
+    parser.add_argument("--workers", type=int, default=defaults["workers"], help="Decode threads")
+    return parser.parse_args()
+
+
+def main():
+    from evaluate import split_images
+
+    args = parse_args()
+    cache_dir = Path(args.dir)
+    manifest = {"imgsz": args.imgsz, "splits": {}}
+    keep = set()
+    for split in args.splits:
+        files = [str(p) for p in split_images(args.data, split)]
+        if not files:
+            print(f"[IMGCACHE] {split}: ไม่มีภาพ ข้าม")
+            continue
+        key = dataset_hash(files, args.imgsz)
+        prefix = cache_dir / f"{split}_{args.imgsz}_{key[:12]}"
+        keep.update({prefix.with_suffix(".bin").name, prefix.with_suffix(".index.npz").name})
+        if prefix.with_suffix(".bin").is_file() and prefix.with_suffix(".index.npz").is_file():
+            with np.load(prefix.with_suffix(".index.npz")) as index:
+                stats = {"images": len(index["files"]), "broken": len(files) - len(index["files"])}
+            stats["size_mb"] = prefix.with_suffix(".bin").stat().st_size / (1024 * 1024)
+            print(f"[IMGCACHE] {split}: cache ยังตรงกับ dataset ({stats['images']} ภาพ) ไม่ต้อง build ใหม่")
+        else:
+            start = time.perf_counter()
+            stats = build_split_cache(files, args.imgsz, prefix, args.workers)
+            stats["build_seconds"] = time.perf_counter() - start
+            print(
+                f"[IMGCACHE] {split}: {stats['images']} ภาพ, {stats['size_mb']:.0f} MB "
+                f"ใน {stats['build_seconds']:.1f} วินาที"
+            )
+        with np.load(prefix.with_suffix(".index.npz")) as index:
+            kept_hash = dataset_hash([str(f) for f in index["files"]], args.imgsz)
+        manifest["splits"][split] = {"prefix": prefix.as_posix(), "imgsz": args.imgsz, "kept_hash": kept_hash, **stats}
+
+    # ลบ cache ของ dataset / imgsz เดิมที่ไม่ใช้แล้ว
+    for path in cache_dir.glob("*"):
+        if path.is_file() and path.name != "manifest.json" and path.name not in keep:
+            path.unlink()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[IMGCACHE] manifest: {cache_dir / 'manifest.json'}")
+
+
+if __name__ == "__main__":
+    main()
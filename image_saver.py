@@ -0,0 +1,159 @@
+# ------------------------------------
+# ไฟล์: image_saver.py
+# ------------------------------------
+"""
+ระบบบันทึกภาพแบบ background สำหรับ save_detected_image
+
+- ใช้ queue แบบจำกัดขนาด เพื่อไม่ให้ I/O ช้า (เช่น SD card) ไปหน่วงการตรวจจับ
+- drop policy เมื่อ queue เต็ม: "drop_new" (ทิ้งภาพใหม่), "drop_oldest" (ทิ้งภาพเก่าสุด), "block" (รอ)
+- encode JPEG ตามคุณภาพ/ขนาดที่กำหนดใน worker thread
+- สร้างโฟลเดอร์ครั้งเดียวต่อ path และ flush ภาพที่ค้างอยู่ตอนปิดโปรแกรม
+"""
+import atexit
+import queue
+import threading
+from pathlib import Path
+
+import cv2
+
+
+DROP_POLICIES = ("drop_new", "drop_oldest", "block")
+
+
+class AsyncImageSaver:
+    """
+    เขียนภาพลงดิสก์ใน worker thread พร้อมตัวนับ queued / written / dropped / errors
+    """
+
+    def __init__(self, max_queue=16, drop_policy="drop_oldest", jpeg_quality=90, max_side=0):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy ไม่ถูกต้อง: {drop_policy} (รองรับ: {', '.join(DROP_POLICIES)})")
+        self.drop_policy = drop_policy
+        self.jpeg_quality = int(jpeg_quality)
+        self.max_side = int(max_side or 0)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._created_dirs = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="image-saver", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def prepare_dirs(self, directories):
+        """สร้างโฟลเดอร์ทั้งหมดล่วงหน้าครั้งเดียว (เช่น โฟลเดอร์ของทุกคลาส)"""
+        for directory in directories:
+            self._ensure_dir(Path(directory))
+
+    def submit(self, image, path, rgb=False):
+        """
+        ส่งภาพเข้า queue เพื่อบันทึก (ไม่ block ยกเว้น drop_policy="block")
+        rgb=True ถ้าภาพเป็น RGB (แปลงเป็น BGR ใน worker ก่อน encode)
+        ห้ามแก้ไขภาพหลังส่งเข้า queue เพราะ worker อ่านภาพเดิมโดยไม่ copy
+        คืนค่า True ถ้าภาพถูกรับเข้า queue
+        """
+        if self._closed:
+            return False
+        if self._thread is None:
+            self.start()
+        item = (image, Path(path), rgb)
+        if self.drop_policy == "block":
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                if self.drop_policy == "drop_new":
+                    self._count_drop()
+                    return False
+                # drop_oldest: ทิ้งภาพที่รอนานที่สุดแล้วใส่ภาพใหม่แทน
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count_drop()
+                except queue.Empty:
+                    pass
+                try:
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    self._count_drop()
+                    return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "pending": self._queue.qsize(),
+            }
+
+    def flush(self):
+        """รอจนภาพใน queue ถูกเขียนครบ"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout=5.0):
+        """flush ภาพที่ค้างอยู่แล้วหยุด worker"""
+        if self._thread is None or self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+        stats = self.stats()
+        print(f"[SAVE] ปิด image saver: written={stats['written']} dropped={stats['dropped']} errors={stats['errors']}")
+
+    def _count_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _ensure_dir(self, directory):
+        if directory in self._created_dirs:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        self._created_dirs.add(directory)
+
+    def _encode(self, image, rgb=False):
+        if self.max_side:
+            h, w = image.shape[:2]
+            scale = self.max_side / max(h, w)
+            if scale < 1.0:
+                image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        if rgb:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise RuntimeError("cv2.imencode ล้มเหลว")
+        return buffer
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                image, path, rgb = item
+                self._ensure_dir(path.parent)
+                path.write_bytes(self._encode(image, rgb).tobytes())
+                with self._lock:
+                    self.written += 1
+            except Exception as ex:
+                with self._lock:
+                    self.errors += 1
+                print(f"[SAVE] Error saving image: {ex}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,280 @@
+# ------------------------------------
+# ไฟล์: inference_api.py
+# ------------------------------------
+"""
+HTTP API สำหรับระบบอื่นที่ต้องการส่งภาพมาตรวจจับโดยตรง (ไม่ต้องผ่านหน้าเว็บ Gradio)
+
+- ใช้โมเดลตัวเดียวกับแอป (app.ensure_model()) และรวมคำขอเป็น batch ด้วย MicroBatcher จาก inference_server.py
+- รับไฟล์ภาพ (JPEG/PNG) เป็น bytes โดยตรง ไม่มีการแปลง base64 ไปกลับเหมือน gr.Image
+- จำกัดจำนวนภาพที่กำลังประมวลผลพร้อมกัน เกินแล้วตอบ 429 ทันที (ผู้เรียกควร retry ตาม Retry-After)
+- --cache: ภาพที่เคยส่งมาแล้ว (bytes ตรงกัน) ตอบจาก result_cache โดยไม่รันโมเดลซ้ำ
+
+Endpoints:
+    POST /detect         body = ไฟล์ภาพหนึ่งภาพ (Content-Type: image/jpeg หรือ image/png)
+    POST /detect/batch   multipart/form-data หลายไฟล์ในฟิลด์ "files"
+    GET  /health         สถานะ batcher และจำนวนคำขอที่กำลังทำงาน
+    GET  /metrics        metrics แบบ Prometheus (เหมือน perf_metrics)
+
+ตัวอย่าง:
+    python inference_api.py --port 8000 --max-batch 8 --max-inflight 32
+    curl -X POST --data-binary @bottle.jpg -H "Content-Type: image/jpeg" http://localhost:8000/detect
+    curl -F files=@a.jpg -F files=@b.jpg http://localhost:8000/detect/batch
+"""
+import argparse
+import asyncio
+import queue
+import time
+
+import cv2
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+import app
+from inference_server import MicroBatcher, infer_batch
+from inference_backends import artifact_backend
+from perf_metrics import metrics
+from result_cache import ResultCache, hash_bytes, result_to_array
+from voice_guidance import CLASS_NAME_MAP
+
+
+class Saturated(Exception):
+    """จำนวนภาพที่กำลังประมวลผลเต็มแล้ว (ตอบ 429)"""
+
+
+class AdmissionLimiter:
+    """
+    นับจำนวนภาพที่กำลังประมวลผลอยู่ ใช้บน event loop เดียวจึงไม่ต้องมี lock
+    คำขอที่ทำให้เกิน max_inflight จะถูกปฏิเสธทันทีแทนที่จะไปต่อคิวจน timeout
+    """
+
+    def __init__(self, max_inflight=32):
+        self.max_inflight = max(1, int(max_inflight))
+        self.inflight = 0
+        self.rejected = 0
+
+    def acquire(self, n=1):
+        if self.inflight + n > self.max_inflight:
+            self.rejected += 1
+            raise Saturated()
+        self.inflight += n
+
+    def release(self, n=1):
+        self.inflight -= n
+
+
+def decode_image(data):
+    """bytes ของ JPEG/PNG -> ภาพ BGR (None ถ้า decode ไม่ได้)"""
+    if not data:
+        return None
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def detections_to_json(data, orig_shape):
+    """แปลงผลตรวจจับของภาพหนึ่งภาพ (boxes.data, (h, w)) เป็น dict ที่ส่งกลับได้"""
+    height, width = orig_shape
+    detections = [
+        {
+            "class_id": int(row[-1]),
+            "class_name": CLASS_NAME_MAP.get(int(row[-1]), f"unknown_{int(row[-1])}"),
+            "confidence": round(float(row[-2]), 4),
+            "box": [round(float(v), 1) for v in row[:4]],
+        }
+        for row in data
+    ]
+    return {"width": int(width), "height": int(height), "detections": detections}
+
+
+def create_api(batcher, max_inflight=32, max_batch_images=32, submit_timeout=0.0, cache=None):
+    """
+    สร้าง FastAPI app ที่ส่งภาพเข้า batcher
+    max_batch_images: จำนวนภาพสูงสุดต่อคำขอ /detect/batch
+    submit_timeout: เวลาที่ยอมรอเมื่อคิวของ batcher เต็ม (0 = ตอบ 429 ทันที)
+    cache: ResultCache (หรือ None) สำหรับภาพที่เคยส่งมาแล้ว
+    """
+    api = FastAPI(title="AI Waste Sorter - Inference API")
+    limiter = AdmissionLimiter(max_inflight)
+    stream_id = "api"
+
+    def too_busy():
+        return JSONResponse(
+            {"error": "server busy, retry later", "inflight": limiter.inflight},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+
+    # พารามิเตอร์ที่มีผลต่อผลลัพธ์ (ส่วนหนึ่งของ cache key)
+    cache_params = dict(
+        imgsz=app.INFERENCE_KWARGS.get("imgsz"),
+        conf=app.INFERENCE_KWARGS.get("conf"),
+        iou=app.INFERENCE_KWARGS.get("iou", 0.7),
+        max_det=app.INFERENCE_KWARGS.get("max_det"),
+    )
+
+    def lookup(payloads):
+        # key ตามไฟล์ของโมเดลที่ใช้อยู่ตอนนี้ (hot reload ในแอปเปลี่ยนโมเดลได้ระหว่างที่ API รันอยู่)
+        current = app.model
+        weights_hash = getattr(current, "weights_hash", None) or cache.weights_hash
+        params = {**cache_params, "backend": artifact_backend(getattr(current, "artifact_path", app.MODEL_PATH))}
+        keys = [cache.key(hash_bytes(data), weights_hash=weights_hash, **params) for data in payloads]
+        return weights_hash, keys, [cache.get(key) for key in keys]
+
+    def decode_all(payloads):
+        images = [decode_image(data) for data in payloads]
+        for index, image in enumerate(images):
+            if image is None:
+                raise HTTPException(status_code=400, detail=f"decode ภาพที่ {index} ไม่ได้ (รองรับ JPEG/PNG)")
+        return images
+
+    async def run_images(payloads):
+        """
+        decode ใน thread pool แล้วส่งทุกภาพเข้า batcher พร้อมกัน คืน list ของ dict ผลลัพธ์
+        ภาพที่มีผลอยู่ใน cache แล้วจะไม่ถูก decode และไม่ถูกส่งเข้าโมเดล
+        """
+        start = time.perf_counter()
+        weights_hash, keys, entries = None, [None] * len(payloads), [None] * len(payloads)
+        if cache is not None:
+            with metrics.time("api_cache_lookup"):
+                weights_hash, keys, entries = await run_in_threadpool(lookup, payloads)
+        missing = [index for index, entry in enumerate(entries) if entry is None]
+
+        if missing:
+            with metrics.time("api_decode"):
+                images = await run_in_threadpool(decode_all, [payloads[index] for index in missing])
+            futures = []
+            for image in images:
+                try:
+                    futures.append(batcher.submit(stream_id, image, block=submit_timeout > 0, timeout=submit_timeout or None))
+                except queue.Full:
+                    raise Saturated()
+            results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+            for index, result in zip(missing, results):
+                entries[index] = result_to_array(result)
+                # เก็บเฉพาะผลจากโมเดลเดียวกับที่ใช้สร้าง key (ไม่เก็บถ้าโมเดลถูกสลับระหว่างคำขอ)
+                if cache is not None and getattr(result, "weights_hash", weights_hash) == weights_hash:
+                    cache.put(keys[index], *entries[index])
+        metrics.observe("api_request", time.perf_counter() - start)
+        return [detections_to_json(data, shape) for data, shape in entries]
+
+    @api.exception_handler(Saturated)
+    async def saturated_handler(request, exc):
+        return too_busy()
+
+    @api.post("/detect")
+    async def detect(request: Request):
+        limiter.acquire(1)
+        try:
+            body = await request.body()
+            (response,) = await run_images([body])
+        finally:
+            limiter.release(1)
+        return response
+
+    @api.post("/detect/batch")
+    async def detect_batch(files: list[UploadFile] = File(...)):
+        if len(files) > max_batch_images:
+            raise HTTPException(status_code=413, detail=f"ส่งได้สูงสุด {max_batch_images} ภาพต่อคำขอ")
+        limiter.acquire(len(files))
+        try:
+            payloads = [await upload.read() for upload in files]
+            responses = await run_images(payloads)
+        finally:
+            limiter.release(len(files))
+        return {
+            "results": [
+                {"filename": upload.filename, **response} for upload, response in zip(files, responses)
+            ]
+        }
+
+    @api.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "inflight": limiter.inflight,
+            "max_inflight": limiter.max_inflight,
+            "rejected": limiter.rejected,
+            "batcher": batcher.stats(),
+            "cache": cache.stats() if cache is not None else None,
+        }
+
+    @api.get("/metrics")
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    metrics.register_collector(lambda: {"api_inflight": limiter.inflight, "api_rejected": limiter.rejected})
+    metrics.register_collector(lambda: {f"batcher_{k}": v for k, v in batcher.stats().items()})
+    if cache is not None:
+        metrics.register_collector(lambda: {f"result_cache_{k}": v for k, v in cache.stats().items()})
+    return api
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP batch inference API (shares the app model)")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address")
+    parser.add_argument("--port", type=int, default=8000, help="Bind port")
+    parser.add_argument("--max-batch", type=int, default=8, help="Maximum images per forward pass")
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=10.0,
+        help="Maximum time the first image of a batch waits for more images",
+    )
+    parser.add_argument("--max-inflight", type=int, default=32, help="Images in flight before answering 429")
+    parser.add_argument("--max-batch-images", type=int, default=32, help="Maximum files per /detect/batch call")
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Serve repeated images from the result cache (default: result_cache.enabled in params.yaml)",
+    )
+    parser.add_argument("--with-ui", action="store_true", help="Also mount the Gradio webcam UI at /ui")
+    return parser.parse_args()
+
+
+def main():
+    import uvicorn
+
+    args = parse_args()
+    app.ensure_model()
+    app.warmup_model()
+    # คิวของ batcher ใหญ่กว่า max_inflight เสมอ จึงไม่เต็มก่อนที่ limiter จะตอบ 429
+    batcher = MicroBatcher(
+        infer_batch,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=max(64, args.max_inflight * 2),
+    )
+    batcher.start()
+    cache_config = {} if args.cache is None else {"enabled": args.cache}
+    # fingerprint ของไฟล์ที่โหลดจริง (อาจเป็น export หรือโมเดล INT8 ไม่ใช่ .pt)
+    cache = ResultCache.from_config(app.model.artifact_path, cache_config)
+    if cache is not None:
+        print(f"[API] ใช้ result cache ที่ {cache.cache_dir} (weights {cache.weights_hash[:12]})")
+    api = create_api(
+        batcher,
+        max_inflight=args.max_inflight,
+        max_batch_images=args.max_batch_images,
+        cache=cache,
+    )
+
+    if args.with_ui:
+        import gradio as gr
+
+        # ใช้ /metrics ของ API แทน metrics server แยกพอร์ต
+        with app.startup_step("build_ui"):
+            demo = app.build_interface(app.start_services(metrics_server=False))
+        api = gr.mount_gradio_app(api, demo, path="/ui")
+        print(f"[API] หน้าเว็บ Gradio: http://{args.host}:{args.port}/ui")
+
+    app.print_startup_timings()
+    print(f"[API] เริ่ม inference API ที่ http://{args.host}:{args.port} (max_batch={args.max_batch}, max_inflight={args.max_inflight})")
+    try:
+        uvicorn.run(api, host=args.host, port=args.port, log_level="warning")
+    finally:
+        batcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# ------------------------------------
+# ไฟล์: inference_backends.py
+# ------------------------------------
+"""
+เลือก runtime สำหรับ inference (PyTorch / ONNX Runtime / OpenVINO / TorchScript)
+จาก params.yaml โดยไม่ต้องแก้โค้ดใน app.py, evaluate.py หรือ test_images.py
+
+ไฟล์ที่ export แล้วจะถูก cache ไว้ข้างไฟล์ .pt ต้นฉบับ (ตามรูปแบบชื่อของ ultralytics)
+และจะ export ใหม่อัตโนมัติเมื่อไฟล์ .pt หรือค่าการ export เปลี่ยน
+ทุก backend โหลดผ่าน ultralytics.YOLO จึงใช้ pre/post-processing (letterbox, NMS) ชุดเดียวกัน
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import yaml
+
+
+SUPPORTED_BACKENDS = ("pytorch", "onnx", "openvino", "torchscript")
+
+DEFAULT_INFERENCE_CONFIG = {
+    "backend": "pytorch",
+    "weights": "artifacts/models/waste-sorter-best.pt",
+    "imgsz": 640,
+    "half": False,
+    "dynamic": False,
+    "device": None,
+    "prefer_quantized": False,
+    "quantize_report": "artifacts/quantize/metrics.json",
+}
+
+
+def load_inference_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_INFERENCE_CONFIG.copy()
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("inference", {}))
+    return config
+
+
+def exported_path(weights, backend):
+    """คืน path ของไฟล์/โฟลเดอร์ที่ ultralytics จะสร้างเมื่อ export เป็น backend ที่ระบุ"""
+    weights = Path(weights)
+    if backend == "onnx":
+        return weights.with_suffix(".onnx")
+    if backend == "torchscript":
+        return weights.with_suffix(".torchscript")
+    if backend == "openvino":
+        return weights.with_name(f"{weights.stem}_openvino_model")
+    raise ValueError(f"backend ไม่รองรับการ export: {backend}")
+
+
+def quantized_export_path(weights):
+    """โฟลเดอร์ OpenVINO INT8 ที่ ultralytics สร้างจาก export(format="openvino", int8=True)"""
+    weights = Path(weights)
+    return weights.with_name(f"{weights.stem}_int8_openvino_model")
+
+
+def weights_signature(weights):
+    """
+    hash ของเนื้อไฟล์ weights (ใช้ตรวจว่าไฟล์ที่ export/quantize ไว้ยังมาจาก weights เดิม)
+    ไม่ใช้ mtime เพราะ dvc pull / checkout ให้ mtime ใหม่กับ weights ชุดเดิม
+    """
+    from result_cache import weights_fingerprint
+
+    return {"source": str(weights), "source_sha1": weights_fingerprint(weights)}
+
+
+def quantized_model_path(weights, config=None):
+    """
+    คืน path ของโมเดล INT8 ถ้า quantize stage ผ่าน budget ของ mAP และยังสร้างจาก weights ไฟล์นี้
+    ไม่งั้นคืน None (ใช้โมเดลปกติ)
+    """
+    config = {**load_inference_config(), **(config or {})}
+    report_path = Path(config["quantize_report"])
+    target = quantized_export_path(weights)
+    if not report_path.exists() or not target.exists():
+        return None
+    try:
+        report = json.loads(report_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not report.get("within_budget"):
+        print(f"[BACKEND] โมเดล INT8 ไม่ผ่าน budget (mAP ลดลง {report.get('map50_95_drop')}) ใช้โมเดลปกติ")
+        return None
+    if report.get("source") != weights_signature(weights):
+        print("[BACKEND] โมเดล INT8 สร้างจาก weights เก่า ใช้โมเดลปกติ (รัน dvc repro quantize)")
+        return None
+    return target
+
+
+def _export_meta_path(export_path):
+    export_path = Path(export_path)
+    return export_path.with_name(f"{export_path.name}.export.json")
+
+
+def _export_signature(weights, backend, config):
+    return {
+        **weights_signature(weights),
+        "backend": backend,
+        "imgsz": int(config["imgsz"]),
+        "half": bool(config["half"]),
+        "dynamic": bool(config["dynamic"]),
+    }
+
+
+def _export_is_fresh(export_path, signature):
+    meta_path = _export_meta_path(export_path)
+    if not Path(export_path).exists() or not meta_path.exists():
+        return False
+    try:
+        cached = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return cached == signature
+
+
+def export_model(weights, backend, config=None, force=False):
+    """
+    Export ไฟล์ .pt เป็น backend ที่ระบุ (ใช้ไฟล์ cache ถ้ายังใหม่อยู่)
+    คืน path ของโมเดลที่ export แล้ว
+    """
+    from ultralytics import YOLO
+
+    config = {**load_inference_config(), **(config or {})}
+    if not Path(weights).is_file():
+        raise FileNotFoundError(f"ไม่พบไฟล์ weights: {weights}")
+
+    target = exported_path(weights, backend)
+    signature = _export_signature(weights, backend, config)
+    if not force and _export_is_fresh(target, signature):
+        return target
+
+    print(f"[BACKEND] กำลัง export {weights} -> {backend} (imgsz={config['imgsz']})...")
+    output = YOLO(str(weights)).export(
+        format=backend,
+        imgsz=config["imgsz"],
+        half=config["half"],
+        dynamic=config["dynamic"],
+        device=config["device"],
+    )
+    target = Path(output)
+    _export_meta_path(target).write_text(json.dumps(signature, indent=2), encoding="utf-8")
+    print(f"[BACKEND] export สำเร็จ: {target}")
+    return target
+
+
+def resolve_model_path(weights=None, backend=None, config=None):
+    """แปลง weights (.pt) + backend เป็น path ที่พร้อมโหลด (export ถ้าจำเป็น)"""
+    config = {**load_inference_config(), **(config or {})}
+    weights = weights or config["weights"]
+    backend = (backend or config["backend"] or "pytorch").lower()
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"backend ไม่ถูกต้อง: {backend} (รองรับ: {', '.join(SUPPORTED_BACKENDS)})")
+    # ถ้าผู้ใช้ส่งไฟล์ที่ export แล้วมาโดยตรง ให้ใช้ตามนั้น
+    if Path(weights).suffix != ".pt":
+        return Path(weights)
+    # โมเดล INT8 จาก quantize stage (เฉพาะเมื่อเปิด prefer_quantized และผ่าน budget ของ mAP)
+    if config.get("prefer_quantized"):
+        quantized = quantized_model_path(weights, config)
+        if quantized is not None:
+            return quantized
+    if backend == "pytorch":
+        return Path(weights)
+    return export_model(weights, backend, config)
+
+
+def _artifact_meta(path):
+    """
+    ค่าการ export ของไฟล์/โฟลเดอร์ที่โหลด: .export.json ที่ export_model เขียนไว้
+    หรือ metadata.yaml ที่ ultralytics เขียนในโฟลเดอร์ OpenVINO (เช่นโมเดล INT8 จาก quantize stage)
+    """
+    path = Path(path)
+    try:
+        return json.loads(_export_meta_path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pass
+    if path.is_dir() and (path / "metadata.yaml").is_file():
+        with (path / "metadata.yaml").open("r", encoding="utf-8") as fp:
+            metadata = yaml.safe_load(fp) or {}
+        return {**metadata, "dynamic": bool((metadata.get("args") or {}).get("dynamic", False))}
+    return {}
+
+
+def supports_dynamic_shapes(path):
+    """
+    True ถ้าโมเดลรับ batch > 1 และ imgsz หลายขนาดได้ (.pt หรือ export ที่ dynamic: true)
+    export แบบ static (ค่าเริ่มต้น inference.dynamic: false) และโมเดล INT8 รับได้แค่ batch 1 ที่ imgsz ตอน export
+    """
+    if Path(path).suffix == ".pt":
+        return True
+    return bool(_artifact_meta(path).get("dynamic", False))
+
+
+def static_imgsz(path):
+    """
+    imgsz เดียวที่โมเดลรับได้ถ้าเป็น export แบบ static shape คืน None ถ้ารับได้หลายขนาด (ดู supports_dynamic_shapes)
+    """
+    if supports_dynamic_shapes(path):
+        return None
+    imgsz = _artifact_meta(path).get("imgsz") or load_inference_config()["imgsz"]
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return int(imgsz)
+
+
+def artifact_backend(path):
+    """
+    backend ของไฟล์/โฟลเดอร์ที่โหลดจริง (แยก INT8 ออกจาก FP32)
+    ใช้เป็นส่วนหนึ่งของ cache key แทนค่า backend ที่ผู้ใช้สั่ง ซึ่งอาจถูกแทนด้วยโมเดล INT8
+    """
+    path = Path(path)
+    if path.name.endswith("_int8_openvino_model"):
+        return "openvino-int8"
+    if path.name.endswith("_openvino_model"):
+        return "openvino"
+    suffix = path.suffix.lstrip(".")
+    return {"pt": "pytorch", "": "unknown"}.get(suffix, suffix)
+
+
+def load_model(weights=None, backend=None, config=None):
+    """
+    โหลดโมเดลตาม backend ที่เลือก คืนค่าเป็น ultralytics.YOLO ที่ใช้งานได้เหมือนเดิม
+    (model(...), model.predict(...), model.val(...))
+    model.artifact_path = ไฟล์/โฟลเดอร์ที่โหลดจริง (.pt, .onnx, *_openvino_model, *_int8_openvino_model ...)
+    """
+    from ultralytics import YOLO
+
+    path = resolve_model_path(weights, backend, config)
+    if path.suffix == ".pt":
+        model = YOLO(str(path))
+    else:
+        model = YOLO(str(path), task="detect")
+    model.artifact_path = path
+    return model
+
+
+def _box_iou(a, b):
+    import numpy as np
+
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare_detections(ref_result, test_result, iou_tol=0.9, conf_tol=0.05):
+    """
+    เทียบผล detection ของ 2 backend บนภาพเดียวกัน
+    คืนค่า (matched, total_ref, total_test) โดยนับกล่องที่ class ตรงกัน
+    IoU >= iou_tol และ confidence ต่างกันไม่เกิน conf_tol
+    """
+    import numpy as np
+
+    ref_boxes, test_boxes = ref_result.boxes, test_result.boxes
+    ref_xyxy = ref_boxes.xyxy.cpu().numpy()
+    test_xyxy = test_boxes.xyxy.cpu().numpy()
+    if len(ref_xyxy) == 0 or len(test_xyxy) == 0:
+        return 0, len(ref_xyxy), len(test_xyxy)
+    ref_cls = ref_boxes.cls.cpu().numpy().astype(int)
+    test_cls = test_boxes.cls.cpu().numpy().astype(int)
+    ref_conf = ref_boxes.conf.cpu().numpy()
+    test_conf = test_boxes.conf.cpu().numpy()
+
+    iou = _box_iou(ref_xyxy, test_xyxy)
+    ok = (
+        (iou >= iou_tol)
+        & (ref_cls[:, None] == test_cls[None, :])
+        & (np.abs(ref_conf[:, None] - test_conf[None, :]) <= conf_tol)
+    )
+    matched = 0
+    used = set()
+    for i in range(len(ref_xyxy)):
+        for j in np.flatnonzero(ok[i]):
+            if j not in used:
+                used.add(j)
+                matched += 1
+                break
+    return matched, len(ref_xyxy), len(test_xyxy)
+
+
+def verify_backend(weights, backend, source, conf=0.25, iou_tol=0.9, conf_tol=0.05):
+    """
+    รันโมเดล PyTorch และ backend ที่เลือกบนภาพชุดเดียวกัน แล้วตรวจว่าผลตรงกันภายใน tolerance
+    คืนค่า True ถ้าทุกกล่องของทั้งสองฝั่งจับคู่กันได้
+    """
+    config = load_inference_config()
+    reference = load_model(weights, "pytorch")
+    candidate = load_model(weights, backend)
+    predict_kwargs = dict(imgsz=config["imgsz"], conf=conf, device=config["device"], verbose=False, stream=True)
+
+    all_ok = True
+    for ref_result, test_result in zip(
+        reference.predict(source, **predict_kwargs), candidate.predict(source, **predict_kwargs)
+    ):
+        matched, n_ref, n_test = compare_detections(ref_result, test_result, iou_tol, conf_tol)
+        status = "OK" if matched == n_ref == n_test else "MISMATCH"
+        if status != "OK":
+            all_ok = False
+        print(f"[{status}] {ref_result.path}: matched {matched} (pytorch {n_ref}, {backend} {n_test})")
+    return all_ok
+
+
+def parse_args():
+    config = load_inference_config()
+    parser = argparse.ArgumentParser(description="Export / verify inference backends")
+    parser.add_argument("--weights", default=config["weights"], help="Path to trained weights (.pt)")
+    parser.add_argument(
+        "--backend",
+        default=config["backend"],
+        choices=SUPPORTED_BACKENDS,
+        help="Inference runtime to export",
+    )
+    parser.add_argument("--force", action="store_true", help="Re-export even if a cached export exists")
+    parser.add_argument(
+        "--verify",
+        metavar="SOURCE",
+        help="Image or directory used to compare detections against the PyTorch model",
+    )
+    parser.add_argument("--iou-tol", type=float, default=0.9, help="Minimum IoU for matching boxes")
+    parser.add_argument("--conf-tol", type=float, default=0.05, help="Maximum confidence difference")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.backend != "pytorch":
+        path = export_model(args.weights, args.backend, force=args.force)
+        print(f"Model for backend '{args.backend}': {path}")
+    if args.verify:
+        if not verify_backend(args.weights, args.backend, args.verify, iou_tol=args.iou_tol, conf_tol=args.conf_tol):
+            print("ผลของ backend ไม่ตรงกับ PyTorch ภายใน tolerance ที่กำหนด", file=sys.stderr)
+            sys.exit(1)
+        print("ผลของ backend ตรงกับ PyTorch ภายใน tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# ------------------------------------
+# ไฟล์: inference_server.py
+# ------------------------------------
+"""
+Inference service เดียวสำหรับหลายกล้อง (หลายถังขยะในไซต์เดียวกัน)
+
+- โหลดโมเดลครั้งเดียว (ใช้ app.ensure_model()) แทนการเปิด app.py แยกต่อกล้อง
+- เฟรมจากทุก stream ถูกรวมเป็น micro-batch (ไม่เกิน max_batch เฟรม หรือรอไม่เกิน max_wait_ms)
+  แล้วรัน forward pass เดียวต่อ batch
+- ผลลัพธ์ถูกส่งกลับไปยัง stream ต้นทาง ซึ่งมี StreamState (streak/cooldown) ของตัวเอง
+
+หมายเหตุ: ถ้าใช้ backend ที่ export แล้ว (onnx/openvino/torchscript) ให้ตั้ง inference.dynamic: true
+ใน params.yaml เพื่อให้โมเดลรับ batch มากกว่า 1 ได้
+
+ตัวอย่าง:
+    python inference_server.py --sources 0 1 rtsp://bin-3/stream --max-batch 4 --max-wait-ms 20
+"""
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+
+import app
+from annotation_renderer import AnnotationRenderer
+from stream_state import StreamState
+from voice_guidance import start_speech_worker
+
+
+class MicroBatcher:
+    """
+    รวมคำขอจากหลาย stream เป็น batch ตาม deadline แล้วเรียก infer_batch_fn(frames) ครั้งเดียว
+
+    infer_batch_fn ต้องคืน list ผลลัพธ์ที่มีลำดับตรงกับ frames
+    """
+
+    def __init__(self, infer_batch_fn, max_batch=8, max_wait_ms=15.0, max_queue=64):
+        self._infer_batch_fn = infer_batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._running = False
+        self._thread = None
+        self.batches = 0
+        self.frames = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, stream_id, frame, block=True, timeout=None):
+        """ส่งเฟรมเข้าคิว คืน Future ที่จะได้ผลลัพธ์ของเฟรมนั้น (queue.Full ถ้าคิวเต็ม)"""
+        future = Future()
+        self._queue.put((stream_id, frame, future), block=block, timeout=timeout)
+        return future
+
+    def stats(self):
+        avg_batch = self.frames / self.batches if self.batches else 0.0
+        per_frame_ms = self.busy_seconds * 1000.0 / self.frames if self.frames else 0.0
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch_size": avg_batch,
+            "infer_ms_per_frame": per_frame_ms,
+            "queued": self._queue.qsize(),
+        }
+
+    def _collect_batch(self):
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while self._running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            frames = [frame for _, frame, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = self._infer_batch_fn(frames)
+            except Exception as ex:
+                print(f"[SERVER] error ระหว่าง batch inference: {ex}")
+                for _, _, future in batch:
+                    future.set_exception(ex)
+                continue
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.frames += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+def infer_batch(frames_bgr):
+    """
+    forward pass เดียวสำหรับทุกเฟรมใน batch (ultralytics รับ list ของภาพเป็น batch)
+    ผลแต่ละภาพมี weights_hash ของโมเดลที่ใช้จริง (โมเดลอาจถูกสลับโดย hot reload ระหว่างคำขอ)
+    """
+    model = app.ensure_model()
+    results = model(frames_bgr, **app.INFERENCE_KWARGS)
+    weights_hash = getattr(model, "weights_hash", None)
+    for result in results:
+        result.weights_hash = weights_hash
+    return results
+
+
+class CameraStream:
+    """
+    อ่านเฟรมจากกล้องหนึ่งตัว ส่งเข้า MicroBatcher และจัดการผลลัพธ์ด้วย StreamState ของตัวเอง
+    """
+
+    def __init__(self, stream_id, source, batcher, show=False):
+        self.stream_id = stream_id
+        self.source = int(source) if str(source).isdigit() else source
+        self.batcher = batcher
+        self.show = show
+        self.state = StreamState(stream_id)
+        self.renderer = AnnotationRenderer(app.ensure_model().names, rgb=False)
+        self.frames = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"camera-{self.stream_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            print(f"[SERVER] ไม่สามารถเปิดกล้อง {self.stream_id}: {self.source}")
+            return
+        print(f"[SERVER] เริ่ม stream {self.stream_id} จาก {self.source}")
+        try:
+            while self._running:
+                ok, frame_bgr = cap.read()
+                if not ok:
+                    print(f"[SERVER] stream {self.stream_id} สิ้นสุด/อ่านเฟรมไม่ได้")
+                    break
+                result = self.batcher.submit(self.stream_id, frame_bgr).result()
+                # เฟรมจาก cap.read() เป็นของ stream นี้ วาดกรอบลงไปได้โดยตรง
+                annotated_bgr = self.renderer.draw_result(frame_bgr, result)
+                app.handle_detections(result, annotated_bgr, self.state, rgb=False)
+                self.frames += 1
+                if self.show:
+                    cv2.imshow(f"AI Waste Sorter - {self.stream_id}", annotated_bgr)
+                    cv2.waitKey(1)
+        except Exception as ex:
+            print(f"[SERVER] stream {self.stream_id} error: {ex}")
+        finally:
+            cap.release()
+            self._running = False
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Micro-batched multi-camera inference server")
+    parser.add_argument(
+        "--sources",
+        nargs="+",
+        required=True,
+        help="Camera indexes, video files or stream URLs (one per bin)",
+    )
+    parser.add_argument("--max-batch", type=int, default=8, help="Maximum frames per forward pass")
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=15.0,
+        help="Maximum time the first frame of a batch waits for more frames",
+    )
+    parser.add_argument("--stats-every", type=float, default=10.0, help="Seconds between stats logs")
+    parser.add_argument("--show", action="store_true", help="Display annotated frames (OpenCV required)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start_speech_worker()
+    app.ensure_model()
+    app.warmup_model()
+    batcher = MicroBatcher(infer_batch, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    batcher.start()
+    app.print_startup_timings()
+
+    streams = [
+        CameraStream(f"bin-{idx}", source, batcher, show=args.show)
+        for idx, source in enumerate(args.sources)
+    ]
+    for stream in streams:
+        stream.start()
+
+    try:
+        while any(stream._thread.is_alive() for stream in streams):
+            time.sleep(args.stats_every)
+            stats = batcher.stats()
+            print(
+                f"[SERVER] batches={stats['batches']} frames={stats['frames']} "
+                f"avg_batch={stats['avg_batch_size']:.2f} "
+                f"infer/frame={stats['infer_ms_per_frame']:.1f}ms queued={stats['queued']}"
+            )
+    except KeyboardInterrupt:
+        print("[SERVER] กำลังหยุด...")
+    finally:
+        for stream in streams:
+            stream.stop()
+        batcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+# ------------------------------------
+# ไฟล์: label_index.py
+# ------------------------------------
+"""
+index แบบ columnar ของ label ทั้งหมดใน waste-detection (ไม่ต้องเทรนหรือรัน model.val เพื่อดูสถิติ)
+
+- อ่านไฟล์ label YOLO และ header ของภาพ (ขนาด) ทุกไฟล์แบบขนาน พร้อม hash ของไฟล์ภาพ
+- เก็บเป็นคอลัมน์ numpy ใน artifacts/labels/index.npz
+    ตารางภาพ: path, split, ขนาดภาพ, sha1, สถานะ label, จำนวนกล่อง (กล่องของแต่ละภาพเรียงต่อกันตามลำดับภาพ)
+    ตารางกล่อง: class, cx, cy, w, h (normalized)
+- รันซ้ำจะอ่านเฉพาะไฟล์ที่เปลี่ยน (เทียบขนาด + mtime ของภาพและ label) ที่เหลือใช้ข้อมูลเดิม
+- คำถามที่ตอบได้ทันที: จำนวนต่อคลาส, สัดส่วนวัตถุเล็ก, การกระจายขนาดกล่อง, label ว่าง/เสีย, ภาพซ้ำ (ข้าม split)
+- sampling weights แบบ class-balanced ให้ train.py ใช้ (train.balanced_sampling: true)
+
+    python label_index.py               # อัปเดต index แล้วแสดงสถิติ
+    python label_index.py --duplicates  # รายการภาพซ้ำ
+    python label_index.py --problems    # label ที่หาย/ว่าง/อ่านไม่ได้
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+
+DEFAULT_LABEL_INDEX_CONFIG = {
+    "out": "artifacts/labels/index.npz",
+    "splits": ["train", "val", "test"],
+    "workers": 8,
+    "small_px": 32,     # กล่องที่พื้นที่น้อยกว่า small_px^2 พิกเซล (นิยามวัตถุเล็กแบบ COCO)
+}
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+STATUS_OK = 0
+STATUS_EMPTY = 1        # มีไฟล์ label แต่ไม่มีกล่อง (ภาพ background)
+STATUS_MISSING = 2      # ไม่มีไฟล์ label
+STATUS_BAD_LABEL = 3    # มีบรรทัดที่อ่านไม่ได้ / พิกัดนอกช่วง 0-1
+STATUS_BAD_IMAGE = 4    # อ่านขนาดภาพไม่ได้
+STATUS_NAMES = {
+    STATUS_OK: "ok",
+    STATUS_EMPTY: "empty",
+    STATUS_MISSING: "missing_label",
+    STATUS_BAD_LABEL: "bad_label",
+    STATUS_BAD_IMAGE: "bad_image",
+}
+
+_IMAGE_COLUMNS = {
+    "path": str,
+    "split": np.int8,
+    "img_bytes": np.int64,
+    "img_mtime": np.int64,
+    "label_bytes": np.int64,
+    "label_mtime": np.int64,
+    "width": np.int32,
+    "height": np.int32,
+    "sha1": "S40",
+    "status": np.int8,
+    "n_boxes": np.int32,
+}
+_BOX_COLUMNS = ("cls", "cx", "cy", "w", "h")
+
+
+def load_label_index_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_LABEL_INDEX_CONFIG.copy()
+    params = {}
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("label_index", {}))
+    config.setdefault("data", params.get("train", {}).get("data", "waste-detection/data.yaml"))
+    return config
+
+
+def dataset_splits(data):
+    """อ่าน dataset YAML คืน (names, {split: [ไฟล์ภาพ]}) แบบเดียวกับที่ ultralytics resolve path"""
+    data = Path(data)
+    config = yaml.safe_load(data.read_text(encoding="utf-8")) or {}
+    root = Path(config.get("path") or data.parent)
+    if not root.is_absolute():
+        root = (data.parent / root).resolve() if not root.exists() else root.resolve()
+    names = config.get("names", {})
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+    splits = {}
+    for split in ("train", "val", "test"):
+        entries = config.get(split)
+        if not entries:
+            continue
+        files = []
+        for entry in entries if isinstance(entries, list) else [entries]:
+            path = Path(entry) if Path(entry).is_absolute() else (root / entry).resolve()
+            if not path.exists() and str(entry).startswith("../"):
+                # dataset ที่ export จาก Roboflow ใช้ ../train/images ทั้งที่โฟลเดอร์อยู่ข้าง data.yaml
+                path = (root / str(entry)[3:]).resolve()
+            if path.is_dir():
+                files.extend(p for p in path.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+            elif path.suffix == ".txt" and path.is_file():
+                for line in path.read_text(encoding="utf-8").splitlines():
+                    if line.strip():
+                        item = Path(line.strip())
+                        files.append(item if item.is_absolute() else (path.parent / item).resolve())
+        splits[split] = sorted(str(p) for p in files)
+    return {int(k): str(v) for k, v in names.items()}, splits
+
+
+def label_path_for(image_path):
+    """path ของไฟล์ label ตามกติกา ultralytics (/images/ -> /labels/, นามสกุล .txt)"""
+    images_dir, labels_dir = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    image_path = os.path.normpath(image_path)
+    return os.path.splitext(labels_dir.join(image_path.rsplit(images_dir, 1)))[0] + ".txt"
+
+
+def image_size(path):
+    """(กว้าง, สูง) จาก header ของภาพ ไม่ decode ทั้งภาพถ้ามี Pillow"""
+    try:
+        from PIL import Image
+    except ImportError:
+        import cv2
+
+        image = cv2.imread(path)
+        if image is None:
+            raise OSError(f"อ่านภาพไม่ได้: {path}")
+        return image.shape[1], image.shape[0]
+    with Image.open(path) as image:
+        return image.size
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return -1, -1
+
+
+def scan_image(path, split):
+    """อ่านภาพหนึ่งภาพ (header + sha1) และ label ของภาพนั้น คืน (แถวตารางภาพ, array กล่อง (n, 5))"""
+    img_bytes, img_mtime = _stat(path)
+    label = label_path_for(path)
+    label_bytes, label_mtime = _stat(label)
+    row = {
+        "path": path,
+        "split": split,
+        "img_bytes": img_bytes,
+        "img_mtime": img_mtime,
+        "label_bytes": label_bytes,
+        "label_mtime": label_mtime,
+        "width": 0,
+        "height": 0,
+        "sha1": b"",
+        "status": STATUS_OK,
+    }
+    try:
+        digest = hashlib.sha1()
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(chunk)
+        row["sha1"] = digest.hexdigest().encode("ascii")
+        row["width"], row["height"] = image_size(path)
+    except Exception:
+        row["status"] = STATUS_BAD_IMAGE
+
+    boxes = []
+    if label_bytes < 0:
+        row["status"] = row["status"] or STATUS_MISSING
+    else:
+        bad = False
+        with open(label, "r", encoding="utf-8", errors="replace") as fp:
+            for line in fp:
+                values = line.split()
+                if not values:
+                    continue
+                try:
+                    numbers = [float(v) for v in values]
+                except ValueError:
+                    bad = True
+                    continue
+                coords = numbers[1:]
+                if len(coords) < 4 or (len(coords) > 4 and len(coords) % 2):
+                    bad = True
+                    continue
+                if len(coords) > 4:
+                    # label แบบ polygon -> กล่องที่ครอบ
+                    xs, ys = coords[0::2], coords[1::2]
+                    coords = [(min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2, max(xs) - min(xs), max(ys) - min(ys)]
+                if min(coords) < 0 or max(coords) > 1.0001:
+                    bad = True
+                boxes.append([numbers[0], *coords])
+        if bad:
+            row["status"] = row["status"] or STATUS_BAD_LABEL
+        elif not boxes:
+            row["status"] = row["status"] or STATUS_EMPTY
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+    row["n_boxes"] = len(boxes)
+    return row, boxes
+
+
+class LabelIndex:
+    """index ที่โหลดแล้ว: คอลัมน์ของตารางภาพใน self.images, ตารางกล่องใน self.boxes"""
+
+    def __init__(self, images, boxes, meta):
+        self.images = images
+        self.boxes = boxes
+        self.meta = meta
+        self.names = {int(k): v for k, v in meta.get("names", {}).items()}
+        # index ของภาพที่แต่ละกล่องอยู่
+        self.box_image = np.repeat(np.arange(len(images["path"])), images["n_boxes"])
+
+    def __len__(self):
+        return len(self.images["path"])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            images = {key: npz[f"img_{key}"] for key in _IMAGE_COLUMNS}
+            boxes = {key: npz[f"box_{key}"] for key in _BOX_COLUMNS}
+            meta = json.loads(str(npz["meta"]))
+        return cls(images, boxes, meta)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            **{f"img_{key}": value for key, value in self.images.items()},
+            **{f"box_{key}": value for key, value in self.boxes.items()},
+            meta=np.asarray(json.dumps(self.meta, ensure_ascii=False)),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, data, splits=("train", "val", "test"), previous=None, workers=8):
+        """
+        สแกน dataset ใหม่ ใช้แถวเดิมจาก previous (LabelIndex) สำหรับไฟล์ที่ขนาด/mtime ไม่เปลี่ยน
+        คืน (LabelIndex, จำนวนไฟล์ที่อ่านใหม่)
+        """
+        names, split_files = dataset_splits(data)
+        split_names = [s for s in splits if s in split_files]
+        old_rows = {}
+        if previous is not None:
+            for i, path in enumerate(previous.images["path"]):
+                old_rows[str(path)] = i
+            old_starts = np.concatenate(([0], np.cumsum(previous.images["n_boxes"])))
+
+        rows, box_parts, todo = [], [], []
+        for split_id, split in enumerate(split_names):
+            for path in split_files[split]:
+                rows.append(None)
+                box_parts.append(None)
+                i = old_rows.get(path)
+                if i is not None:
+                    old = previous.images
+                    label = label_path_for(path)
+                    if (old["img_bytes"][i], old["img_mtime"][i]) == _stat(path) and (
+                        old["label_bytes"][i], old["label_mtime"][i]
+                    ) == _stat(label):
+                        rows[-1] = {key: old[key][i] for key in _IMAGE_COLUMNS}
+                        rows[-1]["split"] = split_id
+                        start, end = old_starts[i], old_starts[i + 1]
+                        box_parts[-1] = np.stack([previous.boxes[key][start:end] for key in _BOX_COLUMNS], axis=1)
+                        continue
+                todo.append((len(rows) - 1, path, split_id))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (slot, _, _), (row, boxes) in zip(todo, pool.map(lambda t: scan_image(t[1], t[2]), todo)):
+                rows[slot], box_parts[slot] = row, boxes
+
+        images = {key: np.asarray([row[key] for row in rows], dtype=dtype) for key, dtype in _IMAGE_COLUMNS.items()}
+        all_boxes = np.concatenate(box_parts) if box_parts else np.zeros((0, 5), dtype=np.float32)
+        boxes = {
+            "cls": all_boxes[:, 0].astype(np.int16),
+            **{key: all_boxes[:, i + 1].astype(np.float32) for i, key in enumerate(_BOX_COLUMNS[1:])},
+        }
+        meta = {"data": str(data), "names": names, "splits": split_names, "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+        return cls(images, boxes, meta), len(todo)
+
+    # ----- queries -----
+
+    def split_mask(self, split=None):
+        if split is None:
+            return np.ones(len(self), dtype=bool)
+        return self.images["split"] == self.meta["splits"].index(split)
+
+    def class_counts(self, split=None):
+        """{ชื่อคลาส: {"boxes": n, "images": n}}"""
+        box_mask = self.split_mask(split)[self.box_image]
+        cls = self.boxes["cls"][box_mask].astype(np.int64)
+        nc = max(len(self.names), int(cls.max(initial=-1)) + 1)
+        box_counts = np.bincount(cls, minlength=nc)
+        # นับภาพที่มีคลาสนั้นอย่างน้อยหนึ่งกล่อง
+        pairs = np.unique(np.stack([self.box_image[box_mask], cls], axis=1), axis=0) if cls.size else np.zeros((0, 2), int)
+        image_counts = np.bincount(pairs[:, 1], minlength=nc)
+        return {
+            self.names.get(c, str(c)): {"boxes": int(box_counts[c]), "images": int(image_counts[c])} for c in range(nc)
+        }
+
+    def box_pixels(self):
+        """ความกว้าง/สูงของกล่องเป็นพิกเซลของภาพต้นฉบับ"""
+        width = self.images["width"][self.box_image]
+        height = self.images["height"][self.box_image]
+        return self.boxes["w"] * width, self.boxes["h"] * height
+
+    def small_object_ratio(self, small_px=32, split=None):
+        """สัดส่วนกล่องที่พื้นที่ < small_px^2 พิกเซล ทั้งหมดและรายคลาส"""
+        box_mask = self.split_mask(split)[self.box_image]
+        w_px, h_px = self.box_pixels()
+        small = (w_px * h_px < small_px * small_px)[box_mask]
+        cls = self.boxes["cls"][box_mask].astype(np.int64)
+        nc = max(len(self.names), int(cls.max(initial=-1)) + 1)
+        total = np.bincount(cls, minlength=nc)
+        small_counts = np.bincount(cls, weights=small, minlength=nc)
+        per_class = {
+            self.names.get(c, str(c)): float(small_counts[c] / total[c]) if total[c] else 0.0 for c in range(nc)
+        }
+        return float(small.mean()) if small.size else 0.0, per_class
+
+    def box_size_distribution(self, split=None):
+        """percentile ของ sqrt(พื้นที่กล่อง) เป็นพิกเซล และ aspect ratio (w/h)"""
+        box_mask = self.split_mask(split)[self.box_image]
+        w_px, h_px = self.box_pixels()
+        w_px, h_px = w_px[box_mask], h_px[box_mask]
+        if not w_px.size:
+            return {}
+        quantiles = [5, 25, 50, 75, 95]
+        side = np.sqrt(w_px * h_px)
+        aspect = w_px / np.maximum(h_px, 1e-6)
+        return {
+            "side_px": dict(zip([f"p{q}" for q in quantiles], np.percentile(side, quantiles).round(1).tolist())),
+            "aspect": dict(zip([f"p{q}" for q in quantiles], np.percentile(aspect, quantiles).round(2).tolist())),
+        }
+
+    def status_counts(self):
+        counts = np.bincount(self.images["status"], minlength=len(STATUS_NAMES))
+        return {STATUS_NAMES[s]: int(counts[s]) for s in STATUS_NAMES}
+
+    def problems(self):
+        """[(path, สถานะ)] ของภาพที่ label ว่าง/หาย/เสีย หรือภาพอ่านไม่ได้"""
+        rows = np.flatnonzero(self.images["status"] != STATUS_OK)
+        return [(str(self.images["path"][i]), STATUS_NAMES[int(self.images["status"][i])]) for i in rows]
+
+    def duplicates(self):
+        """กลุ่มของภาพที่เนื้อไฟล์เหมือนกัน [[(path, split), ...], ...] (ซ้ำข้าม train/val ทำให้ผลประเมินสูงเกินจริง)"""
+        sha1 = self.images["sha1"]
+        valid = np.flatnonzero(sha1 != b"")
+        order = valid[np.argsort(sha1[valid], kind="stable")]
+        sorted_hashes = sha1[order]
+        groups = []
+        if order.size:
+            boundaries = np.flatnonzero(sorted_hashes[1:] != sorted_hashes[:-1]) + 1
+            for group in np.split(order, boundaries):
+                if group.size > 1:
+                    groups.append(
+                        [(str(self.images["path"][i]), self.meta["splits"][self.images["split"][i]]) for i in group]
+                    )
+        return groups
+
+    def sampling_weights(self, files):
+        """
+        น้ำหนักการสุ่มภาพแบบ class-balanced เรียงตาม files (ผลรวม = 1)
+        น้ำหนักภาพ = ค่าเฉลี่ยของ (กล่องทั้งหมด / กล่องของคลาสนั้น) ของทุกกล่องในภาพ
+        ภาพที่ไม่มีกล่องหรือไม่อยู่ใน index ได้น้ำหนักเท่าคลาสที่พบบ่อยที่สุด
+        """
+        cls = self.boxes["cls"].astype(np.int64)
+        counts = np.bincount(cls, minlength=max(len(self.names), int(cls.max(initial=-1)) + 1)).astype(np.float64)
+        class_weights = np.where(counts > 0, counts.sum() / np.maximum(counts, 1), 0.0)
+        box_weights = class_weights[cls]
+        per_image_sum = np.bincount(self.box_image, weights=box_weights, minlength=len(self))
+        n_boxes = self.images["n_boxes"]
+        base = float(class_weights[counts > 0].min()) if (counts > 0).any() else 1.0
+        per_image = np.where(n_boxes > 0, per_image_sum / np.maximum(n_boxes, 1), base)
+
+        lookup = {os.path.normcase(os.path.abspath(str(p))): i for i, p in enumerate(self.images["path"])}
+        weights = np.full(len(files), base, dtype=np.float64)
+        for slot, file in enumerate(files):
+            i = lookup.get(os.path.normcase(os.path.abspath(str(file))))
+            if i is not None:
+                weights[slot] = per_image[i]
+        return weights / weights.sum() if weights.sum() > 0 else weights
+
+    def summary(self, small_px=32):
+        small_all, small_per_class = self.small_object_ratio(small_px)
+        per_split = {split: int(self.split_mask(split).sum()) for split in self.meta["splits"]}
+        return {
+            "images": len(self),
+            "boxes": int(len(self.boxes["cls"])),
+            "images_per_split": per_split,
+            "status": self.status_counts(),
+            "class_counts": self.class_counts(),
+            "class_counts_per_split": {split: self.class_counts(split) for split in self.meta["splits"]},
+            "small_object_px": small_px,
+            "small_object_ratio": small_all,
+            "small_object_ratio_per_class": small_per_class,
+            "box_size": self.box_size_distribution(),
+            "duplicate_groups": len(self.duplicates()),
+        }
+
+
+def update_index(config=None):
+    """โหลด index เดิม (ถ้ามี) แล้วอ่านเฉพาะไฟล์ที่เปลี่ยน บันทึกและคืน LabelIndex"""
+    config = {**load_label_index_config(), **(config or {})}
+    out = Path(config["out"])
+    previous = None
+    if out.is_file():
+        try:
+            previous = LabelIndex.load(out)
+        except (OSError, KeyError, ValueError) as ex:
+            print(f"[LABELS] อ่าน index เดิมไม่ได้ ({ex}) สร้างใหม่ทั้งหมด")
+    start = time.perf_counter()
+    index, rescanned = LabelIndex.build(config["data"], config["splits"], previous, config["workers"])
+    index.save(out)
+    print(f"[LABELS] index {len(index)} ภาพ (อ่านใหม่ {rescanned}) ใน {time.perf_counter() - start:.1f} วินาที -> {out}")
+    return index
+
+
+def parse_args():
+    defaults = load_label_index_config()
+    parser = argparse.ArgumentParser(description="Build and query a columnar index of the YOLO label set")
+    parser.add_argument("--data", default=defaults["data"], help="Dataset YAML (default: train.data)")
+    parser.add_argument("--out", default=defaults["out"], help="Index file (.npz)")
+    parser.add_argument("--workers", type=int, default=defaults["workers"], help="Scan threads")
+    parser.add_argument("--small-px", type=int, default=defaults["small_px"], help="Small-object side length in pixels")
+    parser.add_argument("--no-update", action="store_true", help="Query the existing index without rescanning")
+    parser.add_argument("--duplicates", action="store_true", help="List byte-identical images")
+    parser.add_argument("--problems", action="store_true", help="List missing/empty/bad labels and unreadable images")
+    parser.add_argument("--json", default=None, help="Write the summary to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.no_update:
+        index = LabelIndex.load(args.out)
+    else:
+        index = update_index({"data": args.data, "out": args.out, "workers": args.workers})
+
+    summary = index.summary(args.small_px)
+    print("=====================================")
+    print(f"ภาพ {summary['images']} ({summary['images_per_split']}), กล่อง {summary['boxes']}")
+    print(f"สถานะ label: {summary['status']}")
+    print(f"{'คลาส':<18}{'กล่อง':>8}{'ภาพ':>8}{'เล็ก':>8}")
+    for name, counts in summary["class_counts"].items():
+        small = summary["small_object_ratio_per_class"].get(name, 0.0)
+        print(f"{name:<18}{counts['boxes']:>8}{counts['images']:>8}{small:>8.1%}")
+    print(f"วัตถุเล็ก (< {args.small_px}px^2): {summary['small_object_ratio']:.1%}")
+    print(f"ขนาดกล่อง: {summary['box_size']}")
+    print(f"กลุ่มภาพซ้ำ: {summary['duplicate_groups']}")
+
+    if args.duplicates:
+        for group in index.duplicates():
+            splits = {split for _, split in group}
+            note = " (ข้าม split!)" if len(splits) > 1 else ""
+            print(f"- ซ้ำ {len(group)} ภาพ{note}")
+            for path, split in group:
+                print(f"    [{split}] {path}")
+    if args.problems:
+        for path, status in index.problems():
+            print(f"- {status}: {path}")
+    if args.json:
+        out = Path(args.json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"บันทึกสถิติ: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# ------------------------------------
+# ไฟล์: model_reloader.py
+# ------------------------------------
+"""
+เปลี่ยนโมเดลของแอปที่รันอยู่เป็นโมเดลที่ promote ใหม่ โดยไม่ต้องปิด Gradio server / กล้อง
+
+- thread เฝ้าไฟล์ weights (ขนาด + mtime) และ manifest ที่ promote_best.py เขียนไว้ทุก poll_seconds
+- promote_best.py สลับ .pt ก่อน แล้ว export (promote.exports) ซึ่งอาจใช้หลายนาที และเขียน manifest เป็นขั้นสุดท้าย
+  จึงโหลดโมเดลใหม่เมื่อ size / mtime_ns ใน manifest ตรงกับไฟล์ weights แล้วเท่านั้น (promote เสร็จครบ
+  ไม่แย่งเขียนไฟล์ export เดียวกัน) จากนั้น warm-up + smoke test บนภาพเปล่าใน thread นี้
+  ถ้าโหลดหรือ smoke test ไม่ผ่านจะคงโมเดลเดิมไว้ (rollback)
+- โมเดลที่ผ่านแล้วถูกวางไว้เป็น pending ให้ thread ที่ประมวลผลเฟรมสลับเองระหว่างเฟรม (take_pending)
+  เฟรมหนึ่งเฟรมจึงใช้โมเดล + renderer ชุดเดียวกันเสมอ และไม่มีเฟรมไหนต้องรอการโหลด
+- version ของโมเดล = sha256[:12] จาก manifest (ถ้ายังตรงกับไฟล์) หรือ hash ของขนาด + mtime
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+
+def manifest_path(weights):
+    weights = Path(weights)
+    return weights.with_name(f"{weights.stem}.manifest.json")
+
+
+def file_signature(weights):
+    """(size, mtime_ns) ของไฟล์ weights หรือ None ถ้าไม่มีไฟล์"""
+    try:
+        stat = Path(weights).stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def manifest_version(weights, signature=None):
+    """sha256[:12] จาก manifest ถ้า manifest เขียนหลังไฟล์ weights ปัจจุบัน (size / mtime_ns ตรงกัน) ไม่งั้น None"""
+    signature = signature or file_signature(weights)
+    if signature is None:
+        return None
+    try:
+        manifest = json.loads(manifest_path(weights).read_text(encoding="utf-8"))
+        if (manifest.get("size"), manifest.get("mtime_ns")) == tuple(signature):
+            return manifest["sha256"][:12]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def model_version(weights):
+    """ชื่อ version สั้นๆ ของ weights สำหรับแสดงผล / metrics (ไม่มี manifest ใช้ hash ของขนาด + mtime)"""
+    signature = file_signature(weights)
+    if signature is None:
+        return "missing"
+    version = manifest_version(weights, signature)
+    if version is not None:
+        return version
+    return hashlib.sha1(f"{signature[0]}|{signature[1]}".encode("ascii")).hexdigest()[:12]
+
+
+class ModelReloader:
+    """
+    weights: path ของโมเดลที่เฝ้า (เช่น artifacts/models/waste-sorter-best.pt)
+    load_fn(weights) -> โมเดลใหม่ (โหลด + warm-up)
+    smoke_fn(model) -> ยก exception ถ้าโมเดลใช้ไม่ได้
+    prepare_fn(model) -> ของที่ต้องสลับพร้อมโมเดล (เช่น renderer) ไม่บังคับ
+    """
+
+    def __init__(self, weights, load_fn, smoke_fn, prepare_fn=None, poll_seconds=5.0):
+        self.weights = Path(weights)
+        self.load_fn = load_fn
+        self.smoke_fn = smoke_fn
+        self.prepare_fn = prepare_fn
+        self.poll_seconds = float(poll_seconds)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = None
+        self._active_signature = file_signature(self.weights)
+        self._seen_signature = self._active_signature
+        self.version = model_version(self.weights)
+        self.reloads = 0
+        self.failures = 0
+        self.frames_by_version = {}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker, name="model-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def take_pending(self):
+        """
+        เรียกจาก thread ที่ประมวลผลเฟรม ก่อนเริ่มเฟรม คืน (model, extra, version) ถ้ามีโมเดลใหม่รอสลับ
+        ไม่มีการล็อกถ้าไม่มี pending (เช็ค attribute เดียว) จึงแทบไม่มี overhead ต่อเฟรม
+        """
+        if self._pending is None:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return None
+        self.version = pending[2]
+        self.reloads += 1
+        return pending
+
+    def count_frame(self, version=None):
+        """นับเฟรมที่ version นี้ประมวลผล"""
+        version = version or self.version
+        self.frames_by_version[version] = self.frames_by_version.get(version, 0) + 1
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "pending": int(self._pending is not None),
+            "frames_current": self.frames_by_version.get(self.version, 0),
+        }
+
+    def check_once(self):
+        """poll หนึ่งครั้ง คืน True ถ้ามีโมเดลใหม่พร้อมสลับ"""
+        signature = file_signature(self.weights)
+        if signature is None or signature == self._active_signature:
+            self._seen_signature = signature
+            return False
+        version = manifest_version(self.weights, signature)
+        if version is None:
+            # promote ยังไม่เสร็จ (กำลัง export หรือยังไม่เขียน manifest) รอ poll ถัดไป
+            if signature != self._seen_signature:
+                print("[RELOAD] ไฟล์โมเดลเปลี่ยน รอ manifest จาก promote_best.py ก่อนโหลด")
+            self._seen_signature = signature
+            return False
+        self._seen_signature = signature
+        print(f"[RELOAD] พบโมเดลใหม่ {version} (ใช้อยู่ {self.version}) กำลังโหลด...")
+        try:
+            candidate = self.load_fn(self.weights)
+            self.smoke_fn(candidate)
+            extra = self.prepare_fn(candidate) if self.prepare_fn else None
+        except Exception as ex:
+            self.failures += 1
+            # ไม่ลองไฟล์เดิมซ้ำจนกว่าจะเปลี่ยนอีกครั้ง
+            self._active_signature = signature
+            print(f"[RELOAD] โมเดล {version} ใช้ไม่ได้ คงโมเดลเดิม {self.version}: {ex}")
+            return False
+        with self._lock:
+            self._pending = (candidate, extra, version)
+        self._active_signature = signature
+        print(f"[RELOAD] โมเดล {version} ผ่าน smoke test จะสลับในเฟรมถัดไป")
+        return True
+
+    def _worker(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check_once()
+            except Exception as ex:
+                print(f"[RELOAD] ตรวจไฟล์โมเดลไม่สำเร็จ: {ex}")
@@ -0,0 +1,69 @@
+# ------------------------------------
+# ไฟล์: motion_gate.py
+# ------------------------------------
+"""
+ตัวตรวจจับการเปลี่ยนแปลงของภาพแบบถูกๆ สำหรับข้าม inference เมื่อฉากไม่เปลี่ยน
+
+ย่อภาพเป็น grayscale ขนาดเล็ก แล้วเทียบกับภาพอ้างอิง (เฟรมล่าสุดที่รันโมเดลจริง)
+ถ้าสัดส่วน pixel ที่ต่างเกิน pixel_threshold น้อยกว่า changed_ratio ถือว่าฉากเดิม
+การเทียบกับเฟรมที่รันโมเดลล่าสุด (ไม่ใช่เฟรมก่อนหน้า) ทำให้การเปลี่ยนแปลงช้าๆ สะสมจนถูกตรวจพบได้
+"""
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    ตัดสินว่าเฟรมใหม่ต่างจากเฟรมอ้างอิงพอที่จะต้องรันโมเดลใหม่หรือไม่
+    """
+
+    def __init__(self, size=(64, 48), pixel_threshold=18, changed_ratio=0.01, max_skip_frames=30):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.changed_ratio = changed_ratio
+        # บังคับรันโมเดลอย่างน้อยทุกๆ N เฟรม กันผลค้างนานเกินไป
+        self.max_skip_frames = max_skip_frames
+        self._reference = None
+        self._skipped_in_row = 0
+        self.total = 0
+        self.skipped = 0
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        return small
+
+    def should_infer(self, frame):
+        """
+        คืนค่า True ถ้าต้องรันโมเดลกับเฟรมนี้ (ฉากเปลี่ยน / ยังไม่มีภาพอ้างอิง / ข้ามมานานเกินไป)
+        """
+        self.total += 1
+        thumb = self._thumbnail(frame)
+        if self._reference is None or self._skipped_in_row >= self.max_skip_frames:
+            return self._accept(thumb)
+
+        diff = cv2.absdiff(thumb, self._reference)
+        changed = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+        if changed >= self.changed_ratio:
+            return self._accept(thumb)
+
+        self.skipped += 1
+        self._skipped_in_row += 1
+        return False
+
+    def _accept(self, thumb):
+        self._reference = thumb
+        self._skipped_in_row = 0
+        return True
+
+    def reset(self):
+        self._reference = None
+        self._skipped_in_row = 0
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.total if self.total else 0.0
+
+    def stats(self):
+        return {"frames": self.total, "skipped": self.skipped, "skip_ratio": self.skip_ratio}
@@ -0,0 +1,215 @@
+# ------------------------------------
+# ไฟล์: perf_metrics.py
+# ------------------------------------
+"""
+ตัวจับเวลาแต่ละขั้นตอนบน hot path + สรุปเป็น p50/p95/p99 และ FPS
+
+- การจับเวลาแต่ละครั้งแค่เรียก perf_counter() และเขียนค่าลง ring buffer (ไม่มีการคำนวณบน hot path)
+- percentile คำนวณตอนมีคนอ่าน metrics เท่านั้น (Prometheus scrape หรือ Gradio panel)
+- เปิด endpoint แบบ Prometheus text format ที่ http://<host>:<port>/metrics
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+METRIC_PREFIX = "waste_sorter"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RollingHistogram:
+    """เก็บค่าล่าสุด window ค่าใน ring buffer พร้อม count/sum สะสม"""
+
+    def __init__(self, window=1024):
+        self._values = np.zeros(window, dtype=np.float64)
+        self._window = window
+        self._index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self._window
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, qs=QUANTILES):
+        n = min(self.count, self._window)
+        if n == 0:
+            return {q: None for q in qs}
+        values = np.quantile(self._values[:n], qs)
+        return dict(zip(qs, values.tolist()))
+
+
+class PerfMetrics:
+    """
+    registry ของ histogram ต่อ stage, FPS และ gauge จาก collector ภายนอก
+    """
+
+    def __init__(self, window=1024, fps_window=120, enabled=True):
+        self.enabled = enabled
+        self._window = window
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._frame_times = np.zeros(fps_window, dtype=np.float64)
+        self._frame_index = 0
+        self.frames = 0
+        self._collectors = []
+
+    def observe(self, stage, seconds):
+        if not self.enabled or seconds is None:
+            return
+        hist = self._stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self._stages.setdefault(stage, RollingHistogram(self._window))
+        hist.add(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """จับเวลา block ของโค้ด: with metrics.time("inference"): ..."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def frame_done(self):
+        """เรียกหนึ่งครั้งต่อเฟรมที่ส่งกลับไปแสดงผล (ใช้คำนวณ FPS)"""
+        if not self.enabled:
+            return
+        self._frame_times[self._frame_index % len(self._frame_times)] = time.perf_counter()
+        self._frame_index += 1
+        self.frames += 1
+
+    def fps(self):
+        n = min(self._frame_index, len(self._frame_times))
+        if n < 2:
+            return 0.0
+        times = self._frame_times[:n]
+        span = times.max() - times.min()
+        return (n - 1) / span if span > 0 else 0.0
+
+    def reset(self):
+        """ล้างค่าที่เก็บไว้ทั้งหมด (collector ยังอยู่) เช่น ระหว่างรอบของ benchmark"""
+        with self._lock:
+            self._stages = {}
+        self._frame_times[:] = 0.0
+        self._frame_index = 0
+        self.frames = 0
+
+    def register_collector(self, fn):
+        """fn() -> dict {ชื่อ gauge: ค่า} จะถูกเรียกตอน export (เช่น จำนวนเฟรมที่ drop)"""
+        self._collectors.append(fn)
+
+    def snapshot(self):
+        """สรุปค่าทั้งหมด: {"stages": {stage: {...}}, "fps": float, "gauges": {...}}"""
+        with self._lock:
+            stages = dict(self._stages)
+        summary = {}
+        for stage, hist in sorted(stages.items()):
+            quantiles = hist.quantiles()
+            summary[stage] = {
+                "count": hist.count,
+                "sum": hist.total,
+                "p50": quantiles[0.5],
+                "p95": quantiles[0.95],
+                "p99": quantiles[0.99],
+            }
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                gauges.update(collector())
+            except Exception as ex:
+                print(f"[METRICS] collector error: {ex}")
+        return {"stages": summary, "fps": self.fps(), "frames": self.frames, "gauges": gauges}
+
+    def render_prometheus(self):
+        snap = self.snapshot()
+        name = f"{METRIC_PREFIX}_stage_latency_seconds"
+        lines = [
+            f"# HELP {name} Per-stage latency of the live detection path (rolling window quantiles).",
+            f"# TYPE {name} summary",
+        ]
+        for stage, stats in snap["stages"].items():
+            for key, quantile in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+                if stats[key] is not None:
+                    lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}} {stats[key]:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_fps Frames returned per second (rolling window).",
+            f"# TYPE {METRIC_PREFIX}_fps gauge",
+            f"{METRIC_PREFIX}_fps {snap['fps']:.3f}",
+            f"# TYPE {METRIC_PREFIX}_frames_total counter",
+            f"{METRIC_PREFIX}_frames_total {snap['frames']}",
+        ]
+        for key, value in sorted(snap["gauges"].items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{key} gauge")
+                lines.append(f"{METRIC_PREFIX}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    def render_text_panel(self):
+        """ข้อความสรุปสำหรับแสดงใน Gradio"""
+        snap = self.snapshot()
+        lines = [f"FPS: {snap['fps']:.1f}  (frames: {snap['frames']})", ""]
+        lines.append(f"{'stage':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'count':>9}")
+        for stage, stats in snap["stages"].items():
+            cells = [f"{stats[k] * 1000:9.2f}" if stats[k] is not None else f"{'-':>9}" for k in ("p50", "p95", "p99")]
+            lines.append(f"{stage:<16}{''.join(cells)}{stats['count']:>9}")
+        if snap["gauges"]:
+            lines.append("")
+            lines += [f"{key}: {value}" for key, value in sorted(snap["gauges"].items())]
+        return "\n".join(lines)
+
+
+def peak_rss_mb():
+    """peak resident memory ของ process นี้ (MB)"""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux รายงานเป็น KB, macOS เป็น bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+
+
+def start_metrics_server(metrics, port=9108, host="0.0.0.0"):
+    """เปิด HTTP server ใน background thread ให้ Prometheus scrape ที่ /metrics"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    print(f"[METRICS] Prometheus endpoint: http://{host}:{port}/metrics")
+    return server
+
+
+# instance กลางที่ใช้ร่วมกันทั้งโปรแกรม
+metrics = PerfMetrics()
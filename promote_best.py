@@ -1,10 +1,25 @@
 """
 Utility script to copy the latest YOLO best weights into a canonical artifact
 path so DVC can track the single file instead of the entire `runs` directory.
+
+Promotion is content-addressed:
+- identical weights are left untouched (same inode/mtime, so DVC does not
+  re-hash the file and downstream stages stay up to date);
+- changed weights are reflinked (copy-on-write) or hardlinked when the
+  filesystem supports it, otherwise copied, and always swapped in atomically;
+- a manifest (hash, source run, metrics, class map, exports) is written next
+  to the weights;
+- the runtime exports listed in `promote.exports` are built in the same step
+  so apps load a ready-made fast artifact instead of converting at startup.
 """
 
 import argparse
+import csv
+import hashlib
+import json
+import os
 import shutil
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
@@ -18,18 +33,36 @@ except ImportError:
 
 DEFAULT_DEST = "artifacts/models/waste-sorter-best.pt"
 
+DEFAULT_PROMOTE_CONFIG = {
+    "link": "auto",      # auto = reflink แล้วค่อย copy, hardlink = hardlink แล้วค่อย copy, copy = copy เสมอ
+    "exports": [],       # backend ที่ export ไว้ล่วงหน้า เช่น [onnx, openvino]
+}
 
-def _load_default_dest():
+LINK_MODES = ("auto", "hardlink", "copy")
+
+
+def _load_params():
     params_path = Path("params.yaml")
     if params_path.exists():
-        params = yaml.safe_load(params_path.read_text(encoding="utf-8")) or {}
-        evaluate_cfg = params.get("evaluate", {})
-        if evaluate_cfg.get("weights"):
-            return evaluate_cfg["weights"]
+        return yaml.safe_load(params_path.read_text(encoding="utf-8")) or {}
+    return {}
+
+
+def _load_default_dest():
+    evaluate_cfg = _load_params().get("evaluate", {})
+    if evaluate_cfg.get("weights"):
+        return evaluate_cfg["weights"]
     return DEFAULT_DEST
 
 
+def load_promote_config():
+    config = DEFAULT_PROMOTE_CONFIG.copy()
+    config.update(_load_params().get("promote", {}) or {})
+    return config
+
+
 def parse_args():
+    defaults = load_promote_config()
     parser = argparse.ArgumentParser(description="Copy best.pt into artifacts")
     parser.add_argument(
         "--source",
@@ -40,6 +73,28 @@ def parse_args():
         default=_load_default_dest(),
         help="Destination path for promoted weights",
     )
+    parser.add_argument(
+        "--link",
+        default=defaults["link"],
+        choices=LINK_MODES,
+        help="How to materialize new weights (reflink/hardlink fall back to copy)",
+    )
+    parser.add_argument(
+        "--exports",
+        nargs="*",
+        default=defaults["exports"],
+        help="Runtime backends to export right after promotion (e.g. onnx openvino)",
+    )
+    parser.add_argument(
+        "--no-export",
+        action="store_true",
+        help="Skip runtime exports (weights + manifest only)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Replace the destination even if the content is identical",
+    )
     return parser.parse_args()
 
 
@@ -56,6 +111,142 @@ def resolve_source(user_source: Optional[str]) -> Path:
     return Path("runs") / "detect" / run_name / "weights" / "best.pt"
 
 
+def manifest_path(dest: Path) -> Path:
+    return dest.with_name(f"{dest.stem}.manifest.json")
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dest_sha256(dest: Path) -> Optional[str]:
+    """hash ของไฟล์ปลายทาง ใช้ค่าใน manifest ถ้าขนาด/mtime ยังตรง (ไม่ต้องอ่านไฟล์ใหญ่ซ้ำ)"""
+    if not dest.is_file():
+        return None
+    stat = dest.stat()
+    try:
+        manifest = json.loads(manifest_path(dest).read_text(encoding="utf-8"))
+        if manifest.get("size") == stat.st_size and manifest.get("mtime_ns") == stat.st_mtime_ns:
+            return manifest["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return file_sha256(dest)
+
+
+def _reflink(source: Path, target: Path) -> bool:
+    """copy-on-write clone (Linux FICLONE: btrfs, XFS) คืน False ถ้าระบบไฟล์ไม่รองรับ"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    ficlone = 0x40049409
+    try:
+        with source.open("rb") as src, target.open("wb") as dst:
+            fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+    except OSError:
+        target.unlink(missing_ok=True)
+        return False
+    shutil.copystat(source, target)
+    return True
+
+
+def materialize(source: Path, dest: Path, link: str = "auto") -> str:
+    """
+    วางไฟล์ source ที่ dest ผ่านไฟล์ชั่วคราวแล้ว rename (ไม่มีช่วงที่ dest ขาดครึ่ง)
+    คืนวิธีที่ใช้: reflink / hardlink / copy
+
+    hardlink ใช้ inode เดียวกับไฟล์ใน runs/ ถ้ามีอะไรเขียนทับ best.pt แบบ in-place
+    (เช่น resume การเทรน run เดิม) ไฟล์ที่ promote แล้วจะเปลี่ยนตาม จึงเป็นตัวเลือกที่ต้องเลือกเอง
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_name(f".{dest.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    method = "copy"
+    if link == "auto" and _reflink(source, tmp_path):
+        method = "reflink"
+    elif link == "hardlink":
+        try:
+            os.link(source, tmp_path)
+            method = "hardlink"
+        except OSError:
+            pass
+    if method == "copy":
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, dest)
+    return method
+
+
+def read_run_metrics(run_dir: Path) -> dict:
+    """ค่าจาก results.csv ของ run ที่ epoch ซึ่ง fitness สูงสุด (epoch ของ best.pt)"""
+    results_csv = run_dir / "results.csv"
+    if not results_csv.is_file():
+        return {}
+    with results_csv.open("r", encoding="utf-8") as fp:
+        rows = [{k.strip(): v.strip() for k, v in row.items() if k} for row in csv.DictReader(fp)]
+
+    def _float(row, key):
+        try:
+            return float(row.get(key, ""))
+        except ValueError:
+            return None
+
+    def _fitness(row):
+        return 0.1 * (_float(row, "metrics/mAP50(B)") or 0.0) + 0.9 * (_float(row, "metrics/mAP50-95(B)") or 0.0)
+
+    if not rows:
+        return {}
+    best = max(rows, key=_fitness)
+    return {
+        "epoch": int(float(best.get("epoch", 0))),
+        "precision": _float(best, "metrics/precision(B)"),
+        "recall": _float(best, "metrics/recall(B)"),
+        "map50": _float(best, "metrics/mAP50(B)"),
+        "map50_95": _float(best, "metrics/mAP50-95(B)"),
+        "fitness": _fitness(best),
+    }
+
+
+def read_class_map(run_dir: Path) -> dict:
+    """ชื่อคลาสจาก args.yaml ของ run -> dataset YAML ที่ใช้เทรน"""
+    args_path = run_dir / "args.yaml"
+    data = None
+    if args_path.is_file():
+        data = (yaml.safe_load(args_path.read_text(encoding="utf-8")) or {}).get("data")
+    if not data and load_train_config is not None:
+        data = load_train_config().get("data")
+    if not data or not Path(data).is_file():
+        return {}
+    names = (yaml.safe_load(Path(data).read_text(encoding="utf-8")) or {}).get("names", {})
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+    return {str(k): v for k, v in names.items()}
+
+
+def build_exports(dest: Path, backends):
+    """
+    export โมเดลที่ promote แล้วเป็น runtime ที่กำหนด (ใช้ cache เดิมถ้ายังตรงกับ weights)
+    คืน (exports ที่สำเร็จ, รายชื่อ backend ที่ export ไม่สำเร็จ)
+    """
+    if not backends:
+        return {}, []
+    from inference_backends import export_model
+
+    exports, failed = {}, []
+    for backend in backends:
+        if backend == "pytorch":
+            continue
+        try:
+            exports[backend] = str(export_model(dest, backend))
+        except Exception as ex:
+            failed.append(backend)
+            print(f"Export {backend} failed: {ex}")
+    return exports, failed
+
+
 def main():
     args = parse_args()
     source = resolve_source(args.source)
@@ -64,11 +255,43 @@ def main():
     if not source.is_file():
         raise FileNotFoundError(f"ไม่พบไฟล์โมเดล: {source}")
 
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(source, dest)
-    print(f"Copied latest weights from {source} -> {dest}")
+    source_hash = file_sha256(source)
+    if not args.force and dest_sha256(dest) == source_hash:
+        method = "unchanged"
+        print(f"Weights unchanged ({source_hash[:12]}), keeping {dest}")
+    else:
+        method = materialize(source, dest, args.link)
+        print(f"Promoted weights from {source} -> {dest} ({method}, {source_hash[:12]})")
+
+    exports, failed = ({}, []) if args.no_export else build_exports(dest, args.exports)
+    run_dir = source.parent.parent
+    stat = dest.stat()
+    manifest = {
+        "sha256": source_hash,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "source": str(source),
+        "source_run": run_dir.name,
+        "promoted_at": datetime.now().isoformat(timespec="seconds"),
+        "method": method,
+        "metrics": read_run_metrics(run_dir),
+        "names": read_class_map(run_dir),
+        "exports": exports,
+    }
+    previous = {}
+    if manifest_path(dest).is_file():
+        try:
+            previous = json.loads(manifest_path(dest).read_text(encoding="utf-8"))
+        except ValueError:
+            previous = {}
+    if method == "unchanged" and previous.get("promoted_at"):
+        # น้ำหนักเดิม: คงเวลาที่ promote ครั้งแรกไว้
+        manifest["promoted_at"] = previous["promoted_at"]
+    manifest_path(dest).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Manifest: {manifest_path(dest)}")
+    if failed:
+        raise SystemExit(f"Export failed for: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,224 @@
+# ------------------------------------
+# ไฟล์: quantize.py
+# ------------------------------------
+"""
+DVC stage: quantize โมเดลที่ promote แล้วเป็น INT8 (OpenVINO + NNCF post-training quantization)
+
+1. export artifacts/models/waste-sorter-best.pt เป็น OpenVINO INT8 โดย calibrate จากภาพส่วนหนึ่งของ train split
+2. ประเมินทั้งโมเดล FP32 (.pt) และ INT8 ใน stage นี้ด้วย val(...) ชุดเดียวกัน (batch 1, CPU, ไม่ใช้ rect)
+   ไม่ใช้ artifacts/eval/metrics.json เพราะอาจมาจาก weights/backend/โหมด streaming อื่น
+   และ batch/rect ที่ต่างกันก็ทำให้ mAP ต่างกันเกิน budget ได้เอง
+3. วัด latency บน CPU ของทั้ง FP32 และ INT8 บนภาพชุดเดียวกันจาก val split
+4. เขียน artifacts/quantize/metrics.json (mAP ที่ลดลง, latency, speedup, ผ่าน budget หรือไม่)
+
+ถ้า mAP50-95 ลดลงไม่เกิน quantize.max_map_drop และตั้ง inference.prefer_quantized: true
+แอปจะโหลดโมเดล INT8 แทน (ดู inference_backends.quantized_model_path)
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from evaluate import load_eval_config, write_metrics_summary
+from inference_backends import quantized_export_path, weights_signature
+
+
+DEFAULT_QUANTIZE_CONFIG = {
+    "weights": "artifacts/models/waste-sorter-best.pt",
+    "data": "waste-detection/data.yaml",
+    "calib_split": "train",
+    "calib_fraction": 0.1,
+    "max_map_drop": 0.01,
+    "latency_images": 50,
+    "latency_warmup": 5,
+    "baseline_metrics": "artifacts/quantize/fp32_eval.json",
+    "metrics_out": "artifacts/quantize/metrics.json",
+}
+
+
+def load_quantize_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_QUANTIZE_CONFIG.copy()
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("quantize", {}))
+    return config
+
+
+def parse_args():
+    defaults = load_quantize_config()
+    parser = argparse.ArgumentParser(description="INT8 post-training quantization (OpenVINO) with accuracy check")
+    parser.add_argument("--weights", default=defaults["weights"], help="Promoted FP32 weights (.pt)")
+    parser.add_argument("--data", default=defaults["data"], help="Dataset YAML used for calibration")
+    parser.add_argument(
+        "--calib-split",
+        default=defaults["calib_split"],
+        choices=["train", "val", "test"],
+        help="Split sampled for INT8 calibration",
+    )
+    parser.add_argument(
+        "--calib-fraction",
+        type=float,
+        default=defaults["calib_fraction"],
+        help="Fraction of the calibration split to use",
+    )
+    parser.add_argument(
+        "--max-map-drop",
+        type=float,
+        default=defaults["max_map_drop"],
+        help="Largest acceptable mAP50-95 drop (absolute) for deployment",
+    )
+    parser.add_argument("--latency-images", type=int, default=defaults["latency_images"], help="Images timed per model")
+    parser.add_argument("--latency-warmup", type=int, default=defaults["latency_warmup"], help="Untimed warm-up runs")
+    parser.add_argument(
+        "--baseline-metrics",
+        default=defaults["baseline_metrics"],
+        help="Where to write FP32 metrics measured with the same protocol as INT8",
+    )
+    parser.add_argument("--metrics-out", default=defaults["metrics_out"], help="Where to write the quantization report")
+    return parser.parse_args()
+
+
+def export_int8(weights, data, split, fraction, imgsz):
+    from ultralytics import YOLO
+
+    print(f"[QUANT] export INT8 (OpenVINO) จาก {weights} calibrate ด้วย {split} split x{fraction}")
+    output = YOLO(str(weights)).export(
+        format="openvino",
+        int8=True,
+        data=data,
+        split=split,
+        fraction=fraction,
+        imgsz=imgsz,
+        device="cpu",
+    )
+    return Path(output)
+
+
+def validate(model, eval_config, out_path):
+    """
+    ประเมินโมเดลด้วย protocol เดียวกันทั้ง FP32 และ INT8 แล้วคืน summary (เขียนไว้ที่ out_path ด้วย)
+    export แบบ static รับได้แค่ batch 1 และไม่ใช้ rect จึงบังคับค่าเดียวกันกับ .pt
+    """
+    val_metrics = model.val(
+        data=eval_config["data"],
+        split=eval_config["split"],
+        imgsz=eval_config["imgsz"],
+        batch=1,
+        rect=False,
+        device="cpu",
+        conf=eval_config["conf"],
+        iou=eval_config["iou"],
+        plots=False,
+    )
+    write_metrics_summary(val_metrics, out_path)
+    return json.loads(Path(out_path).read_text(encoding="utf-8"))
+
+
+def latency_images(data, count):
+    """ภาพจาก val split (เรียงตามชื่อ จึงได้ชุดเดิมทุกครั้ง) ถ้าไม่มีใช้ภาพสุ่มแบบ fix seed"""
+    import cv2
+    from ultralytics.data.utils import check_det_dataset
+
+    images = []
+    try:
+        val = check_det_dataset(data)["val"]
+        val_dirs = val if isinstance(val, list) else [val]
+        files = sorted(
+            p for d in val_dirs for p in Path(d).rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"}
+        )
+        images = [cv2.imread(str(p)) for p in files[:count]]
+        images = [img for img in images if img is not None]
+    except Exception as ex:
+        print(f"[QUANT] อ่านภาพ val ไม่ได้ ({ex}) ใช้ภาพสุ่มแทน")
+    if not images:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+    return images
+
+
+def measure_cpu_latency(model, images, imgsz, warmup):
+    """คืน dict ของ latency (ms) ต่อภาพบน CPU ไม่รวมรอบ warm-up"""
+    for image in images[:warmup]:
+        model.predict(image, imgsz=imgsz, device="cpu", verbose=False)
+    timings = []
+    for image in images:
+        start = time.perf_counter()
+        model.predict(image, imgsz=imgsz, device="cpu", verbose=False)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    timings.sort()
+    return {
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        "mean_ms": statistics.fmean(timings),
+    }
+
+
+def main():
+    from ultralytics import YOLO
+
+    args = parse_args()
+    eval_config = load_eval_config()
+    weights = Path(args.weights)
+    if not weights.is_file():
+        print(f"ไม่พบไฟล์ weights: {weights}", file=sys.stderr)
+        sys.exit(1)
+
+    # 1. export INT8
+    int8_path = export_int8(weights, args.data, args.calib_split, args.calib_fraction, eval_config["imgsz"])
+    expected = quantized_export_path(weights)
+    if int8_path.resolve() != expected.resolve():
+        print(f"[QUANT] WARNING: ultralytics export ไปที่ {int8_path} (คาดไว้ {expected})")
+
+    # 2. ประเมินความแม่นยำของ FP32 และ INT8 ด้วย protocol เดียวกัน
+    fp32_model = YOLO(str(weights))
+    int8_model = YOLO(str(int8_path), task="detect")
+    print("[QUANT] ประเมินโมเดล FP32...")
+    baseline = validate(fp32_model, eval_config, args.baseline_metrics)
+    print("[QUANT] ประเมินโมเดล INT8...")
+    int8_eval = validate(int8_model, eval_config, Path(args.metrics_out).with_name("int8_eval.json"))
+
+    # 3. latency บน CPU (ภาพชุดเดียวกันทั้งสองโมเดล)
+    images = latency_images(eval_config["data"], args.latency_images)
+    print(f"[QUANT] วัด latency บน CPU ({len(images)} ภาพ)...")
+    fp32_latency = measure_cpu_latency(fp32_model, images, eval_config["imgsz"], args.latency_warmup)
+    int8_latency = measure_cpu_latency(int8_model, images, eval_config["imgsz"], args.latency_warmup)
+
+    # 4. สรุปผล
+    map_drop = baseline["map50_95"] - int8_eval["map50_95"]
+    report = {
+        "fp32_map50": baseline.get("map50"),
+        "fp32_map50_95": baseline["map50_95"],
+        "int8_map50": int8_eval.get("map50"),
+        "int8_map50_95": int8_eval["map50_95"],
+        "map50_drop": (baseline.get("map50") or 0.0) - (int8_eval.get("map50") or 0.0),
+        "map50_95_drop": map_drop,
+        "max_map_drop": args.max_map_drop,
+        "within_budget": bool(map_drop <= args.max_map_drop),
+        "fp32_cpu_p50_ms": fp32_latency["p50_ms"],
+        "fp32_cpu_p95_ms": fp32_latency["p95_ms"],
+        "int8_cpu_p50_ms": int8_latency["p50_ms"],
+        "int8_cpu_p95_ms": int8_latency["p95_ms"],
+        "cpu_speedup": fp32_latency["p50_ms"] / int8_latency["p50_ms"] if int8_latency["p50_ms"] else None,
+        "int8_model": str(int8_path),
+        "source": weights_signature(weights),
+    }
+    out_path = Path(args.metrics_out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print("=====================================")
+    print(f"mAP50-95 : {report['fp32_map50_95']:.4f} -> {report['int8_map50_95']:.4f} (ลดลง {map_drop:.4f}, budget {args.max_map_drop})")
+    print(f"CPU p50  : {report['fp32_cpu_p50_ms']:.1f} ms -> {report['int8_cpu_p50_ms']:.1f} ms (x{report['cpu_speedup']:.2f})")
+    print(f"Deploy   : {'ใช้ INT8 ได้' if report['within_budget'] else 'ไม่ผ่าน budget - ใช้ FP32 ต่อ'}")
+    print(f"Report   : {out_path}")
+
+
+if __name__ == "__main__":
+    main()
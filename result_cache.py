@@ -0,0 +1,272 @@
+# ------------------------------------
+# ไฟล์: result_cache.py
+# ------------------------------------
+"""
+cache ผลตรวจจับตามเนื้อหาของภาพ (content-addressed) สำหรับภาพที่ถูกส่งมาซ้ำ
+เช่น รัน test_images.py กับโฟลเดอร์เดิม หรือระบบอื่นส่งภาพเดิมเข้า inference_api.py
+
+- key = hash ของ bytes ภาพ (ตรงกันทุก byte เท่านั้น) + hash ของไฟล์ weights + พารามิเตอร์ inference
+  (imgsz, conf, iou, backend ...) ถ้าไฟล์ใน artifacts/models/ เปลี่ยน key จะเปลี่ยนตามเองโดยไม่ต้องล้าง cache
+- ชั้นแรกเป็น LRU ในหน่วยความจำ ชั้นที่สองเป็นไฟล์ .npz บนดิสก์ ลบไฟล์ที่ไม่ได้ใช้นานที่สุดเมื่อเกินขนาดที่กำหนด
+- เก็บเฉพาะ boxes.data (x1, y1, x2, y2, conf, cls) และขนาดภาพ ไม่เก็บภาพ
+
+ดูสถิติ / ล้าง cache:
+    python result_cache.py --stats
+    python result_cache.py --clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+
+DEFAULT_CACHE_CONFIG = {
+    "enabled": False,
+    "dir": "artifacts/result_cache",
+    "memory_items": 512,
+    "disk_max_mb": 256,
+}
+
+_weights_hashes = {}
+_weights_lock = threading.Lock()
+
+
+def load_cache_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_CACHE_CONFIG.copy()
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("result_cache", {}))
+    return config
+
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_array(image):
+    """hash ของภาพที่ decode แล้ว (ใช้กับเฟรมที่ไม่มี bytes ต้นฉบับ)"""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha1(str(image.shape).encode("ascii"))
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+def weights_fingerprint(weights):
+    """
+    hash ของไฟล์ weights (หรือทุกไฟล์ในโฟลเดอร์ เช่น *_openvino_model/)
+    จำค่าไว้ตาม (ขนาด, mtime) จึงอ่านไฟล์ใหม่เฉพาะเมื่อไฟล์เปลี่ยน
+    """
+    path = Path(weights)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    stamp = tuple((str(p), p.stat().st_size, p.stat().st_mtime_ns) for p in files)
+    with _weights_lock:
+        cached = _weights_hashes.get(str(path))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    digest = hashlib.sha1()
+    for file in files:
+        digest.update(file.relative_to(path).as_posix().encode("utf-8") if path.is_dir() else b"")
+        with file.open("rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(chunk)
+    fingerprint = digest.hexdigest()
+    with _weights_lock:
+        _weights_hashes[str(path)] = (stamp, fingerprint)
+    return fingerprint
+
+
+def result_to_array(result):
+    """ultralytics Results -> (boxes.data แบบ float32 numpy, (h, w))"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        data = np.zeros((0, 6), dtype=np.float32)
+    else:
+        data = boxes.data
+        data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+        data = data.astype(np.float32)
+    return data, tuple(int(v) for v in result.orig_shape)
+
+
+def array_to_result(data, orig_img, names, path=""):
+    """สร้าง Results จากข้อมูลใน cache (ใช้กับ renderer / result.plot() / result.save() ได้ตามปกติ)"""
+    from ultralytics.engine.results import Results
+
+    return Results(orig_img, path=path, names=names, boxes=data)
+
+
+class ResultCache:
+    """
+    cache สองชั้น: LRU ในหน่วยความจำ + ไฟล์ .npz บนดิสก์ (จำกัดขนาดรวม)
+
+    weights: path ของไฟล์ weights ที่ใช้สร้างผล (.pt หรือไฟล์/โฟลเดอร์ที่ export แล้ว)
+    """
+
+    def __init__(self, weights, cache_dir=DEFAULT_CACHE_CONFIG["dir"], memory_items=512, disk_max_mb=256):
+        self.weights_hash = weights_fingerprint(weights)
+        self.cache_dir = Path(cache_dir)
+        self.memory_items = max(0, int(memory_items))
+        self.disk_max_bytes = int(float(disk_max_mb) * 1024 * 1024)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_bytes = self._scan_disk() if self.disk_max_bytes > 0 else 0
+
+    @classmethod
+    def from_config(cls, weights, config=None):
+        """สร้างจาก result_cache.* ใน params.yaml คืน None ถ้าไม่ได้เปิดใช้"""
+        config = {**load_cache_config(), **(config or {})}
+        if not config["enabled"]:
+            return None
+        return cls(weights, config["dir"], config["memory_items"], config["disk_max_mb"])
+
+    def key(self, content_hash, weights_hash=None, **params):
+        """
+        key ของภาพหนึ่งภาพ: content_hash จาก hash_bytes()/hash_array() + พารามิเตอร์ inference
+        weights_hash: hash ของ weights ที่ใช้จริง (ค่าเริ่มต้น = weights ตอนสร้าง cache)
+        """
+        payload = json.dumps({"weights": weights_hash or self.weights_hash, "params": params}, sort_keys=True, default=str)
+        return hash_bytes(f"{content_hash}:{payload}".encode("utf-8"))
+
+    def _disk_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    def get(self, key):
+        """คืน (data, orig_shape) หรือ None ถ้ายังไม่มี"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        if self.disk_max_bytes > 0:
+            path = self._disk_path(key)
+            try:
+                with np.load(path) as npz:
+                    entry = (npz["data"], tuple(int(v) for v in npz["shape"]))
+                os.utime(path)  # ใช้ mtime เป็นเวลาที่ใช้ล่าสุดสำหรับการลบแบบ LRU
+            except (OSError, ValueError, KeyError):
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, entry)
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data, orig_shape):
+        entry = (np.asarray(data, dtype=np.float32), tuple(int(v) for v in orig_shape))
+        with self._lock:
+            self._remember(key, entry)
+        if self.disk_max_bytes > 0:
+            self._write_disk(key, entry)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_mb": self._disk_bytes / (1024 * 1024),
+                "evictions": self.evictions,
+            }
+
+    def _remember(self, key, entry):
+        if self.memory_items == 0:
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{key}.tmp{os.getpid()}-{threading.get_ident()}.npz")
+        try:
+            np.savez(tmp_path, data=entry[0], shape=np.asarray(entry[1], dtype=np.int32))
+            size = tmp_path.stat().st_size
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            print(f"[CACHE] เขียน cache ไม่สำเร็จ: {ex}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_bytes += size
+            over_limit = self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _scan_disk(self):
+        if not self.cache_dir.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*/*.npz"))
+
+    def _evict_disk(self):
+        """ลบไฟล์ที่ไม่ได้ใช้นานที่สุดจนขนาดรวมเหลือไม่เกิน 90% ของขีดจำกัด"""
+        entries = []
+        for path in self.cache_dir.glob("*/*.npz"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.evictions += evicted
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect or clear the detection result cache")
+    parser.add_argument("--dir", default=None, help="Cache directory (default: result_cache.dir in params.yaml)")
+    parser.add_argument("--stats", action="store_true", help="Print entry count and size on disk")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached result")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cache_dir = Path(args.dir or load_cache_config()["dir"])
+    if args.clear:
+        if cache_dir.exists():
+            shutil.rmtree(cache_dir)
+        print(f"ล้าง cache แล้ว: {cache_dir}")
+        return
+    files = list(cache_dir.glob("*/*.npz")) if cache_dir.exists() else []
+    size_mb = sum(p.stat().st_size for p in files) / (1024 * 1024)
+    print(f"cache: {cache_dir} -> {len(files)} รายการ, {size_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
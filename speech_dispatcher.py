@@ -0,0 +1,112 @@
+# ------------------------------------
+# ไฟล์: speech_dispatcher.py
+# ------------------------------------
+"""
+คิวข้อความเสียงแบบ event-driven (ไม่มีการ poll)
+
+- ข้อความของขยะอันตราย (priority ต่ำกว่า = สำคัญกว่า) ถูกพูดก่อนข้อความทั่วไป
+- ข้อความที่รอนานเกิน ttl_seconds จะถูกทิ้ง (ของชิ้นนั้นน่าจะออกจากกล้องไปแล้ว)
+- ถ้าคลาสเดียวกันถูกส่งซ้ำขณะยังรออยู่ในคิว จะรวมเป็นข้อความเดียว (ใช้เวลาล่าสุด)
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class SpeechDispatcher:
+    """
+    priority queue + Condition: worker เรียก get() แล้วหลับจนมีข้อความใหม่หรือถูกปิด
+    """
+
+    def __init__(self, ttl_seconds=8.0):
+        self.ttl_seconds = ttl_seconds
+        self._cond = threading.Condition()
+        self._heap = []
+        self._pending = {}  # key -> entry ที่ยังรออยู่ (ใช้รวมข้อความซ้ำ)
+        self._seq = itertools.count()
+        self._closed = False
+        self.enqueued = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.dispatched = 0
+        self.rejected = 0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, key, text, priority=1, now=None):
+        """
+        ส่งข้อความเข้าคิว (ไม่ block) คืนค่า False ถ้าถูกรวมกับข้อความเดิมที่ยังรออยู่
+        หรือ dispatcher ถูกปิดแล้ว (แยกได้จาก closed / ตัวนับ rejected)
+        """
+        now = time.monotonic() if now is None else now
+        with self._cond:
+            if self._closed:
+                self.rejected += 1
+                return False
+            entry = self._pending.get(key)
+            if entry is not None:
+                # รวมกับข้อความเดิม: ต่ออายุ และขยับขึ้นถ้า priority ใหม่สำคัญกว่า
+                entry[3] = now
+                self.coalesced += 1
+                if priority < entry[0]:
+                    entry[4] = False
+                    self._push(key, text, priority, now)
+                return False
+            self._push(key, text, priority, now)
+            self.enqueued += 1
+            self._cond.notify()
+            return True
+
+    def _push(self, key, text, priority, now):
+        # entry: [priority, seq, key, enqueued_at, valid, text]
+        entry = [priority, next(self._seq), key, now, True, text]
+        self._pending[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def get(self):
+        """
+        รอจนมีข้อความที่ยังไม่หมดอายุ คืน (key, text) หรือ None เมื่อ dispatcher ถูกปิด
+        """
+        with self._cond:
+            while True:
+                while self._heap:
+                    priority, _, key, enqueued_at, valid, text = heapq.heappop(self._heap)
+                    if not valid:
+                        continue
+                    self._pending.pop(key, None)
+                    if time.monotonic() - enqueued_at > self.ttl_seconds:
+                        self.expired += 1
+                        continue
+                    self.dispatched += 1
+                    return key, text
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        """เปิดรับข้อความอีกครั้งหลัง close() (เช่น stop แล้ว start worker ใหม่)"""
+        with self._cond:
+            self._closed = False
+
+    def qsize(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "expired": self.expired,
+                "dispatched": self.dispatched,
+                "rejected": self.rejected,
+            }
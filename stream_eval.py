@@ -0,0 +1,136 @@
+# ------------------------------------
+# ไฟล์: stream_eval.py
+# ------------------------------------
+"""
+ประเมินโมเดลแบบ streaming สำหรับ split ขนาดใหญ่ (ใช้ผ่าน `python evaluate.py --streaming`)
+
+model.val เก็บผลทำนายและสถิติของทุกภาพไว้ในหน่วยความจำจนจบ แล้ววาดกราฟทุกครั้ง
+โมดูลนี้รันโมเดลทีละ batch อ่าน label ของภาพนั้น แล้วสะสมผลใน DetectionAccumulator ทันที
+หน่วยความจำสูงสุดจึงคงที่ไม่ว่าจะมีภาพกี่ภาพ
+
+ผลที่ได้มีหน้าตาเหมือน metrics ของ ultralytics (box.mp / mr / map50 / map, confusion_matrix.matrix,
+results_dict) จึงใช้ summarize_evaluation() และ write_metrics_summary() เดิมได้ทันที
+"""
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from detection_matching import DetectionAccumulator, summarize_ap
+
+
+class StreamingEvalMetrics:
+    """ห่อผลของ DetectionAccumulator ให้มี attribute เดียวกับ DetMetrics ที่ model.val คืนมา"""
+
+    def __init__(self, accumulator, names, save_dir=None, speed=None):
+        stats = accumulator.results()
+        summary = summarize_ap(stats)
+        self.names = names
+        self.save_dir = save_dir
+        self.speed = speed or {}
+        self.stats = stats
+        self.box = SimpleNamespace(
+            mp=summary["precision"],
+            mr=summary["recall"],
+            map50=summary["map50"],
+            map=summary["map50_95"],
+            ap50=stats["ap"][:, 0],
+            ap=stats["ap"].mean(axis=1),
+            p=stats["precision"],
+            r=stats["recall"],
+            f1=stats["f1"],
+        )
+        self.confusion_matrix = SimpleNamespace(matrix=accumulator.matrix.astype(np.float64), nc=accumulator.nc)
+        self.results_dict = {
+            "metrics/precision(B)": summary["precision"],
+            "metrics/recall(B)": summary["recall"],
+            "metrics/mAP50(B)": summary["map50"],
+            "metrics/mAP50-95(B)": summary["map50_95"],
+            "fitness": 0.1 * summary["map50"] + 0.9 * summary["map50_95"],
+        }
+
+
+def evaluate_streaming(model, images, label_reader, args, plots=False, save_dir=None):
+    """
+    images: รายชื่อไฟล์ภาพของ split (อ่านทีละ batch ไม่โหลดพร้อมกัน)
+    label_reader(image_path, (h, w)) -> (gt_cls, gt_boxes แบบพิกเซล xyxy)
+    คืน StreamingEvalMetrics
+    """
+    names = {int(k): v for k, v in model.names.items()}
+    accumulator = DetectionAccumulator(len(names))
+    batch = max(1, int(args.batch))
+    started = time.perf_counter()
+    for start in range(0, len(images), batch):
+        chunk = images[start:start + batch]
+        results = model.predict(
+            source=[str(p) for p in chunk],
+            imgsz=args.imgsz,
+            batch=batch,
+            device=args.device,
+            conf=args.conf,
+            iou=args.iou,
+            max_det=300,
+            verbose=False,
+        )
+        for image_path, result in zip(chunk, results):
+            data = result.boxes.data
+            data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+            gt_cls, gt_boxes = label_reader(image_path, tuple(int(v) for v in result.orig_shape))
+            accumulator.update(data[:, :4], data[:, 4], data[:, 5], gt_boxes, gt_cls)
+        done = min(start + batch, len(images))
+        if done % (batch * 50) < batch or done == len(images):
+            print(f"[EVAL] {done}/{len(images)} ภาพ")
+    elapsed = time.perf_counter() - started
+
+    metrics = StreamingEvalMetrics(
+        accumulator,
+        names,
+        save_dir=save_dir,
+        speed={"ms_per_image": elapsed * 1000.0 / max(1, accumulator.images)},
+    )
+    if plots and save_dir is not None:
+        save_plots(accumulator, names, save_dir)
+    return metrics
+
+
+def save_plots(accumulator, names, save_dir):
+    """PR curve (IoU 0.5) และ confusion matrix เป็น PNG (ต้องมี matplotlib)"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    save_dir = Path(save_dir)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    precision, recall, kept = accumulator.curves()
+    stats = accumulator.results()
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for c in np.flatnonzero(stats["present"]):
+        points = np.flatnonzero(kept[c] > 0)[::-1]
+        if points.size:
+            ax.plot(recall[c, points, 0], precision[c, points, 0], linewidth=1,
+                    label=f"{names.get(c, c)} {stats['ap'][c, 0]:.3f}")
+    ax.set_xlabel("Recall")
+    ax.set_ylabel("Precision")
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    ax.legend(loc="lower left", fontsize=8)
+    ax.set_title("Precision-Recall (IoU 0.5)")
+    fig.savefig(save_dir / "PR_curve.png", dpi=150, bbox_inches="tight")
+    plt.close(fig)
+
+    labels = [names.get(c, str(c)) for c in range(accumulator.nc)] + ["background"]
+    fig, ax = plt.subplots(figsize=(8, 7))
+    ax.imshow(accumulator.matrix, cmap="Blues")
+    ax.set_xticks(range(len(labels)), labels, rotation=90, fontsize=8)
+    ax.set_yticks(range(len(labels)), labels, fontsize=8)
+    ax.set_xlabel("True")
+    ax.set_ylabel("Predicted")
+    for (row, col), value in np.ndenumerate(accumulator.matrix):
+        if value:
+            ax.text(col, row, int(value), ha="center", va="center", fontsize=7)
+    fig.savefig(save_dir / "confusion_matrix.png", dpi=150, bbox_inches="tight")
+    plt.close(fig)
+    print(f"[EVAL] บันทึกกราฟใน {save_dir}")
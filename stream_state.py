@@ -0,0 +1,77 @@
+# ------------------------------------
+# ไฟล์: stream_state.py
+# ------------------------------------
+"""
+สถานะต่อกล้อง (stream) สำหรับตัดสินใจว่าจะพูด/บันทึกภาพเมื่อไร
+
+เดิมค่าเหล่านี้เป็นตัวแปร global ใน app.py ซึ่งใช้ได้แค่กล้องเดียว
+แยกออกมาเป็น object เพื่อให้แต่ละ stream มี streak และ cooldown ของตัวเอง
+"""
+
+
+class StreamState:
+    """
+    เก็บ streak ของคลาสที่เห็นต่อเนื่อง, เวลาที่พูดล่าสุด และเวลาที่บันทึกภาพล่าสุด
+    """
+
+    def __init__(self, stream_id="default"):
+        self.stream_id = stream_id
+        # ระบบเสียง
+        self.current_streak_class = -1
+        self.current_streak_length = 0
+        self.last_announced_class = -1
+        self.last_announced_time = 0.0
+        # บันทึกภาพ
+        self.last_saved_class = -1
+        self.last_saved_time = 0.0
+
+    def reset_streak(self):
+        self.current_streak_class = -1
+        self.current_streak_length = 0
+
+    def observe(self, class_id, now, sustained_frames, cooldown_seconds):
+        """
+        บันทึกว่าเฟรมนี้เห็น class_id (conf ผ่านเกณฑ์แล้ว)
+        คืนค่า True ถ้าควรประกาศเสียง (เห็นต่อเนื่องพอ และพ้น cooldown ของคลาสนั้น)
+        """
+        if class_id == self.current_streak_class:
+            self.current_streak_length += 1
+        else:
+            self.current_streak_class = class_id
+            self.current_streak_length = 1
+
+        should_announce = (
+            self.current_streak_length >= sustained_frames and
+            (
+                class_id != self.last_announced_class or
+                now - self.last_announced_time >= cooldown_seconds
+            )
+        )
+        if should_announce:
+            self.last_announced_class = class_id
+            self.last_announced_time = now
+        return should_announce
+
+    def observe_track(self, track, now, min_lifetime_seconds, cooldown_seconds):
+        """
+        ใช้แทน observe() ในโหมด tracking: ประกาศหนึ่งครั้งต่อ track
+        เมื่อ track มีอายุถึง min_lifetime_seconds และพ้น cooldown ของคลาสนั้น
+        """
+        if track.announced or track.lifetime(now) < min_lifetime_seconds:
+            return False
+        if track.cls == self.last_announced_class and now - self.last_announced_time < cooldown_seconds:
+            return False
+        track.announced = True
+        self.last_announced_class = track.cls
+        self.last_announced_time = now
+        return True
+
+    def should_save(self, class_id, confidence, now, conf_threshold, cooldown_seconds):
+        """ตรวจ cooldown และ conf ก่อนบันทึกภาพ"""
+        if class_id == self.last_saved_class and (now - self.last_saved_time) < cooldown_seconds:
+            return False
+        return confidence >= conf_threshold
+
+    def mark_saved(self, class_id, now):
+        self.last_saved_class = class_id
+        self.last_saved_time = now
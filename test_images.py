@@ -1,9 +1,18 @@
 import argparse
+import csv
+import json
 import os
 import sys
 from pathlib import Path
 
-from ultralytics import YOLO
+import cv2
+import numpy as np
+
+from inference_backends import SUPPORTED_BACKENDS, artifact_backend, load_inference_config, load_model
+from result_cache import ResultCache, array_to_result, hash_bytes, result_to_array
+
+
+IMAGE_SUFFIXES = {".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
 
 
 def parse_args():
@@ -15,6 +24,12 @@ def parse_args():
         default="runs/detect/yolo12m_final/weights/best.pt",
         help="Path to trained weights (.pt)",
     )
+    parser.add_argument(
+        "--backend",
+        default=load_inference_config()["backend"],
+        choices=SUPPORTED_BACKENDS,
+        help="Inference runtime (default: inference.backend in params.yaml)",
+    )
     parser.add_argument(
         "--source",
         required=True,
@@ -53,6 +68,33 @@ def parse_args():
         default="exp",
         help="Run name inside project directory",
     )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Reuse detections for images seen before (default: result_cache.enabled in params.yaml)",
+    )
+    parser.add_argument(
+        "--save",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Save annotated images to project/name (--no-save keeps only JSONL/CSV)",
+    )
+    parser.add_argument(
+        "--jsonl",
+        default=None,
+        help="Per-image detections output (default: project/name/detections.jsonl)",
+    )
+    parser.add_argument(
+        "--csv",
+        default=None,
+        help="Optional per-box detections CSV output",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print a line per image (only the final summary)",
+    )
     parser.add_argument(
         "--show",
         action="store_true",
@@ -74,32 +116,149 @@ def validate_paths(args):
     Path(args.project).mkdir(parents=True, exist_ok=True)
 
 
-def summarize_results(results):
-    print("=====================================")
-    print("         Inference Summary           ")
-    print("=====================================")
-    for idx, result in enumerate(results):
-        path = result.path
-        boxes = result.boxes
+class RunningSummary:
+    """
+    สรุปผลทีละภาพระหว่างรัน (ไม่เก็บ Results ไว้) และเขียนผลของแต่ละภาพลง JSONL/CSV ทันที
+    หน่วยความจำจึงคงที่ไม่ว่าจะมีภาพกี่ภาพหรือวิดีโอยาวแค่ไหน
+    """
+
+    CSV_FIELDS = ("image", "frame", "class_id", "class_name", "confidence", "x1", "y1", "x2", "y2")
+
+    def __init__(self, jsonl_path=None, csv_path=None, verbose=True):
+        self.verbose = verbose
+        self.images = 0
+        self.boxes = 0
+        self.class_counts = {}
+        self.class_names = {}
+        self._jsonl = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+        self._csv_file = open(csv_path, "w", encoding="utf-8", newline="") if csv_path else None
+        self._csv = None
+        if self._csv_file is not None:
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(self.CSV_FIELDS)
+
+    def add(self, result):
+        data, _ = result_to_array(result)
+        cls_ids = data[:, -1].astype(int).tolist()
+        frame = getattr(result, "frame", None)
         masks = getattr(result, "masks", None)
-        num_boxes = len(boxes) if boxes is not None else 0
         num_masks = len(masks) if masks is not None else 0
-        print(f"[{idx}] {path} -> {num_boxes} boxes, {num_masks} masks")
-        if num_boxes:
-            cls_ids = boxes.cls.cpu().numpy().astype(int)
-            counts = {}
-            for cid in cls_ids:
-                counts[cid] = counts.get(cid, 0) + 1
-            counts_str = ", ".join(f"class {cid}: {cnt}" for cid, cnt in counts.items())
-            print(f"     {counts_str}")
-    print("=====================================")
+        index = self.images
+        self.images += 1
+        self.boxes += len(data)
+        for cid in cls_ids:
+            self.class_counts[cid] = self.class_counts.get(cid, 0) + 1
+            self.class_names.setdefault(cid, result.names.get(cid, str(cid)))
+
+        if self.verbose:
+            print(f"[{index}] {result.path} -> {len(data)} boxes, {num_masks} masks")
+            if len(data):
+                counts = {}
+                for cid in cls_ids:
+                    counts[cid] = counts.get(cid, 0) + 1
+                counts_str = ", ".join(f"class {cid}: {cnt}" for cid, cnt in counts.items())
+                print(f"     {counts_str}")
+
+        detections = [
+            {
+                "class_id": int(row[-1]),
+                "class_name": result.names.get(int(row[-1]), str(int(row[-1]))),
+                "confidence": round(float(row[-2]), 4),
+                "box": [round(float(v), 1) for v in row[:4]],
+            }
+            for row in data
+        ]
+        if self._jsonl is not None:
+            record = {"index": index, "image": result.path, "frame": frame, "detections": detections}
+            self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._csv is not None:
+            for det in detections:
+                self._csv.writerow(
+                    [result.path, frame, det["class_id"], det["class_name"], det["confidence"], *det["box"]]
+                )
+
+    def close(self):
+        for handle in (self._jsonl, self._csv_file):
+            if handle is not None:
+                handle.close()
+
+    def report(self):
+        print("=====================================")
+        print("         Inference Summary           ")
+        print("=====================================")
+        print(f"images: {self.images}, boxes: {self.boxes}")
+        for cid, count in sorted(self.class_counts.items(), key=lambda item: -item[1]):
+            print(f"     class {cid} ({self.class_names[cid]}): {count}")
+        print("=====================================")
+
+
+def list_images(source):
+    """คืนรายการไฟล์ภาพถ้า source เป็นภาพหรือโฟลเดอร์ภาพ (วิดีโอ/กล้องคืน None)"""
+    path = Path(source)
+    if path.is_file():
+        return [path] if path.suffix.lower() in IMAGE_SUFFIXES else None
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    return None
+
+
+def predict_cached(model, files, cache, args):
+    """
+    รันโมเดลทีละภาพ (generator) โดยภาพที่ bytes ตรงกับที่เคยรันแล้ว (weights/พารามิเตอร์เดิม) ใช้ผลจาก cache
+    ถ้า args.save ภาพที่มีกรอบถูกบันทึกไว้ใน project/name เหมือน model.predict(save=True)
+    ภาพที่อยู่ใน cache แล้วไม่ถูก decode ถ้าไม่ต้องใช้ pixel (ไม่มี --save / --show)
+    """
+    save_dir = Path(args.project) / args.name
+    # backend ของไฟล์ที่โหลดจริง (prefer_quantized อาจแทน --backend ด้วยโมเดล INT8)
+    params = dict(imgsz=args.imgsz, conf=args.conf, iou=args.iou, backend=artifact_backend(model.artifact_path))
+    need_pixels = args.save or args.show
+    for path in files:
+        data = path.read_bytes()
+        key = cache.key(hash_bytes(data), **params)
+        entry = cache.get(key)
+        if entry is None or need_pixels:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                print(f"อ่านภาพไม่ได้: {path}", file=sys.stderr)
+                continue
+        else:
+            # Results ใช้แค่ขนาดของภาพ: view ขนาดเดิมที่ไม่จองหน่วยความจำจริง
+            image = np.broadcast_to(np.zeros((1, 1, 3), dtype=np.uint8), (*entry[1], 3))
+        if entry is None:
+            result = model.predict(
+                image,
+                imgsz=args.imgsz,
+                conf=args.conf,
+                iou=args.iou,
+                device=args.device,
+                verbose=False,
+            )[0]
+            result.path = str(path)
+            cache.put(key, *result_to_array(result))
+        else:
+            result = array_to_result(entry[0], image, model.names, str(path))
+        if args.save:
+            result.save(filename=str(save_dir / path.name))
+        if args.show:
+            cv2.imshow("AI Waste Sorter - test_images", result.plot())
+            cv2.waitKey(1)
+        yield result
 
 
 def run_inference(args):
     validate_paths(args)
-    model = YOLO(args.weights)
+    model = load_model(args.weights, args.backend)
+    save_dir = Path(args.project) / args.name
+    save_dir.mkdir(parents=True, exist_ok=True)
     print("เริ่มรันโมเดลตรวจจับภาพ...")
-    try:
+
+    cache_config = {} if args.cache is None else {"enabled": args.cache}
+    cache = ResultCache.from_config(model.artifact_path, cache_config)
+    files = list_images(args.source) if cache is not None else None
+    if files is not None:
+        results = predict_cached(model, files, cache, args)
+    else:
+        # stream=True: ได้ Results ทีละภาพ/เฟรม แทน list ของทุกภาพที่ค้างอยู่ในหน่วยความจำจนจบ
         results = model.predict(
             source=args.source,
             imgsz=args.imgsz,
@@ -109,9 +268,17 @@ def run_inference(args):
             project=args.project,
             name=args.name,
             exist_ok=True,
-            save=True,
+            save=args.save,
             show=args.show,
+            stream=True,
+            verbose=False,
         )
+
+    jsonl_path = args.jsonl or save_dir / "detections.jsonl"
+    summary = RunningSummary(jsonl_path, args.csv, verbose=not args.quiet)
+    try:
+        for result in results:
+            summary.add(result)
     except Exception as e:
         # Friendly hints for common webcam/display issues
         msg = str(e)
@@ -120,9 +287,21 @@ def run_inference(args):
         if "cv2.imshow" in msg or "The function is not implemented" in msg:
             print("สภาพแวดล้อมนี้ไม่รองรับการแสดงผลด้วย cv2.imshow(). ให้เอา --show ออก หรือใช้ python app.py ที่เป็นเว็บแทน", file=sys.stderr)
         raise
-    summarize_results(results)
-    save_dir = Path(args.project) / args.name
-    print(f"ภาพที่มีกรอบ annotation ถูกบันทึกไว้ที่: {save_dir.resolve()}")
+    finally:
+        summary.close()
+
+    summary.report()
+    if cache is not None and files is not None:
+        stats = cache.stats()
+        print(
+            f"result cache: memory_hits={stats['memory_hits']} disk_hits={stats['disk_hits']} "
+            f"misses={stats['misses']} hit_rate={stats['hit_rate']:.1%}"
+        )
+    print(f"ผลตรวจจับรายภาพ: {Path(jsonl_path).resolve()}")
+    if args.csv:
+        print(f"ผลตรวจจับรายกล่อง (CSV): {Path(args.csv).resolve()}")
+    if args.save:
+        print(f"ภาพที่มีกรอบ annotation ถูกบันทึกไว้ที่: {save_dir.resolve()}")
 
 
 if __name__ == "__main__":
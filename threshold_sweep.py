@@ -0,0 +1,250 @@
+# ------------------------------------
+# ไฟล์: threshold_sweep.py
+# ------------------------------------
+"""
+ลองค่า conf / NMS IoU หลายค่าจากผลทำนายดิบที่ evaluate.py เก็บไว้ (artifacts/eval/raw/*.npz)
+โดยไม่ต้องรันโมเดลซ้ำ
+
+- ทุกค่า IoU: ทำ NMS ซ้ำแบบ NumPy บนผลทำนายดิบ แล้วจับคู่กับ ground truth ครั้งเดียว
+- ทุกค่า conf: precision / recall / F1 ต่อคลาสคำนวณพร้อมกันทั้ง grid จาก cumsum ของ TP (vectorized)
+  และ mAP50 / mAP50-95 ของผลที่เหลือหลังตัดด้วย conf นั้น
+- แนะนำจุดใช้งาน (operating point) ทั้งค่ารวมและรายคลาส: F1 สูงสุด หรือ recall สูงสุดที่ precision
+  ไม่ต่ำกว่า --min-precision (เหมาะกับ SPEECH_CONF_THRESHOLD ที่ไม่อยากให้พูดผิด)
+
+ผล IoU ที่มากกว่า evaluate.raw_iou ใช้ไม่ได้ (NMS ตอนเก็บผลตัดกล่องไปแล้ว) จะถูกข้าม
+
+    python evaluate.py            # เก็บผลทำนายดิบครั้งแรกของ weights นี้
+    python threshold_sweep.py --min-precision 0.9
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from detection_matching import ap_per_class, match_predictions, nms, summarize_ap
+from evaluate import load_eval_config, raw_predictions_path
+from inference_backends import resolve_model_path
+
+
+DEFAULT_SWEEP_CONFIG = {
+    "conf_min": 0.05,
+    "conf_max": 0.95,
+    "conf_step": 0.05,
+    "iou": [0.5, 0.6, 0.7, 0.8],
+    "min_precision": None,
+    "out": "artifacts/eval/threshold_sweep.json",
+}
+
+
+def load_sweep_config():
+    params_path = Path("params.yaml")
+    config = DEFAULT_SWEEP_CONFIG.copy()
+    if params_path.exists():
+        with params_path.open("r", encoding="utf-8") as fp:
+            params = yaml.safe_load(fp) or {}
+        config.update(params.get("threshold_sweep", {}))
+    return config
+
+
+def parse_args():
+    defaults = load_sweep_config()
+    parser = argparse.ArgumentParser(description="Sweep conf/IoU thresholds over stored raw predictions")
+    parser.add_argument("--raw", default=None, help="Raw predictions .npz (default: the one for the evaluated model)")
+    parser.add_argument("--conf-min", type=float, default=defaults["conf_min"], help="Smallest confidence threshold")
+    parser.add_argument("--conf-max", type=float, default=defaults["conf_max"], help="Largest confidence threshold")
+    parser.add_argument("--conf-step", type=float, default=defaults["conf_step"], help="Confidence grid step")
+    parser.add_argument("--iou", type=float, nargs="+", default=defaults["iou"], help="NMS IoU thresholds to try")
+    parser.add_argument(
+        "--min-precision",
+        type=float,
+        default=defaults["min_precision"],
+        help="Recommend the highest-recall threshold with at least this precision (default: best F1)",
+    )
+    parser.add_argument("--out", default=defaults["out"], help="Where to write the sweep report (JSON)")
+    return parser.parse_args()
+
+
+def load_raw(path):
+    with np.load(path) as npz:
+        raw = {key: npz[key] for key in npz.files}
+    raw["meta"] = json.loads(str(raw["meta"]))
+    return raw
+
+
+def _group_bounds(image_ids, count):
+    """ตำแหน่งเริ่ม/จบของแต่ละภาพ (ข้อมูลเรียงตาม index ภาพอยู่แล้ว)"""
+    return np.searchsorted(image_ids, np.arange(count + 1))
+
+
+def match_at_iou(raw, nms_iou):
+    """NMS ที่ nms_iou แล้วจับคู่กับ ground truth คืน (tp (N, 10), conf, cls)"""
+    count = len(raw["image_shapes"])
+    pred_bounds = _group_bounds(raw["pred_image"], count)
+    gt_bounds = _group_bounds(raw["gt_image"], count)
+    tp_parts, conf_parts, cls_parts = [], [], []
+    for index in range(count):
+        p0, p1 = pred_bounds[index], pred_bounds[index + 1]
+        if p0 == p1:
+            continue
+        boxes = raw["pred_boxes"][p0:p1]
+        conf = raw["pred_conf"][p0:p1]
+        cls = raw["pred_cls"][p0:p1]
+        keep = nms(boxes, conf, cls, nms_iou)
+        g0, g1 = gt_bounds[index], gt_bounds[index + 1]
+        tp_parts.append(match_predictions(boxes[keep], cls[keep], raw["gt_boxes"][g0:g1], raw["gt_cls"][g0:g1]))
+        conf_parts.append(conf[keep])
+        cls_parts.append(cls[keep])
+    if not tp_parts:
+        return np.zeros((0, 10), dtype=bool), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int16)
+    return np.concatenate(tp_parts), np.concatenate(conf_parts), np.concatenate(cls_parts)
+
+
+def pr_at_thresholds(tp50, conf, cls, gt_counts, conf_grid):
+    """
+    precision / recall / F1 ของทุกคลาสที่ทุก conf ใน grid -> array (nc, len(grid)) อย่างละตัว
+    ไม่มีผลทำนายเหลือเลย = precision 1 (ไม่มี FP), recall 0
+    """
+    nc = len(gt_counts)
+    precision = np.ones((nc, len(conf_grid)))
+    recall = np.zeros((nc, len(conf_grid)))
+    for c in range(nc):
+        mask = cls == c
+        order = np.argsort(-conf[mask], kind="stable")
+        conf_c = conf[mask][order]
+        tp_cum = np.concatenate(([0], np.cumsum(tp50[mask][order])))
+        kept = np.searchsorted(-conf_c, -conf_grid, side="right")  # จำนวนผลที่ conf >= threshold
+        hits = tp_cum[kept]
+        precision[c] = np.where(kept > 0, hits / np.maximum(kept, 1), 1.0)
+        recall[c] = hits / gt_counts[c] if gt_counts[c] else 0.0
+    f1 = 2 * precision * recall / (precision + recall + 1e-16)
+    return precision, recall, f1
+
+
+def pick_operating_point(precision, recall, f1, min_precision):
+    """index ใน grid: recall สูงสุดที่ precision >= min_precision (ถ้ากำหนด) ไม่งั้น F1 สูงสุด"""
+    if min_precision is not None:
+        ok = np.flatnonzero(precision >= min_precision)
+        if ok.size:
+            return int(ok[np.argmax(recall[ok])]), True
+    return int(np.argmax(f1)), min_precision is None
+
+
+def sweep(raw, conf_grid, iou_grid, min_precision=None):
+    names = {int(k): v for k, v in raw["meta"]["names"].items()}
+    nc = max(max(names, default=-1), int(raw["gt_cls"].max(initial=-1)), int(raw["pred_cls"].max(initial=-1))) + 1
+    gt_counts = np.bincount(raw["gt_cls"].astype(np.int64), minlength=nc)
+    present = gt_counts > 0
+
+    table = []
+    per_iou = {}
+    for nms_iou in iou_grid:
+        tp, conf, cls = match_at_iou(raw, nms_iou)
+        precision, recall, f1 = pr_at_thresholds(tp[:, 0], conf, cls, gt_counts, conf_grid)
+        per_iou[nms_iou] = (precision, recall, f1)
+        for j, threshold in enumerate(conf_grid):
+            keep = conf >= threshold
+            ap = summarize_ap(ap_per_class(tp[keep], conf[keep], cls[keep], gt_counts))
+            mean_p = float(precision[present, j].mean()) if present.any() else 0.0
+            mean_r = float(recall[present, j].mean()) if present.any() else 0.0
+            table.append(
+                {
+                    "conf": round(float(threshold), 4),
+                    "iou": nms_iou,
+                    "precision": mean_p,
+                    "recall": mean_r,
+                    "f1": 2 * mean_p * mean_r / (mean_p + mean_r + 1e-16),
+                    "map50": ap["map50"],
+                    "map50_95": ap["map50_95"],
+                }
+            )
+
+    # ค่ารวม: เลือก (conf, IoU) ที่ดีที่สุด แล้วใช้ IoU นั้นเลือก conf รายคลาส
+    scores = np.asarray([[row["precision"], row["recall"], row["f1"]] for row in table])
+    best_index, _ = pick_operating_point(scores[:, 0], scores[:, 1], scores[:, 2], min_precision)
+    best = table[best_index]
+    precision, recall, f1 = per_iou[best["iou"]]
+
+    per_class = {}
+    recommended = {}
+    for c in range(nc):
+        name = names.get(c, str(c))
+        per_class[name] = [
+            {
+                "conf": round(float(threshold), 4),
+                "precision": float(precision[c, j]),
+                "recall": float(recall[c, j]),
+                "f1": float(f1[c, j]),
+            }
+            for j, threshold in enumerate(conf_grid)
+        ]
+        if not present[c]:
+            continue
+        j, meets = pick_operating_point(precision[c], recall[c], f1[c], min_precision)
+        recommended[name] = {**per_class[name][j], "meets_min_precision": meets, "instances": int(gt_counts[c])}
+
+    return {
+        "source": raw["meta"],
+        "conf_grid": [round(float(v), 4) for v in conf_grid],
+        "iou_grid": list(iou_grid),
+        "min_precision": min_precision,
+        "global": table,
+        "per_class_iou": best["iou"],
+        "per_class": per_class,
+        "recommended": {"global": best, "per_class": recommended},
+    }
+
+
+def main():
+    args = parse_args()
+    if args.raw:
+        raw_path = Path(args.raw)
+    else:
+        config = load_eval_config()
+        # ไฟล์โมเดลเดียวกับที่ evaluate.py โหลด (export หรือ INT8 เมื่อเปิด inference.prefer_quantized)
+        model_path = resolve_model_path(config["weights"], config["backend"])
+        raw_path = raw_predictions_path(
+            model_path, config["split"], config["imgsz"], config["raw_conf"], config["raw_iou"], config["raw_dir"]
+        )
+    if not raw_path.is_file():
+        print(f"ไม่พบผลทำนายดิบ: {raw_path} (รัน evaluate.py ก่อน)", file=sys.stderr)
+        sys.exit(1)
+    raw = load_raw(raw_path)
+
+    conf_grid = np.arange(args.conf_min, args.conf_max + args.conf_step / 2, args.conf_step)
+    conf_grid = conf_grid[conf_grid >= raw["meta"]["raw_conf"]]
+    iou_grid = sorted(v for v in args.iou if v <= raw["meta"]["raw_iou"])
+    skipped = sorted(set(args.iou) - set(iou_grid))
+    if skipped:
+        print(f"[SWEEP] ข้าม IoU {skipped} (มากกว่า raw_iou {raw['meta']['raw_iou']} ที่ใช้ตอนเก็บผล)")
+    if not iou_grid or not conf_grid.size:
+        print("ไม่มีค่า conf / IoU ที่ใช้ได้", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"[SWEEP] {raw_path.name}: {len(raw['image_shapes'])} ภาพ, {len(raw['pred_conf'])} ผลทำนายดิบ")
+    report = sweep(raw, conf_grid, iou_grid, args.min_precision)
+
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    best = report["recommended"]["global"]
+    print("=====================================")
+    print(
+        f"แนะนำ (รวม): conf={best['conf']:.2f} iou={best['iou']:.2f} "
+        f"P={best['precision']:.3f} R={best['recall']:.3f} F1={best['f1']:.3f} mAP50-95={best['map50_95']:.3f}"
+    )
+    print(f"รายคลาส (iou={report['per_class_iou']:.2f}):")
+    for name, point in report["recommended"]["per_class"].items():
+        note = "" if point["meets_min_precision"] else f" (precision ไม่ถึง {args.min_precision})"
+        print(
+            f"  {name:<16} conf={point['conf']:.2f} P={point['precision']:.3f} "
+            f"R={point['recall']:.3f} F1={point['f1']:.3f}{note}"
+        )
+    print(f"Report: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# ------------------------------------
+# ไฟล์: tracker.py
+# ------------------------------------
+"""
+IoU tracker แบบเบาสำหรับลากกล่องระหว่างเฟรมที่ไม่ได้รันโมเดล
+
+- ตอนรันโมเดล: จับคู่ detection กับ track เดิมด้วย IoU (คลาสเดียวกัน) แบบ greedy
+- ตอนไม่รันโมเดล: เลื่อนกล่องตามความเร็วล่าสุด (constant velocity)
+- แต่ละ track มี ID คงที่และนับอายุ (lifetime) เพื่อใช้ตัดสินใจพูด/บันทึกภาพแทน streak ของเฟรม
+"""
+import time
+
+import numpy as np
+
+
+def box_iou(a, b):
+    """IoU ระหว่างกล่องชุด a (N,4) และ b (M,4) ในรูป xyxy คืน matrix (N,M)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def boxes_to_numpy(boxes):
+    """แปลง ultralytics Boxes เป็น (xyxy, conf, cls) แบบ numpy"""
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)
+    xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+    conf = boxes.conf.cpu().numpy().astype(np.float32)
+    cls = boxes.cls.cpu().numpy().astype(np.int64)
+    return xyxy, conf, cls
+
+
+class Track:
+    def __init__(self, track_id, box, conf, cls, now):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.conf = float(conf)
+        self.cls = int(cls)
+        self.hits = 1
+        self.misses = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.announced = False
+        self.saved = False
+
+    def lifetime(self, now):
+        return now - self.first_seen
+
+
+class IoUTracker:
+    """
+    tracker แบบ IoU + constant velocity
+
+    min_hits: จำนวนครั้งที่ต้องจับคู่ได้ก่อนถือว่า track ยืนยันแล้ว
+    max_misses: จำนวนรอบ detection ที่หาไม่เจอก่อนลบ track
+    """
+
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_misses=2, velocity_smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.velocity_smoothing = velocity_smoothing
+        self.tracks = []
+        self._next_id = 1
+        self._frames_since_detection = 0
+
+    def predict(self):
+        """เลื่อนทุก track ไปหนึ่งเฟรมตามความเร็วล่าสุด (ใช้ในเฟรมที่ไม่ได้รันโมเดล)"""
+        for track in self.tracks:
+            track.box = track.box + track.velocity
+        self._frames_since_detection += 1
+
+    def update(self, xyxy, conf, cls, now=None):
+        """อัปเดต track ด้วยผล detection ของเฟรมนี้"""
+        now = time.time() if now is None else now
+        steps = self._frames_since_detection + 1
+        # ย้อนการ predict ระหว่างรอบเพื่อคำนวณความเร็วต่อเฟรมจากตำแหน่งจริง
+        predicted = np.array([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        iou = box_iou(predicted, xyxy)
+        if iou.size:
+            iou[np.array([t.cls for t in self.tracks])[:, None] != cls[None, :]] = 0.0
+
+        matched_tracks, matched_dets = set(), set()
+        if iou.size:
+            order = np.dstack(np.unravel_index(np.argsort(-iou, axis=None), iou.shape))[0]
+            for ti, di in order:
+                if iou[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di in matched_dets:
+                    continue
+                matched_tracks.add(ti)
+                matched_dets.add(di)
+                track = self.tracks[ti]
+                previous = track.box - track.velocity * self._frames_since_detection
+                measured_velocity = (xyxy[di] - previous) / steps
+                track.velocity = (
+                    self.velocity_smoothing * track.velocity
+                    + (1.0 - self.velocity_smoothing) * measured_velocity
+                )
+                track.box = xyxy[di].astype(np.float32)
+                track.conf = float(conf[di])
+                track.hits += 1
+                track.misses = 0
+                track.last_seen = now
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                track.velocity[:] = 0.0
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for di in range(len(xyxy)):
+            if di not in matched_dets:
+                survivors.append(Track(self._next_id, xyxy[di], conf[di], cls[di], now))
+                self._next_id += 1
+        self.tracks = survivors
+        self._frames_since_detection = 0
+
+    def confirmed(self):
+        """track ที่จับคู่ได้ครบ min_hits และยังเห็นในรอบ detection ล่าสุด"""
+        return [t for t in self.tracks if t.hits >= self.min_hits and t.misses == 0]
+
+    def as_boxes(self):
+        """คืน array (N,7) [x1, y1, x2, y2, track_id, conf, cls] สำหรับสร้าง ultralytics Results"""
+        tracks = self.confirmed()
+        if not tracks:
+            return np.zeros((0, 7), dtype=np.float32)
+        return np.array(
+            [[*t.box, t.track_id, t.conf, t.cls] for t in tracks],
+            dtype=np.float32,
+        )
+
+    def reset(self):
+        self.tracks = []
+        self._frames_since_detection = 0
@@ -1,12 +1,23 @@
 # ------------------------------------
 # ไฟล์: train.py
 # ------------------------------------
-from ultralytics import YOLO
+from ultralytics import YOLO, __version__ as ultralytics_version
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils.torch_utils import convert_optimizer_state_dict_to_fp16
 import torch
 import numpy as np
+import json
+import time
+from copy import deepcopy
+from datetime import datetime
 from pathlib import Path
 import yaml
 
+from checkpoint_writer import AsyncCheckpointWriter
+from image_cache import ImageCache, load_image_cache_config
+from label_index import update_index
+
 
 def _estimate_accuracy(metrics):
     """
@@ -59,6 +70,12 @@ DEFAULT_TRAIN_CONFIG = {
     "save_period": 1,
     "name": "yolo12m_final",
     "base_weights": "yolo12m.pt",
+    "image_cache": False,
+    "balanced_sampling": False,
+    "async_checkpoints": False,
+    "keep_checkpoints": 0,       # จำนวน epochN.pt ล่าสุดที่เก็บไว้ (0 = เก็บทั้งหมด)
+    "epoch_times_out": "artifacts/train/epoch_times.json",
+    "checkpoint_times_out": "artifacts/train/checkpoints.json",
 }
 
 
@@ -76,6 +93,154 @@ def load_train_config():
     return config
 
 
+class WasteYOLODataset(YOLODataset):
+    """
+    YOLODataset ที่
+    - อ่านภาพจาก ImageCache (memmap ที่ย่อไว้แล้ว) แทนการ decode JPEG ทุก epoch
+      ภาพที่ไม่มีใน cache ใช้ load_image เดิมของ ultralytics
+    - สุ่มภาพตาม sample_cdf (class-balanced จาก label_index.py) แทนการวนตามลำดับ ถ้ากำหนดไว้
+    """
+
+    image_cache = None
+    sample_cdf = None
+
+    def __getitem__(self, index):
+        if self.sample_cdf is not None:
+            index = min(int(np.searchsorted(self.sample_cdf, np.random.random(), side="right")), len(self.sample_cdf) - 1)
+        return super().__getitem__(index)
+
+    def load_image(self, i, rect_mode=True):
+        cached = self.image_cache.get(self.im_files[i]) if rect_mode and self.image_cache is not None else None
+        if cached is None:
+            return super().load_image(i, rect_mode)
+        if self.augment:
+            # mosaic สุ่มภาพเพิ่มจาก buffer (เหมือน load_image เดิม แต่ไม่ต้องถือภาพไว้เพราะอ่านจาก cache ได้ทันที)
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return cached
+
+
+class WasteDetectionTrainer(DetectionTrainer):
+    """
+    DetectionTrainer ที่เปิดใช้ตาม params.yaml:
+    - train.image_cache: อ่านภาพจาก artifacts/image_cache (ถ้ามีและตรงกับ imgsz / dataset)
+    - train.balanced_sampling: สุ่มภาพของ train split ตามน้ำหนัก class-balanced จาก label index
+    - train.async_checkpoints: เขียน checkpoint ใน background thread (AsyncCheckpointWriter)
+      พร้อมเก็บ epochN.pt ไว้แค่ train.keep_checkpoints ไฟล์ล่าสุด
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waste_config = load_train_config()
+        self.checkpoint_writer = None
+        if self.waste_config["async_checkpoints"]:
+            self.checkpoint_writer = AsyncCheckpointWriter(
+                self.wdir,
+                keep_last=self.waste_config["keep_checkpoints"],
+                report_path=self.waste_config["checkpoint_times_out"],
+            )
+
+    def save_model(self):
+        """
+        เหมือน BaseTrainer.save_model แต่ thread เทรนทำแค่ snapshot ของ state (deepcopy)
+        ส่วน torch.save และการเขียน last.pt / best.pt / epochN.pt ทำใน checkpoint writer
+        """
+        if self.checkpoint_writer is None:
+            return super().save_model()
+        start = time.perf_counter()
+        checkpoint = {
+            "epoch": self.epoch,
+            "best_fitness": self.best_fitness,
+            "model": None,  # resume และ final checkpoint ใช้ EMA
+            "ema": deepcopy(self.ema.ema).half(),
+            "updates": self.ema.updates,
+            "optimizer": convert_optimizer_state_dict_to_fp16(deepcopy(self.optimizer.state_dict())),
+            "train_args": dict(vars(self.args)),
+            "train_metrics": {**self.metrics, **{"fitness": self.fitness}},
+            "train_results": self.read_results_csv(),
+            "date": datetime.now().isoformat(),
+            "version": ultralytics_version,
+            "license": "AGPL-3.0 (https://ultralytics.com/license)",
+            "docs": "https://docs.ultralytics.com",
+        }
+        targets = [self.last]
+        if self.best_fitness == self.fitness:
+            targets.append(self.best)
+        if (self.save_period > 0) and (self.epoch % self.save_period == 0):
+            targets.append(self.wdir / f"epoch{self.epoch}.pt")
+        wait = self.checkpoint_writer.submit(self.epoch, checkpoint, targets, time.perf_counter() - start)
+        if wait > 1.0:
+            print(f"[CKPT] epoch {self.epoch}: รอ checkpoint ก่อนหน้าเขียนเสร็จ {wait:.1f} วินาที")
+
+    def final_eval(self):
+        # final_eval อ่าน last.pt / best.pt จากดิสก์ ต้องเขียนให้ครบก่อน
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            stats = self.checkpoint_writer.stats()
+            print(
+                f"[CKPT] เขียน checkpoint {stats['checkpoints']} ครั้ง เฉลี่ย {stats['mean_write_seconds']:.1f} วินาที "
+                f"(loop เทรนรอรวม {stats['total_blocked_seconds']:.1f} วินาที)"
+            )
+        return super().final_eval()
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        dataset = super().build_dataset(img_path, mode, batch)
+        if type(dataset) is not YOLODataset:
+            return dataset
+        config = self.waste_config
+        cache = None
+        if config["image_cache"] and self.args.cache != "ram":
+            cache = ImageCache.open(load_image_cache_config()["dir"], self.args.imgsz)
+            if cache is None:
+                print("[IMGCACHE] ไม่พบ image cache ที่ใช้ได้ - decode ภาพตามปกติ")
+        weights = None
+        if config["balanced_sampling"] and mode == "train":
+            weights = update_index({"data": config["data"]}).sampling_weights(dataset.im_files)
+        if cache is None and weights is None:
+            return dataset
+
+        # build_yolo_dataset สร้าง YOLODataset ตายตัว จึงเปลี่ยน class ของ instance ที่สร้างแล้วแทน
+        dataset.__class__ = WasteYOLODataset
+        if cache is not None:
+            dataset.image_cache = cache
+            hits = sum(1 for f in dataset.im_files if f in cache)
+            print(f"[IMGCACHE] {mode}: อ่านจาก cache {hits}/{len(dataset.im_files)} ภาพ")
+        if weights is not None:
+            dataset.sample_cdf = np.cumsum(weights)
+            print(f"[LABELS] {mode}: สุ่มภาพแบบ class-balanced (น้ำหนักสูงสุด/ต่ำสุด {weights.max() / weights.min():.1f}x)")
+        return dataset
+
+
+def track_epoch_times(model, use_cache, output_path):
+    """จับเวลาแต่ละ epoch (รวม validation) แล้วเขียนเป็น JSON เพื่อเทียบก่อน/หลังเปิด image cache"""
+    epochs = []
+    started = {}
+
+    def on_epoch_start(trainer):
+        started["t"] = time.perf_counter()
+
+    def on_fit_epoch_end(trainer):
+        if "t" not in started:
+            return
+        epochs.append(time.perf_counter() - started.pop("t"))
+        # epoch แรกมีงานเริ่มต้น (สร้าง worker, cache label) จึงไม่นับในค่าเฉลี่ยถ้ามีหลาย epoch
+        steady = epochs[1:] or epochs
+        report = {
+            "image_cache": use_cache,
+            "epochs": len(epochs),
+            "epoch_seconds": [round(v, 2) for v in epochs],
+            "mean_epoch_seconds": sum(steady) / len(steady),
+        }
+        out = Path(output_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    model.add_callback("on_train_epoch_start", on_epoch_start)
+    model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+    return epochs
+
+
 def train_waste_sorter():
     # 1. ตรวจสอบว่ามี GPU (NVIDIA) หรือไม่
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -89,21 +254,31 @@ def train_waste_sorter():
     # ไฟล์ .pt จะถูกดาวน์โหลดอัตโนมัติในครั้งแรก
     print("Loading YOLOv12 model...")
     model = YOLO(config["base_weights"])
+    epoch_times = track_epoch_times(model, bool(config["image_cache"]), config["epoch_times_out"])
 
     # 3. เริ่มต้นการเทรน
     print("Starting model training...")
     results = model.train(
+        trainer=WasteDetectionTrainer
+        if config["image_cache"] or config["balanced_sampling"] or config["async_checkpoints"]
+        else None,
         data=config["data"],     # ไฟล์ตั้งค่า Dataset
         imgsz=config["imgsz"],            # ขนาดรูปภาพมาตรฐาน
         epochs=config["epochs"],           # จำนวนรอบในการเทรน (สำหรับเทรนจริงจัง)
         batch=config["batch"],              # ลดตัวเลขนี้ถ้า GPU memory ไม่พอ (เช่น 4)
         patience=config["patience"],          # หยุดเทรนถ้า mAP ไม่ดีขึ้น
-        save_period=config["save_period"],        # เซฟ checkpoint ทุก epoch
+        save_period=config["save_period"],        # เซฟ checkpoint ทุก epoch (async_checkpoints: เขียนใน background)
         name=config["name"], # ชื่อโฟลเดอร์ที่จะเซฟผลลัพธ์
         device=device         # ระบุอุปกรณ์ (GPU/CPU)
     )
     
     print("Training finished.")
+    if epoch_times:
+        steady = epoch_times[1:] or epoch_times
+        print(
+            f"Epoch time: เฉลี่ย {sum(steady) / len(steady):.1f} วินาที "
+            f"(image cache: {'เปิด' if config['image_cache'] else 'ปิด'}) -> {config['epoch_times_out']}"
+        )
     print("-----------------------------------")
     print("ผลการทดสอบ (Validation results):")
     
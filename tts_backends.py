@@ -0,0 +1,332 @@
+# ------------------------------------
+# ไฟล์: tts_backends.py
+# ------------------------------------
+"""
+ชั้น backend สำหรับระบบเสียง (text-to-speech) และ cache ไฟล์เสียงของข้อความแนะนำ
+
+ข้อความแนะนำมีจำนวนจำกัด (FRIENDLY_MESSAGE_MAP) จึงสังเคราะห์เป็นไฟล์ .wav ครั้งเดียวตอนเริ่มโปรแกรม
+แล้วเก็บไว้บนดิสก์ โดยใช้ key จากข้อความ + backend + การตั้งค่าเสียง
+ตอนประกาศจึงแค่เล่นไฟล์ที่มีอยู่แล้ว ไม่ต้องเปิด process ใหม่และสร้าง synthesizer ทุกครั้ง
+
+Backend ที่รองรับ:
+- "powershell": Windows SAPI ผ่าน PowerShell process เดียวที่เปิดค้างไว้ (สร้าง synthesizer ครั้งเดียว)
+- "espeak": espeak-ng / espeak บน Linux
+- "null": ไม่สังเคราะห์เสียงจริง เขียนไฟล์ .wav เงียบ (ใช้ทดสอบบน Linux/CI)
+
+สร้าง cache ล่วงหน้า:
+    python tts_backends.py --backend auto
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import wave
+from pathlib import Path
+
+
+DEFAULT_CACHE_DIR = "artifacts/tts_cache"
+
+# สคริปต์ที่รันค้างไว้ใน PowerShell: อ่านคำสั่ง JSON ทีละบรรทัดจาก stdin แล้วเขียนไฟล์ .wav
+_POWERSHELL_SERVER = r"""
+Add-Type -AssemblyName System.Speech
+$speak = New-Object System.Speech.Synthesis.SpeechSynthesizer
+$speak.Rate = {rate}
+$speak.Volume = {volume}
+{select_voice}
+[Console]::Out.WriteLine("READY")
+while (($line = [Console]::In.ReadLine()) -ne $null) {{
+    try {{
+        $req = $line | ConvertFrom-Json
+        $speak.SetOutputToWaveFile($req.path)
+        $speak.Speak($req.text)
+        $speak.SetOutputToNull()
+        [Console]::Out.WriteLine("OK")
+    }} catch {{
+        $speak.SetOutputToNull()
+        [Console]::Out.WriteLine("ERR " + $_.Exception.Message)
+    }}
+}}
+"""
+
+
+class TTSBackend:
+    """
+    base class: synthesize(text, path) เขียนไฟล์ .wav, play(path) เล่นไฟล์เสียง
+    """
+
+    name = "base"
+
+    def __init__(self, rate=0, volume=100, voice=None):
+        self.rate = rate
+        self.volume = volume
+        self.voice = voice
+
+    def voice_settings(self):
+        """ค่าที่มีผลต่อเสียงที่ได้ (ใช้เป็นส่วนหนึ่งของ cache key)"""
+        return {"backend": self.name, "rate": self.rate, "volume": self.volume, "voice": self.voice}
+
+    def synthesize(self, text, path):
+        raise NotImplementedError
+
+    def play(self, path):
+        play_wav(path)
+
+    def close(self):
+        pass
+
+
+class PowerShellBackend(TTSBackend):
+    """
+    Windows SAPI ผ่าน PowerShell process เดียวที่เปิดค้างไว้ตลอดอายุโปรแกรม
+    อ่านคำตอบผ่าน reader thread + queue ถ้า process ไม่ตอบภายใน timeout วินาทีจะถูก kill
+    และเริ่มใหม่ในคำขอถัดไป (worker เสียงไม่ค้างตลอดไป)
+    """
+
+    name = "powershell"
+
+    def __init__(self, rate=0, volume=100, voice=None, timeout=30):
+        super().__init__(rate, volume, voice)
+        self.timeout = timeout
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_lines(stream, lines):
+        for line in stream:
+            lines.put(line)
+        lines.put(None)  # process จบแล้ว
+
+    def _readline(self):
+        """อ่านหนึ่งบรรทัดจาก process ภายใน timeout (kill process ถ้าเกินเวลา)"""
+        try:
+            line = self._lines.get(timeout=self.timeout)
+        except queue.Empty:
+            self._kill()
+            raise RuntimeError(f"PowerShell TTS ไม่ตอบภายใน {self.timeout} วินาที (เริ่ม process ใหม่ในครั้งถัดไป)")
+        return "" if line is None else line.strip()
+
+    def _kill(self):
+        if self._proc is not None:
+            self._proc.kill()
+            try:
+                self._proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                pass
+        self._proc = None
+        self._lines = None
+
+    def _ensure_process(self):
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        select_voice = ""
+        if self.voice:
+            escaped = str(self.voice).replace("'", "''")
+            select_voice = f"$speak.SelectVoice('{escaped}')"
+        script = _POWERSHELL_SERVER.format(rate=int(self.rate), volume=int(self.volume), select_voice=select_voice)
+        self._proc = subprocess.Popen(
+            ["powershell", "-NoProfile", "-NonInteractive", "-Command", script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0,
+        )
+        # queue แยกต่อ process บรรทัดค้างจาก process ที่ถูก kill จึงไม่ปนมา
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._read_lines, args=(self._proc.stdout, self._lines), name="powershell-tts-reader", daemon=True
+        ).start()
+        ready = self._readline()
+        if ready != "READY":
+            self._kill()
+            raise RuntimeError(f"PowerShell TTS เริ่มทำงานไม่สำเร็จ: {ready!r}")
+
+    def synthesize(self, text, path):
+        with self._lock:
+            self._ensure_process()
+            request = json.dumps({"text": text, "path": str(Path(path).resolve())}, ensure_ascii=False)
+            self._proc.stdin.write(request + "\n")
+            self._proc.stdin.flush()
+            reply = self._readline()
+        if reply != "OK":
+            raise RuntimeError(f"PowerShell TTS error: {reply or 'process ended'}")
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                self._proc.stdin.close()
+                try:
+                    self._proc.wait(timeout=2)
+                except subprocess.TimeoutExpired:
+                    self._proc.kill()
+            self._proc = None
+            self._lines = None
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng / espeak (Linux) - ใช้ตอนสร้าง cache เท่านั้น การเล่นเสียงใช้ไฟล์ที่ cache ไว้"""
+
+    name = "espeak"
+
+    def __init__(self, rate=0, volume=100, voice=None):
+        super().__init__(rate, volume, voice)
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def synthesize(self, text, path):
+        if not self.executable:
+            raise RuntimeError("ไม่พบ espeak-ng หรือ espeak")
+        # SAPI rate -10..10 -> espeak words per minute (ค่าเริ่มต้น 175)
+        words_per_minute = int(175 + self.rate * 15)
+        cmd = [self.executable, "-w", str(path), "-s", str(words_per_minute), "-a", str(int(self.volume * 2))]
+        if self.voice:
+            cmd += ["-v", str(self.voice)]
+        subprocess.run(cmd + [text], check=True, capture_output=True, timeout=30)
+
+
+class NullBackend(TTSBackend):
+    """
+    ไม่มีเสียงจริง: เขียนไฟล์ .wav เงียบความยาวประมาณเวลาพูด และ play() แค่พิมพ์ log
+    """
+
+    name = "null"
+    SAMPLE_RATE = 8000
+
+    def synthesize(self, text, path):
+        seconds = max(0.2, len(text.split()) * 0.35)
+        with wave.open(str(path), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.SAMPLE_RATE)
+            wav.writeframes(b"\x00\x00" * int(self.SAMPLE_RATE * seconds))
+
+    def play(self, path):
+        print(f"[VOICE][null] play {path}")
+
+
+BACKENDS = {
+    "powershell": PowerShellBackend,
+    "espeak": EspeakBackend,
+    "null": NullBackend,
+}
+
+
+def create_backend(name="auto", **voice_settings):
+    """สร้าง backend ตามชื่อ ("auto" = powershell บน Windows, espeak ถ้ามี, ไม่งั้น null)"""
+    if name == "auto":
+        if sys.platform == "win32":
+            name = "powershell"
+        elif shutil.which("espeak-ng") or shutil.which("espeak"):
+            name = "espeak"
+        else:
+            name = "null"
+    if name not in BACKENDS:
+        raise ValueError(f"TTS backend ไม่ถูกต้อง: {name} (รองรับ: auto, {', '.join(BACKENDS)})")
+    return BACKENDS[name](**voice_settings)
+
+
+def play_wav(path):
+    """เล่นไฟล์ .wav จนจบ (winsound บน Windows, aplay/paplay/afplay บนระบบอื่น)"""
+    if sys.platform == "win32":
+        import winsound
+
+        winsound.PlaySound(str(path), winsound.SND_FILENAME)
+        return
+    for player in ("aplay", "paplay", "afplay"):
+        executable = shutil.which(player)
+        if executable:
+            args = [executable, "-q", str(path)] if player == "aplay" else [executable, str(path)]
+            subprocess.run(args, check=False, capture_output=True)
+            return
+    print(f"[VOICE] ไม่พบโปรแกรมเล่นเสียง: {path}")
+
+
+class GuidanceAudioCache:
+    """
+    cache ไฟล์เสียงบนดิสก์ key = hash ของ (ข้อความ + backend + การตั้งค่าเสียง)
+    """
+
+    def __init__(self, backend, cache_dir=DEFAULT_CACHE_DIR):
+        self.backend = backend
+        self.cache_dir = Path(cache_dir)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        payload = json.dumps({"text": text, **self.backend.voice_settings()}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, text):
+        return self.cache_dir / f"{self.key(text)}.wav"
+
+    def get(self, text):
+        """คืน path ของไฟล์เสียงสำหรับข้อความนี้ (สังเคราะห์ใหม่ถ้ายังไม่มีใน cache)"""
+        path = self.path_for(text)
+        if path.exists():
+            self.hits += 1
+            return path
+        with self._lock:
+            if path.exists():
+                self.hits += 1
+                return path
+            self.misses += 1
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.stem}.tmp{os.getpid()}.wav")
+            try:
+                self.backend.synthesize(text, tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+        return path
+
+    def prewarm(self, texts):
+        """สังเคราะห์ทุกข้อความล่วงหน้า คืนจำนวนข้อความที่สังเคราะห์ใหม่"""
+        start = time.perf_counter()
+        created = 0
+        for text in dict.fromkeys(texts):
+            misses_before = self.misses
+            try:
+                self.get(text)
+            except Exception as ex:
+                print(f"[VOICE] สังเคราะห์เสียงไม่สำเร็จ: '{text[:40]}...' ({ex})")
+                continue
+            created += self.misses - misses_before
+        elapsed = time.perf_counter() - start
+        print(f"[VOICE] เตรียมไฟล์เสียง {len(set(texts))} ข้อความ (สร้างใหม่ {created}) ใน {elapsed:.1f} วินาที -> {self.cache_dir}")
+        return created
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pre-synthesize guidance audio into the TTS cache")
+    parser.add_argument("--backend", default="auto", choices=["auto", *BACKENDS], help="TTS backend")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory for cached .wav files")
+    parser.add_argument("--play", metavar="CLASS_ID", type=int, help="Play the cached message for a class id")
+    return parser.parse_args()
+
+
+def main():
+    from voice_guidance import DEFAULT_MESSAGE, FRIENDLY_MESSAGE_MAP, TTS_VOICE_SETTINGS, get_guidance_text
+
+    args = parse_args()
+    backend = create_backend(args.backend, **TTS_VOICE_SETTINGS)
+    cache = GuidanceAudioCache(backend, args.cache_dir)
+    try:
+        cache.prewarm([*FRIENDLY_MESSAGE_MAP.values(), DEFAULT_MESSAGE])
+        if args.play is not None:
+            backend.play(cache.get(get_guidance_text(args.play)))
+    finally:
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,10 @@
 # ------------------------------------
 # ไฟล์: voice_guidance.py
 # ------------------------------------
-import os
-import time
 import threading
-import queue
-import subprocess
-import sys
+
+from speech_dispatcher import SpeechDispatcher
+from tts_backends import GuidanceAudioCache, create_backend
 
 # --- 1. ฐานข้อมูลคำแนะนำการทิ้งขยะแบบเป็นธรรมชาติ ---
 # Mapping ID -> ชื่อคลาส (ตามไฟล์ data.yaml)
@@ -71,97 +69,97 @@ def get_guidance_text(class_id: int) -> str:
         return DEFAULT_MESSAGE
     return FRIENDLY_MESSAGE_MAP.get(class_name, f"ตรวจพบ {class_name} กรุณาจัดการอย่างถูกถังครับ")
 
-# --- 2. ฟังก์ชันพูดด้วย PowerShell (ใช้ Windows SAPI) ---
-def _speak_with_powershell(text: str):
+# --- 2. ระบบเสียง: TTS backend + cache ไฟล์เสียงของข้อความแนะนำ ---
+# ข้อความมีจำนวนจำกัด จึงสังเคราะห์เป็นไฟล์ .wav ครั้งเดียวแล้วเล่นไฟล์เดิมทุกครั้งที่ประกาศ
+TTS_BACKEND = "auto"                 # auto / powershell / espeak / null (null = ไม่มีเสียงจริง ใช้ทดสอบ)
+TTS_CACHE_DIR = "artifacts/tts_cache"
+TTS_VOICE_SETTINGS = {"rate": 0, "volume": 100, "voice": None}
+
+tts_backend = None
+audio_cache = None
+_tts_lock = threading.Lock()
+
+def _init_tts():
+    """สร้าง backend และ cache ครั้งแรกที่ใช้งาน"""
+    global tts_backend, audio_cache
+    with _tts_lock:
+        if audio_cache is None:
+            tts_backend = create_backend(TTS_BACKEND, **TTS_VOICE_SETTINGS)
+            audio_cache = GuidanceAudioCache(tts_backend, TTS_CACHE_DIR)
+            print(f"[VOICE] ใช้ TTS backend: {tts_backend.name} (cache: {TTS_CACHE_DIR})")
+    return audio_cache
+
+def prepare_guidance_audio():
+    """สังเคราะห์ข้อความแนะนำทั้งหมดล่วงหน้า (ข้อความที่อยู่ใน cache แล้วจะถูกข้าม)"""
+    cache = _init_tts()
+    cache.prewarm([*FRIENDLY_MESSAGE_MAP.values(), DEFAULT_MESSAGE])
+
+def _speak(text: str) -> bool:
     """
-    พูดด้วย PowerShell โดยใช้ Windows SAPI
-    วิธีนี้หลีกเลี่ยงปัญหา thread safety และ run loop ของ pyttsx3
+    เล่นเสียงของข้อความจาก cache (สังเคราะห์ก่อนถ้ายังไม่มี) จนจบ
     """
     try:
-        # Escape ข้อความสำหรับ PowerShell (ใช้ single quote เพื่อหลีกเลี่ยงปัญหา escape)
-        # แทนที่ single quote ด้วย double single quote
-        escaped_text = text.replace("'", "''")
-        
-        # สร้าง PowerShell command
-        ps_command = f'''
-Add-Type -AssemblyName System.Speech
-$speak = New-Object System.Speech.Synthesis.SpeechSynthesizer
-$speak.Rate = 0
-$speak.Volume = 100
-$speak.Speak('{escaped_text}')
-'''
-        
-        # รัน PowerShell command
-        result = subprocess.run(
-            ['powershell', '-Command', ps_command],
-            capture_output=True,
-            text=True,
-            timeout=15,
-            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-        )
-        
-        if result.returncode != 0:
-            print(f"[VOICE][powershell] error (code {result.returncode}): {result.stderr}")
-            return False
+        cache = _init_tts()
+        tts_backend.play(cache.get(text))
         return True
-    except subprocess.TimeoutExpired:
-        print(f"[VOICE][powershell] timeout เกิน 15 วินาที")
-        return False
     except Exception as ex:
-        print(f"[VOICE][powershell] error: {ex}")
+        print(f"[VOICE] error: {ex}")
         import traceback
         traceback.print_exc()
         return False
 
 
-# --- 3. Queue และ Worker Thread สำหรับการพูด ---
-speech_queue = queue.Queue()
+# --- 3. คิวข้อความ (event-driven) และ Worker Thread สำหรับการพูด ---
+# ขยะอันตรายถูกพูดก่อน, ข้อความที่รอนานเกิน TTL ถูกทิ้ง, คลาสเดิมที่ยังรออยู่ถูกรวมเป็นข้อความเดียว
+# หมายเหตุ: การหน่วงเวลาก่อนพูดคลาสเดิมซ้ำ (cooldown) มีที่เดียวคือ ANNOUNCE_COOLDOWN_SECONDS ใน app.py
+SPEECH_TTL_SECONDS = 8               # ข้อความที่รอในคิวนานกว่านี้จะไม่ถูกพูด
+HAZARDOUS_PRIORITY = 0               # priority ต่ำ = พูดก่อน
+DEFAULT_PRIORITY = 1
+
+speech_queue = SpeechDispatcher(ttl_seconds=SPEECH_TTL_SECONDS)
 speech_worker_running = False
 speech_worker_thread = None
 
+def is_hazardous(class_id) -> bool:
+    """battery, chemical_* และ light_bulb ถือเป็นขยะอันตราย"""
+    class_name = CLASS_NAME_MAP.get(class_id, "")
+    return class_name in ("battery", "light_bulb") or class_name.startswith("chemical_")
+
 def _speech_worker():
     """
-    Worker thread ที่รอรับข้อความจาก queue และพูดทีละข้อความ
-    ใช้ PowerShell แทน pyttsx3 เพื่อหลีกเลี่ยงปัญหา thread safety
+    Worker thread ที่รอรับข้อความจาก speech_queue และพูดทีละข้อความ
+    ตอนเริ่มจะเตรียมไฟล์เสียงของทุกข้อความไว้ก่อน การประกาศแต่ละครั้งจึงแค่เล่นไฟล์
     """
     global speech_worker_running
     
     try:
         print("[VOICE][worker] กำลังเริ่มต้น worker thread...")
+        prepare_guidance_audio()
         print("[VOICE][worker] Worker thread เริ่มทำงาน - กำลังรอรับข้อความ...")
         
         while speech_worker_running:
+            # หลับจนมีข้อความใหม่ (ไม่มีการ poll) - None = ถูกสั่งหยุด
+            item = speech_queue.get()
+            if item is None:
+                print("[VOICE][worker] ได้รับสัญญาณหยุด")
+                break
+            class_id, text = item
+            
             try:
-                # รอรับข้อความจาก queue (timeout 1 วินาที)
-                text = speech_queue.get(timeout=1)
-                if text is None:  # Signal to stop
-                    print("[VOICE][worker] ได้รับสัญญาณหยุด")
-                    break
-                
-                queue_size_before = speech_queue.qsize()
-                print(f"[VOICE][worker] ได้รับข้อความ: '{text[:50]}...' (queue size: {queue_size_before})")
+                print(f"[VOICE][worker] ได้รับข้อความ: (คลาส {class_id}) '{text[:50]}...' (queue size: {speech_queue.qsize()})")
                 
-                # พูดด้วย PowerShell (จะพูดจนเสร็จแม้ไม่มี detection ต่อ)
-                print(f"[VOICE][worker] กำลังพูดด้วย PowerShell...")
-                success = _speak_with_powershell(text)
+                # เล่นไฟล์เสียงจาก cache (จะพูดจนเสร็จแม้ไม่มี detection ต่อ)
+                print(f"[VOICE][worker] กำลังพูด...")
+                success = _speak(text)
                 
                 if success:
                     print(f"[VOICE][worker] เสร็จสิ้น (queue size ตอนนี้: {speech_queue.qsize()})")
                 else:
                     print(f"[VOICE][worker] WARNING: การพูดล้มเหลว")
-                
-                speech_queue.task_done()
-            except queue.Empty:
-                # Timeout - วนลูปต่อ (ไม่พิมพ์ log เพื่อลด noise)
-                continue
             except Exception as ex:
                 print(f"[VOICE][worker] error ระหว่างการพูด: {ex}")
                 import traceback
                 traceback.print_exc()
-                try:
-                    speech_queue.task_done()
-                except:
-                    pass
     except Exception as ex:
         print(f"[VOICE][worker] initialization error: {ex}")
         import traceback
@@ -170,88 +168,54 @@ def _speech_worker():
         print("[VOICE][worker] Worker thread หยุดทำงาน")
         speech_worker_running = False
 
-def _start_speech_worker():
-    """เริ่ม worker thread สำหรับการพูด"""
+def start_speech_worker():
+    """
+    เริ่ม worker thread สำหรับการพูด (เรียกครั้งเดียวตอนเริ่มโปรแกรม ไม่เริ่มเองตอน import)
+    worker เตรียมไฟล์เสียงใน thread ของตัวเอง จึงคืนทันทีโดยไม่ต้องรอ
+    """
     global speech_worker_running, speech_worker_thread
     
-    if not speech_worker_running:
-        print("[VOICE] กำลังเริ่ม worker thread...")
-        speech_worker_running = True
-        speech_worker_thread = threading.Thread(target=_speech_worker, daemon=True)
-        speech_worker_thread.start()
-        print("[VOICE] Speech worker thread เริ่มทำงาน")
-        
-        # ตรวจสอบว่า thread ทำงานจริงหรือไม่ (รอ 0.5 วินาที)
-        time.sleep(0.5)
-        if not speech_worker_thread.is_alive():
-            print("[VOICE] WARNING: Worker thread ไม่ทำงาน! กำลังลองเริ่มใหม่...")
-            speech_worker_running = False
-            speech_worker_thread = threading.Thread(target=_speech_worker, daemon=True)
-            speech_worker_thread.start()
-            time.sleep(0.5)
-            if speech_worker_thread.is_alive():
-                print("[VOICE] Worker thread เริ่มทำงานสำเร็จ")
-            else:
-                print("[VOICE] ERROR: Worker thread ยังไม่ทำงาน!")
-        else:
-            print("[VOICE] Worker thread ทำงานปกติ")
+    if speech_worker_running and speech_worker_thread is not None and speech_worker_thread.is_alive():
+        return speech_worker_thread
+    print("[VOICE] กำลังเริ่ม worker thread...")
+    # เปิดคิวใหม่ถ้าเคยถูกปิดโดย stop_speech_worker()
+    speech_queue.reopen()
+    speech_worker_running = True
+    speech_worker_thread = threading.Thread(target=_speech_worker, name="speech-worker", daemon=True)
+    speech_worker_thread.start()
+    return speech_worker_thread
 
-# เริ่ม worker thread ทันทีเมื่อ import module
-_start_speech_worker()
-
-# --- 4. ฟังก์ชันพูด (พร้อม Debounce) ---
-last_spoken_time = 0
-last_spoken_class = -1
-DEBOUNCE_TIME_SECONDS = 3 # หน่วงเวลา 3 วินาที ก่อนพูดซ้ำ
+def stop_speech_worker(timeout=2.0):
+    """หยุด worker หลังพูดข้อความปัจจุบันจบ"""
+    global speech_worker_running
+    speech_worker_running = False
+    speech_queue.close()
+    if speech_worker_thread is not None:
+        speech_worker_thread.join(timeout)
 
+# --- 4. ฟังก์ชันพูด ---
 def speak_guidance(class_id):
     """
-    พูดคำแนะนำสำหรับ class_id ที่ระบุ
-    พร้อมระบบ Debounce 3 วินาทีสำหรับคลาสเดิม
+    ส่งคำแนะนำสำหรับ class_id เข้าคิวเสียง (ไม่ block เรียกจาก thread ตรวจจับได้โดยตรง)
     
     พฤติกรรม:
-    - ถ้ามีขยะใหม่ (คลาสใหม่) → พูดทันที (เข้า queue)
-    - ถ้ากำลังพูดอยู่ → queue จะพูดต่อกันไปตามลำดับ
-    - ถ้าเป็นคลาสเดิม → รอ Debounce (3 วินาที)
-    """
-    global last_spoken_time, last_spoken_class
-
-    current_time = time.time()
-    
-    # ตรวจสอบว่า (ไม่ใช่คลาสเดิม) หรือ (เป็นคลาสเดิม แต่พูดไปนานแล้ว)
-    if (class_id != last_spoken_class) or \
-       (current_time - last_spoken_time > DEBOUNCE_TIME_SECONDS):
-        
-        # 1. หาคำแนะนำจาก ID
-        text_to_speak = get_guidance_text(class_id)
-        
-        queue_size_before = speech_queue.qsize()
-        print(f"[VOICE] กำลังส่งข้อความเข้า queue: (คลาส {class_id}) '{text_to_speak[:50]}...' (queue size: {queue_size_before})")
-        
-        # 2. ส่งข้อความเข้า queue เพื่อให้ worker thread พูด
-        # หมายเหตุ: ถ้ากำลังพูดอยู่ ข้อความใหม่จะเข้า queue และพูดต่อกันไปตามลำดับ
-        _queue_speech(text_to_speak)
-        
-        # 3. อัปเดตเวลาและคลาสล่าสุด
-        last_spoken_time = current_time
-        last_spoken_class = class_id
-    else:
-        # ยังไม่ผ่าน Debounce - ไม่พูดซ้ำ
-        time_since_last = current_time - last_spoken_time
-        print(f"[VOICE] ข้ามการพูด (คลาส {class_id} เดียวกัน, ผ่านไป {time_since_last:.1f} วินาที, ต้องรอ {DEBOUNCE_TIME_SECONDS} วินาที)")
-
-
-def _queue_speech(text: str):
-    """
-    ส่งข้อความเข้า queue เพื่อให้ worker thread พูดด้วย PowerShell
+    - ขยะอันตราย (battery, chemical_*, light_bulb) → แทรกคิวไปพูดก่อน
+    - ถ้ากำลังพูดอยู่ → ข้อความรอในคิว แต่จะถูกทิ้งถ้ารอนานเกิน SPEECH_TTL_SECONDS
+    - ถ้าคลาสเดิมยังรออยู่ในคิว → รวมเป็นข้อความเดียว ไม่พูดซ้ำ
+    การตัดสินใจว่าควรประกาศหรือไม่ (streak/cooldown) ทำใน app.py ก่อนเรียกฟังก์ชันนี้
     """
+    text_to_speak = get_guidance_text(class_id)
+    priority = HAZARDOUS_PRIORITY if is_hazardous(class_id) else DEFAULT_PRIORITY
     try:
-        # ตรวจสอบว่า worker thread ทำงานอยู่หรือไม่
+        # เริ่ม worker ให้ถ้ายังไม่มีใครเริ่ม (เช่น เรียกจากสคริปต์ที่ไม่ได้ผ่าน app.start_services)
         if not speech_worker_running:
-            _start_speech_worker()
+            start_speech_worker()
         
-        # ส่งข้อความเข้า queue
-        speech_queue.put(text)
-        print(f"[VOICE] ส่งข้อความเข้า queue: '{text}'")
+        if speech_queue.put(class_id, text_to_speak, priority):
+            print(f"[VOICE] ส่งข้อความเข้า queue: (คลาส {class_id}, priority {priority}) '{text_to_speak[:50]}...' (queue size: {speech_queue.qsize()})")
+        elif speech_queue.closed:
+            print(f"[VOICE] WARNING: คิวเสียงถูกปิดแล้ว ทิ้งข้อความ (คลาส {class_id})")
+        else:
+            print(f"[VOICE] รวมกับข้อความที่รออยู่แล้ว (คลาส {class_id})")
     except Exception as ex:
-        print(f"[VOICE] error: {ex}")
\ No newline at end of file
+        print(f"[VOICE] error: {ex}")